@@ -0,0 +1,158 @@
+from typing import Dict, Iterable, List, Optional
+
+from booking_index import MINUTES_PER_DAY
+
+# The only surgery fields the utilization report reads
+ANALYTICS_FIELDS = [
+    "surgery_date", "surgery_time", "duration_minutes", "ot_id", "doctor_id",
+    "status", "is_emergency", "start_epoch_min",
+]
+
+
+def empty_summary() -> dict:
+    return {"ots": {}, "surgeries": 0, "emergencies": 0, "minutes": 0, "emergency_minutes": 0, "surgeons": {}}
+
+
+def day_summaries(records: List[dict], day_start: int, day_end: int, ot_ids: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+    """Per-day totals for the utilization report, keyed by surgery_date.
+
+    Each day's summary holds, per OT, the booked minutes inside operating
+    hours and the idle gaps between bookings, plus emergency and per-surgeon
+    totals. Only bookings in ot_ids count (every OT when None), so all of
+    the totals cover the same OTs. Days are independent, so summaries of
+    past days can be cached and combined with freshly computed ones.
+    """
+    # Imported here: pandas is the slowest import in the backend and only
+    # the analytics endpoint needs it
+    import numpy as np
+    import pandas as pd
+
+    frame = pd.DataFrame.from_records(records, columns=ANALYTICS_FIELDS)
+    frame = frame[frame["status"] != "cancelled"]
+    if ot_ids is not None:
+        frame = frame[frame["ot_id"].astype(str).isin(list(ot_ids))]
+    if frame.empty:
+        return {}
+    duration = frame["duration_minutes"].to_numpy(dtype=np.int64)
+    emergency = frame["is_emergency"].fillna(False).to_numpy(dtype=bool)
+
+    # Minutes since midnight: from start_epoch_min where stored, else parsed
+    start = pd.to_numeric(frame["start_epoch_min"], errors="coerce").to_numpy(dtype=np.float64, copy=True)
+    missing = np.isnan(start)
+    if missing.any():
+        clock = frame.loc[missing, "surgery_time"].str.split(":", expand=True).astype(np.int64)
+        start[missing] = clock[0].to_numpy() * 60 + clock[1].to_numpy()
+    start = np.where(missing, start, start % MINUTES_PER_DAY).astype(np.int64)
+    end = start + duration
+
+    # Sweep each (day, OT) in start order. The running maximum of earlier
+    # ends says how much of a booking is new busy time and how long the OT
+    # sat idle before it, which also copes with overlapping bookings
+    sweep = pd.DataFrame({
+        "date": frame["surgery_date"].to_numpy(),
+        "ot": frame["ot_id"].astype(str).to_numpy(),
+        "start": np.clip(start, day_start, day_end),
+        "end": np.clip(end, day_start, day_end),
+    }).sort_values(["date", "ot", "start"], kind="stable")
+    groups = sweep.groupby(["date", "ot"], sort=False)
+    reach = groups["end"].cummax()
+    previous = reach.groupby([sweep["date"], sweep["ot"]], sort=False).shift(1).fillna(day_start).to_numpy(dtype=np.int64)
+    sweep["booked"] = np.clip(sweep["end"].to_numpy() - np.maximum(sweep["start"].to_numpy(), previous), 0, None)
+    sweep["gap"] = np.clip(sweep["start"].to_numpy() - previous, 0, None)
+    sweep["has_gap"] = sweep["gap"] > 0
+    per_ot = groups.agg(
+        booked=("booked", "sum"),
+        gaps=("gap", "sum"),
+        gap_count=("has_gap", "sum"),
+        largest_gap=("gap", "max"),
+        last_end=("end", "max"),
+    )
+    trailing = day_end - per_ot["last_end"].to_numpy()
+    per_ot["gaps"] += trailing
+    per_ot["gap_count"] += trailing > 0
+    per_ot["largest_gap"] = np.maximum(per_ot["largest_gap"].to_numpy(), trailing)
+
+    per_day = pd.DataFrame({
+        "date": frame["surgery_date"].to_numpy(),
+        "minutes": duration,
+        "emergency": emergency,
+        "emergency_minutes": np.where(emergency, duration, 0),
+    }).groupby("date").agg(
+        surgeries=("minutes", "size"),
+        emergencies=("emergency", "sum"),
+        minutes=("minutes", "sum"),
+        emergency_minutes=("emergency_minutes", "sum"),
+    )
+    per_surgeon = pd.DataFrame({
+        "date": frame["surgery_date"].to_numpy(),
+        "doctor": frame["doctor_id"].fillna("").astype(str).to_numpy(),
+        "minutes": duration,
+    }).groupby(["date", "doctor"]).agg(minutes=("minutes", "sum"), surgeries=("minutes", "size"))
+
+    # Unpack into plain dicts of ints (cacheable, JSON-friendly)
+    summaries = {}
+    totals = per_day[["surgeries", "emergencies", "minutes", "emergency_minutes"]].to_numpy().tolist()
+    for date, values in zip(per_day.index.tolist(), totals):
+        summary = empty_summary()
+        summary.update(zip(("surgeries", "emergencies", "minutes", "emergency_minutes"), values))
+        summaries[date] = summary
+    ot_values = per_ot[["booked", "gaps", "gap_count", "largest_gap"]].to_numpy(dtype=np.int64).tolist()
+    for (date, ot), values in zip(per_ot.index.tolist(), ot_values):
+        summaries[date]["ots"][ot] = values
+    surgeon_values = per_surgeon[["minutes", "surgeries"]].to_numpy(dtype=np.int64).tolist()
+    for (date, doctor), values in zip(per_surgeon.index.tolist(), surgeon_values):
+        summaries[date]["surgeons"][doctor] = values
+    return summaries
+
+
+def utilization_report(summaries: Dict[str, dict], ot_ids: Iterable[str], day_start: int, day_end: int) -> dict:
+    """Combine per-day summaries into OT utilization, idle time, emergency
+    share and surgeon hours over the whole range"""
+    import numpy as np
+
+    ot_ids = list(ot_ids)
+    hours = day_end - day_start
+    # An OT with no bookings on a day was idle the whole day: one long gap
+    ots = {ot: np.zeros(4, dtype=np.int64) for ot in ot_ids}
+    totals = np.zeros(4, dtype=np.int64)
+    surgeons = {}
+    for summary in summaries.values():
+        totals += [summary["surgeries"], summary["emergencies"], summary["minutes"], summary["emergency_minutes"]]
+        for ot in ot_ids:
+            booked, gaps, gap_count, largest = summary["ots"].get(ot, (0, hours, 1 if hours else 0, hours))
+            ots[ot] += [booked, gaps, gap_count, 0]
+            ots[ot][3] = max(ots[ot][3], largest)
+        for doctor, (minutes, count) in summary["surgeons"].items():
+            surgeon = surgeons.setdefault(doctor, [0, 0])
+            surgeon[0] += minutes
+            surgeon[1] += count
+
+    available = hours * len(summaries)
+    booked_total = sum(int(values[0]) for values in ots.values())
+    surgeries, emergencies, minutes, emergency_minutes = (int(value) for value in totals)
+    return {
+        "days": len(summaries),
+        "ots": {
+            ot: {
+                "booked_minutes": int(booked),
+                "available_minutes": available,
+                "utilization_pct": round(100 * booked / available, 2) if available else 0.0,
+                "idle_minutes": int(gaps),
+                "idle_gaps": int(gap_count),
+                "largest_idle_gap_minutes": int(largest),
+            }
+            for ot, (booked, gaps, gap_count, largest) in ots.items()
+        },
+        "utilization_pct": round(100 * booked_total / (available * len(ot_ids)), 2) if available and ot_ids else 0.0,
+        "surgeries": surgeries,
+        "emergency_surgeries": emergencies,
+        "emergency_share_pct": round(100 * emergencies / surgeries, 2) if surgeries else 0.0,
+        "emergency_minutes_share_pct": round(100 * emergency_minutes / minutes, 2) if minutes else 0.0,
+        "surgeons": sorted(
+            (
+                {"doctor_id": doctor, "hours": round(minutes / 60, 2), "surgeries": count}
+                for doctor, (minutes, count) in surgeons.items()
+            ),
+            key=lambda surgeon: -surgeon["hours"],
+        ),
+    }
@@ -0,0 +1,182 @@
+import asyncio
+import fcntl
+import glob
+import json
+import os
+from contextlib import contextmanager
+from typing import Awaitable, Callable, List
+
+_STOP = object()
+
+
+class AuditLogWriter:
+    """Buffers audit log entries and writes them in the background.
+
+    Request handlers call ``submit`` and return immediately. A background task
+    flushes the queue through ``write`` once ``batch_size`` entries are waiting
+    or ``flush_interval`` seconds have passed. If a flush fails (or the queue
+    is full) the entries are appended to ``spill_path`` as JSON lines and
+    replayed on the next successful flush, so no entry is lost while the
+    datastore is down. Several worker processes may share one spill file:
+    appends and claims take a file lock, and each process replays what it
+    claimed from a file of its own.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[List[dict]], Awaitable[None]],
+        spill_path: str,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+    ):
+        self.write = write
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+        self.written = 0
+        self.spilled = 0
+        self.failed_flushes = 0
+
+    def submit(self, entry: dict):
+        """Queue an entry without waiting for the datastore"""
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self._spill([entry])
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued and stop the background task"""
+        if self._task is not None:
+            await self._queue.put(_STOP)
+            await self._task
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "spilled": self.spilled,
+            "failed_flushes": self.failed_flushes,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        # Entries left over from a previous run
+        await self._replay_spill()
+        stopping = False
+        while not stopping:
+            entry = await self._queue.get()
+            if entry is _STOP:
+                break
+            batch = [entry]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            await self._flush(batch)
+        # Drain whatever was submitted before shutdown
+        remaining = []
+        while not self._queue.empty():
+            entry = self._queue.get_nowait()
+            if entry is not _STOP:
+                remaining.append(entry)
+        for offset in range(0, len(remaining), self.batch_size):
+            await self._flush(remaining[offset:offset + self.batch_size])
+
+    async def _flush(self, batch: List[dict]):
+        try:
+            await self.write(batch)
+        except Exception as e:
+            print(f"Audit log flush failed, spilling {len(batch)} entries: {e}")
+            self.failed_flushes += 1
+            self._spill(batch)
+            return
+        self.written += len(batch)
+        if os.path.exists(self.spill_path):
+            await self._replay_spill()
+
+    @staticmethod
+    def _read(path: str) -> List[dict]:
+        with open(path, encoding="utf-8") as spill:
+            return [json.loads(line) for line in spill if line.strip()]
+
+    @contextmanager
+    def _locked(self):
+        with open(self.spill_path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _orphaned_replays(self) -> List[str]:
+        """Replay files whose process is gone (interrupted replays)"""
+        orphaned = []
+        for path in glob.glob(glob.escape(self.spill_path) + ".replaying*"):
+            if path.endswith(".tmp"):
+                continue
+            suffix = path.rsplit(".replaying", 1)[1].lstrip(".")
+            if suffix.isdigit() and int(suffix) != os.getpid():
+                try:
+                    os.kill(int(suffix), 0)
+                    continue
+                except ProcessLookupError:
+                    pass
+                except PermissionError:
+                    continue
+            orphaned.append(path)
+        return orphaned
+
+    def _spill(self, entries: List[dict]):
+        with self._locked(), open(self.spill_path, "a", encoding="utf-8") as spill:
+            for entry in entries:
+                spill.write(json.dumps(entry) + "\n")
+        self.spilled += len(entries)
+
+    async def _replay_spill(self):
+        # Collect everything into this process's .replaying file before the
+        # first await, so entries spilled while the replay runs start a
+        # fresh spill file
+        replaying = f"{self.spill_path}.replaying.{os.getpid()}"
+        entries = []
+        with self._locked():
+            claimed = self._orphaned_replays()
+            if os.path.exists(self.spill_path):
+                claimed.append(self.spill_path)
+            for path in claimed:
+                entries += self._read(path)
+            if entries:
+                with open(replaying + ".tmp", "w", encoding="utf-8") as spill:
+                    spill.writelines(json.dumps(entry) + "\n" for entry in entries)
+                os.replace(replaying + ".tmp", replaying)
+            for path in claimed:
+                if path != replaying:
+                    os.remove(path)
+        if not entries:
+            return
+        for offset in range(0, len(entries), self.batch_size):
+            batch = entries[offset:offset + self.batch_size]
+            try:
+                await self.write(batch)
+            except Exception as e:
+                print(f"Audit log replay failed: {e}")
+                self._spill(entries[offset:])
+                break
+            self.written += len(batch)
+        os.remove(replaying)
@@ -0,0 +1,52 @@
+from typing import Iterable, List, Tuple
+
+Interval = Tuple[int, int]
+
+
+def minutes_to_time(minutes: int) -> str:
+    """Format minutes since midnight as "HH:MM", wrapping past midnight"""
+    minutes %= 24 * 60
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Merge overlapping or touching (start, end) intervals into a sorted list"""
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_intervals(busy: List[Interval], day_start: int, day_end: int) -> List[Interval]:
+    """Gaps between merged busy intervals inside operating hours"""
+    free = []
+    cursor = day_start
+    for start, end in busy:
+        if end <= cursor:
+            continue
+        if start >= day_end:
+            break
+        if start > cursor:
+            free.append((cursor, start))
+        cursor = max(cursor, end)
+    if cursor < day_end:
+        free.append((cursor, day_end))
+    return free
+
+
+def available_slots(free: List[Interval], day_start: int, slot_minutes: int, step_minutes: int) -> List[Interval]:
+    """Slots of ``slot_minutes`` starting on the ``step_minutes`` grid (anchored
+    at ``day_start``) that fit entirely inside a free interval"""
+    slots = []
+    for start, end in free:
+        # First grid point at or after the gap's start
+        offset = (start - day_start) % step_minutes
+        slot_start = start if offset == 0 else start + step_minutes - offset
+        while slot_start + slot_minutes <= end:
+            slots.append((slot_start, slot_start + slot_minutes))
+            slot_start += step_minutes
+    return slots
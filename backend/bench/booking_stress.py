@@ -0,0 +1,120 @@
+"""Concurrent booking stress test for a running backend.
+
+Fires many parallel POST /api/surgeries requests that compete for a small
+set of OTs, surgeons and time slots on one day, then reads the day back and
+checks that no two active surgeries overlap on any shared resource:
+
+    python bench/booking_stress.py --url http://localhost:8001 \
+        --requests 2000 --concurrency 64 --date 2030-01-01
+
+Exits non-zero if an overlap is found or a booking failed with 5xx.
+"""
+import argparse
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def minutes(value):
+    hours, mins = value.split(":")
+    return int(hours) * 60 + int(mins)
+
+
+def resources(surgery):
+    found = {("ot", surgery["ot_id"]), ("doctor", surgery["doctor_id"]), ("anesthesiologist", surgery["anesthesiologist"])}
+    found.update(("nurse", nurse) for nurse in surgery.get("nurses") or [])
+    return found
+
+
+def find_overlaps(surgeries):
+    """(resource, first_id, second_id) for every overlapping pair"""
+    by_resource = defaultdict(list)
+    for surgery in surgeries:
+        if surgery.get("status") == "cancelled":
+            continue
+        start = minutes(surgery["surgery_time"])
+        for resource in resources(surgery):
+            by_resource[resource].append((start, start + surgery["duration_minutes"], surgery["id"]))
+    overlaps = []
+    for resource, intervals in by_resource.items():
+        intervals.sort()
+        for (_, end, first), (start, _, second) in zip(intervals, intervals[1:]):
+            if start < end:
+                overlaps.append((resource, first, second))
+    return overlaps
+
+
+def read_day(session, url, date):
+    surgeries, cursor = [], None
+    while True:
+        params = {"date": date, "limit": 1000}
+        if cursor:
+            params["cursor"] = cursor
+        page = session.get(url + "/api/surgeries", params=params).json()
+        surgeries += page["items"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            return surgeries
+
+
+def run(url, total, concurrency, date, ots, doctors, seed=0, token="bench"):
+    rng = random.Random(seed)
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {token}"
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    # Half-hour grid, one- or two-hour cases: plenty of partial overlaps
+    payloads = [
+        {
+            "patient_id": f"stress-patient-{i}",
+            "doctor_id": f"stress-doctor-{rng.randrange(doctors)}",
+            "surgery_date": date,
+            "surgery_time": f"{rng.randrange(8, 19):02d}:{rng.choice([0, 30]):02d}",
+            "ot_id": str(rng.randrange(1, ots + 1)),
+            "anesthesiologist": f"stress-anesthesiologist-{rng.randrange(doctors)}",
+            "anesthesia_type": "general",
+            "duration_minutes": rng.choice([60, 90, 120]),
+        }
+        for i in range(total)
+    ]
+
+    def book(payload):
+        return session.post(url + "/api/surgeries", json=payload).status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        statuses = Counter(pool.map(book, payloads))
+    elapsed = time.perf_counter() - started
+
+    surgeries = [s for s in read_day(session, url, date) if s.get("patient_id", "").startswith("stress-patient-")]
+    active = [s for s in surgeries if s.get("status") != "cancelled"]
+    overlaps = find_overlaps(active)
+
+    print(f"{total} bookings, concurrency {concurrency}, {total / elapsed:.1f} req/s")
+    print("status codes: " + ", ".join(f"{code}={count}" for code, count in sorted(statuses.items())))
+    print(f"stored: {len(active)} active surgeries (accepted {statuses.get(200, 0)})")
+    print(f"overlaps: {len(overlaps)}")
+    for resource, first, second in overlaps[:10]:
+        print(f"  {resource[0]} {resource[1]}: {first} / {second}")
+    server_errors = sum(count for code, count in statuses.items() if code >= 500)
+    return not overlaps and not server_errors and len(active) == statuses.get(200, 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--date", default="2030-01-01", help="use a day with no real bookings")
+    parser.add_argument("--ots", type=int, default=5)
+    parser.add_argument("--doctors", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    ok = run(args.url, args.requests, args.concurrency, args.date, args.ots, args.doctors, args.seed)
+    sys.exit(0 if ok else 1)
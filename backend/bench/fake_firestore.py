@@ -0,0 +1,399 @@
+"""In-memory stand-in for the parts of the Firestore client the backend uses.
+
+Enough of the API to run FirestoreRepository, and through it server:app,
+without credentials or network: collections and documents, where /
+order_by / start_after / limit / select queries, get_all, write batches
+and transactions (which work with the real ``firestore.transactional``).
+Like Firestore, a commit holding more than 500 writes is rejected.
+Snapshot listeners are not implemented.
+
+Equality filters are answered from per-field indexes built on first use,
+so a query costs roughly what an indexed Firestore query would instead of
+a collection scan. ``latency`` adds a fixed delay to every RPC as a stand
+in for the network round trip.
+"""
+import itertools
+import threading
+import time
+import uuid
+from collections import defaultdict
+from functools import cmp_to_key
+
+from google.api_core.exceptions import Aborted, InvalidArgument, NotFound
+
+# How long a transaction waits for another one's document lock
+LOCK_TIMEOUT_SECONDS = 10
+# Firestore's cap on writes per batch or transaction commit
+MAX_WRITES_PER_COMMIT = 500
+
+_COMPARE = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+    "array_contains_any": lambda a, b: isinstance(a, list) and any(value in a for value in b),
+}
+
+_MISSING = object()
+
+# Ordering or cursor field that stands for the document id
+DOCUMENT_ID = "__name__"
+
+
+def _clone(value):
+    """Copy a document the way a round trip through the wire would"""
+    if isinstance(value, dict):
+        return {key: _clone(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_clone(item) for item in value]
+    return value
+
+
+def _matches(data, field, op, value):
+    current = data.get(field, _MISSING)
+    if current is _MISSING:
+        return False
+    try:
+        return _COMPARE[op](current, value)
+    except TypeError:
+        # Firestore never matches across types
+        return False
+
+
+def _hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def _index_add(index, value, doc_id):
+    index[value].add(doc_id)
+
+
+def _index_discard(index, value, doc_id):
+    ids = index.get(value)
+    if ids is not None:
+        ids.discard(doc_id)
+        if not ids:
+            del index[value]
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return self._data
+
+    def get(self, field):
+        return self._data.get(field) if self._data else None
+
+
+class DocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self.collection = collection
+        self.id = doc_id
+
+    @property
+    def _key(self):
+        return (self.collection, self.id)
+
+    def get(self, transaction=None):
+        self._client._rpc()
+        if transaction is not None:
+            transaction._lock(self._key)
+        return DocumentSnapshot(self, self._client._read(self.collection, self.id))
+
+    def set(self, data, merge=False):
+        self._client._rpc()
+        self._client._commit([("set", self, data, merge)])
+
+    def update(self, data):
+        self._client._rpc()
+        self._client._commit([("update", self, data, False)])
+
+    def delete(self):
+        self._client._rpc()
+        self._client._commit([("delete", self, None, False)])
+
+
+class Query:
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    def __init__(self, client, collection, filters=(), orders=(), limit=None, start_after=None, fields=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = dict(
+            filters=self._filters, orders=self._orders, limit=self._limit,
+            start_after=self._start_after, fields=self._fields,
+        )
+        state.update(changes)
+        return Query(self._client, self._collection, **state)
+
+    def where(self, field, op, value):
+        if op not in _COMPARE:
+            raise ValueError(f"Unsupported operator: {op}")
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, values):
+        return self._copy(start_after=values.to_dict() if isinstance(values, DocumentSnapshot) else dict(values))
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction))
+
+    def stream(self, transaction=None):
+        self._client._rpc()
+        rows = self._client._query(self._collection, self._filters)
+        # Firestore leaves out documents missing an ordered field, and
+        # orders by document id last
+        rows = [
+            (doc_id, data) for doc_id, data in rows
+            if all(field == DOCUMENT_ID or field in data for field, _ in self._orders)
+        ]
+        rows.sort(key=cmp_to_key(self._compare))
+        if self._start_after is not None:
+            cursor = tuple(self._start_after.get(field) for field, _ in self._orders)
+            rows = [row for row in rows if self._after(row, cursor)]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        for doc_id, data in rows:
+            if self._fields is not None:
+                data = {field: data[field] for field in self._fields if field in data}
+            yield DocumentSnapshot(DocumentReference(self._client, self._collection, doc_id), _clone(data))
+
+    def _compare_values(self, first, second, direction):
+        try:
+            result = (first > second) - (first < second)
+        except TypeError:
+            result = (type(first).__name__ > type(second).__name__) - (type(first).__name__ < type(second).__name__)
+        return -result if direction == self.DESCENDING else result
+
+    @staticmethod
+    def _field(row, field):
+        return row[0] if field == DOCUMENT_ID else row[1][field]
+
+    def _compare(self, first, second):
+        for field, direction in self._orders:
+            result = self._compare_values(self._field(first, field), self._field(second, field), direction)
+            if result:
+                return result
+        return (first[0] > second[0]) - (first[0] < second[0])
+
+    def _after(self, row, cursor):
+        for (field, direction), value in zip(self._orders, cursor):
+            result = self._compare_values(self._field(row, field), value, direction)
+            if result:
+                return result > 0
+        return False
+
+
+class CollectionReference(Query):
+    def __init__(self, client, collection):
+        super().__init__(client, collection)
+
+    def document(self, doc_id=None):
+        return DocumentReference(self._client, self._collection, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data):
+        reference = self.document()
+        reference.set(data)
+        return time.time(), reference
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append(("set", reference, data, merge))
+
+    def update(self, reference, data):
+        self._writes.append(("update", reference, data, False))
+
+    def delete(self, reference):
+        self._writes.append(("delete", reference, None, False))
+
+    def commit(self):
+        self._client._rpc()
+        writes, self._writes = self._writes, []
+        if len(writes) > MAX_WRITES_PER_COMMIT:
+            raise InvalidArgument(f"maximum {MAX_WRITES_PER_COMMIT} writes allowed per request")
+        self._client._commit(writes)
+
+
+class Transaction(WriteBatch):
+    """Pessimistic like server-side Firestore: documents read inside the
+    transaction stay locked until it commits or rolls back"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, client, max_attempts=5):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = False
+        self._id = None
+        self._held = []
+
+    def _lock(self, key):
+        if key in self._held:
+            return
+        if not self._client._document_lock(key).acquire(timeout=LOCK_TIMEOUT_SECONDS):
+            raise Aborted(f"Lock wait timeout on {key[0]}/{key[1]}")
+        self._held.append(key)
+
+    def _release(self):
+        for key in reversed(self._held):
+            self._client._document_lock(key).release()
+        self._held = []
+
+    def _clean_up(self):
+        self._writes = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._client._rpc()
+        self._id = next(self._ids)
+
+    def _commit(self):
+        try:
+            self.commit()
+        finally:
+            self._release()
+            self._clean_up()
+
+    def _rollback(self):
+        self._release()
+        self._clean_up()
+
+
+class FakeFirestore:
+    """Thread-safe in-memory Firestore client"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._docs = defaultdict(dict)
+        # (collection, field) -> {value: {doc_id, ...}} for equality filters
+        self._indexes = {}
+        self._lock = threading.RLock()
+        self._document_locks = {}
+
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self, max_attempts=5, read_only=False):
+        return Transaction(self, max_attempts)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        self._rpc()
+        for reference in references:
+            yield DocumentSnapshot(reference, self._read(reference.collection, reference.id))
+
+    def _rpc(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _document_lock(self, key):
+        with self._lock:
+            return self._document_locks.setdefault(key, threading.Lock())
+
+    def _read(self, collection, doc_id):
+        with self._lock:
+            data = self._docs[collection].get(doc_id)
+            return _clone(data) if data is not None else None
+
+    def _index(self, collection, field):
+        index = self._indexes.get((collection, field))
+        if index is None:
+            index = self._indexes[(collection, field)] = defaultdict(set)
+            for doc_id, data in self._docs[collection].items():
+                value = data.get(field, _MISSING)
+                if value is not _MISSING and _hashable(value):
+                    index[value].add(doc_id)
+        return index
+
+    def _query(self, collection, filters):
+        with self._lock:
+            docs = self._docs[collection]
+            candidates = None
+            for field, op, value in filters:
+                if op == "==" and _hashable(value):
+                    candidates = self._index(collection, field).get(value, ())
+                    break
+                if op == "in" and all(_hashable(item) for item in value):
+                    index = self._index(collection, field)
+                    candidates = set().union(*(index.get(item, ()) for item in value))
+                    break
+            ids = docs.keys() if candidates is None else candidates
+            return [
+                (doc_id, docs[doc_id]) for doc_id in ids
+                if all(_matches(docs[doc_id], field, op, value) for field, op, value in filters)
+            ]
+
+    def _commit(self, writes):
+        """Apply writes atomically: all of them or, on a missing document, none"""
+        with self._lock:
+            pending = {}
+            for op, reference, data, merge in writes:
+                key = (reference.collection, reference.id)
+                current = pending[key] if key in pending else self._docs[key[0]].get(key[1])
+                if op == "update" and current is None:
+                    raise NotFound(f"No document to update: {key[0]}/{key[1]}")
+                if op == "delete":
+                    pending[key] = None
+                elif op == "update" or merge:
+                    pending[key] = dict(current or {}, **_clone(data))
+                else:
+                    pending[key] = _clone(data)
+            for (collection, doc_id), data in pending.items():
+                self._store(collection, doc_id, data)
+
+    def _store(self, collection, doc_id, data):
+        docs = self._docs[collection]
+        previous = docs.pop(doc_id, None)
+        for (indexed, field), index in self._indexes.items():
+            if indexed != collection:
+                continue
+            for document, change in ((previous, _index_discard), (data, _index_add)):
+                if document is None:
+                    continue
+                value = document.get(field, _MISSING)
+                if value is not _MISSING and _hashable(value):
+                    change(index, value, doc_id)
+        if data is not None:
+            docs[doc_id] = data
+
@@ -0,0 +1,70 @@
+"""Concurrent HTTP load test for a running backend.
+
+Fires requests from a pool of worker threads against one or more API paths
+and reports throughput and p50/p95/p99 latency per path:
+
+    python bench/loadtest.py --url http://localhost:8001 \
+        --path /api/health --path /api/surgeries --concurrency 32 --requests 2000
+"""
+import argparse
+import statistics
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a sorted list"""
+    if not samples:
+        return 0.0
+    rank = max(0, min(len(samples) - 1, int(round(pct / 100 * len(samples))) - 1))
+    return samples[rank]
+
+
+def run(url, paths, concurrency, total, token="bench"):
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {token}"
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    def hit(i):
+        path = paths[i % len(paths)]
+        started = time.perf_counter()
+        response = session.get(url + path)
+        return path, response.status_code, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(hit, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    for path, status, ms in results:
+        latencies[path].append(ms)
+        if status >= 400:
+            errors[path] += 1
+
+    print(f"{total} requests, concurrency {concurrency}, {total / elapsed:.1f} req/s")
+    print(f"{'path':<40} {'n':>6} {'err':>5} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for path, samples in latencies.items():
+        samples.sort()
+        print(
+            f"{path:<40} {len(samples):>6} {errors[path]:>5} "
+            f"{statistics.mean(samples):>8.1f} {percentile(samples, 50):>8.1f} "
+            f"{percentile(samples, 95):>8.1f} {percentile(samples, 99):>8.1f}"
+        )
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--path", action="append", dest="paths")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.url, args.paths or ["/api/health", "/api/surgeries"], args.concurrency, args.requests)
@@ -0,0 +1,187 @@
+"""Worker scaling benchmark: throughput of start.sh with 1..N workers.
+
+Seeds a SQLite database file, then for each worker count boots the API
+through start.sh (so with more than one worker the local invalidation
+broker runs too) and drives it over real HTTP from several load generator
+processes, once with listing calls and once with bookings:
+
+    python bench/scaling.py --workers 1,2,4,8
+    python bench/scaling.py --workers 1,4 --scenario list --requests 20000
+
+Reports throughput and latency per (scenario, workers) and the speedup
+over the first worker count. Throughput can only grow while there are
+idle cores; on SQLite, bookings also share one database writer.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date as date_type, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from workload import build_calls, generate_dataset, seed, summarize  # noqa: E402
+
+SCENARIOS = {"list": {"list": 1}, "book": {"book": 1}}
+
+
+def wait_ready(url, timeout=60):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url + "/api/health/ready", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not become ready")
+
+
+def generate_load(url, calls, concurrency, barrier, results):
+    """One load generator process: its own event loop and connection pool"""
+    import httpx
+
+    async def run():
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=url, limits=limits, headers={"Authorization": "Bearer bench"}, timeout=60) as client:
+            samples = []
+
+            async def call(kind, method, path, params, body):
+                started = time.perf_counter()
+                response = await client.request(method, path, params=params, json=body)
+                samples.append((kind, response.status_code, (time.perf_counter() - started) * 1000))
+
+            # Open the connections before the clock starts
+            await asyncio.gather(*(client.get("/api/health/live") for _ in range(concurrency)))
+            await asyncio.get_running_loop().run_in_executor(None, barrier.wait)
+            queue = iter(calls)
+
+            async def worker():
+                for entry in queue:
+                    await call(*entry)
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            return samples
+
+    results.put(asyncio.run(run()))
+
+
+def measure(url, calls, clients, concurrency):
+    barrier = multiprocessing.Barrier(clients + 1)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=generate_load, args=(url, calls[i::clients], concurrency, barrier, results))
+        for i in range(clients)
+    ]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    started = time.perf_counter()
+    samples = []
+    for _ in processes:
+        samples.extend(results.get())
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    return summarize(samples, elapsed)
+
+
+def start_server(workers, port, database, workdir):
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        WEB_CONCURRENCY=str(workers),
+        STORAGE_BACKEND="sqlite",
+        SQLITE_PATH=database,
+        AUDIT_LOG_SPILL_PATH=os.path.join(workdir, "audit_log_spill.jsonl"),
+        INVALIDATION_SOCKET=os.path.join(workdir, f"invalidation-{port}.sock"),
+    )
+    env.pop("INVALIDATION_URL", None)
+    log = open(os.path.join(workdir, f"server-{workers}.log"), "w")
+    return subprocess.Popen(["bash", "start.sh"], cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def main(args):
+    from storage import SqliteRepository
+
+    worker_counts = [int(count) for count in args.workers.split(",")]
+    ot_ids = [str(ot) for ot in range(1, args.ots + 1)]
+    os.environ["OT_IDS"] = ",".join(ot_ids)
+    workdir = tempfile.mkdtemp(prefix="scaling-")
+    database = os.path.join(workdir, "bench.db")
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    doctors, patients, surgeries, last_day = generate_dataset(
+        rng, args.doctors, args.patients, args.surgeries, ot_ids, date_type.fromisoformat(args.first_day)
+    )
+    seed(SqliteRepository(database), {"doctors": doctors, "patients": patients, "surgeries": surgeries})
+    print(f"Seeded {len(surgeries)} surgeries into {database} in {time.perf_counter() - started:.1f}s; {os.cpu_count()} CPUs")
+
+    days = [(last_day - timedelta(days=offset)).isoformat() for offset in range(args.days)]
+    report = {"cpus": os.cpu_count(), "runs": []}
+    for scenario in args.scenario or list(SCENARIOS):
+        baseline = None
+        for workers in worker_counts:
+            # Same seed for every worker count, so each run replays the same calls
+            calls = build_calls(random.Random(args.seed + 1), args.requests, SCENARIOS[scenario], doctors, ot_ids, days)
+            # Bookings change the schedule, so every run starts from a copy of the seeded database
+            run_database = os.path.join(workdir, f"{scenario}-{workers}.db")
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(database + suffix):
+                    shutil.copyfile(database + suffix, run_database + suffix)
+            server = start_server(workers, args.port, run_database, workdir)
+            try:
+                wait_ready(f"http://127.0.0.1:{args.port}")
+                result = measure(f"http://127.0.0.1:{args.port}", calls, args.clients, args.concurrency)
+            finally:
+                stop_server(server)
+            baseline = baseline or result["throughput"]
+            row = result["calls"][scenario]
+            report["runs"].append({"scenario": scenario, "workers": workers, **result})
+            print(
+                f"{scenario:<5} workers={workers:<3} {result['throughput']:>8.1f} req/s  x{result['throughput'] / baseline:.2f}  "
+                f"p50 {row['p50_ms']:.1f}ms  p95 {row['p95_ms']:.1f}ms  statuses {row['statuses']}"
+            )
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="default: all")
+    parser.add_argument("--doctors", type=int, default=500)
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--surgeries", type=int, default=50000)
+    parser.add_argument("--ots", type=int, default=20)
+    parser.add_argument("--first-day", default="2030-01-01")
+    parser.add_argument("--days", type=int, default=30, help="how many of the last scheduled days calls target")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="connections per load generator")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the report to this file")
+    main(parser.parse_args())
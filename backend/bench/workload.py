@@ -0,0 +1,295 @@
+"""Workload benchmark: boots server:app in-process against a seeded datastore.
+
+Generates a realistic dataset (doctors, patients and a multi-year OT
+schedule), then replays a fixed, seeded mix of list, conflict-check,
+available-slots and booking calls through the ASGI app and reports
+throughput and p50/p95/p99 latency per call type:
+
+    python bench/workload.py                                  # in-memory Firestore fake
+    python bench/workload.py --backend fake --latency-ms 5    # ... with a simulated RTT
+    python bench/workload.py --backend sqlite
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python bench/workload.py --backend emulator
+
+Use --json to save a run and --baseline to compare against one; the exit
+status is non-zero when any call type's p95 regresses by more than
+--max-regression.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import date as date_type, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from loadtest import percentile  # noqa: E402
+
+DEFAULT_MIX = {"list": 40, "check_conflict": 25, "available_slots": 25, "book": 10}
+DURATIONS = [45, 60, 90, 120, 150, 180, 240]
+SPECIALIZATIONS = [
+    ("Cardiothoracic Surgery", "Cardiology"), ("Orthopedics", "Orthopedics"), ("Neurosurgery", "Neurology"),
+    ("General Surgery", "Surgery"), ("Urology", "Urology"), ("ENT", "ENT"), ("Ophthalmology", "Ophthalmology"),
+    ("Plastic Surgery", "Surgery"), ("Vascular Surgery", "Cardiology"), ("Pediatric Surgery", "Pediatrics"),
+]
+FIRST_NAMES = ["Aarav", "Maya", "John", "Priya", "Chen", "Fatima", "Lucas", "Amara", "Noah", "Sofia", "Ravi", "Elena"]
+LAST_NAMES = ["Menon", "Smith", "Nair", "Garcia", "Wang", "Okafor", "Kumar", "Rossi", "Ahmed", "Novak", "Iyer", "Brown"]
+
+
+def person_name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def generate_dataset(rng, doctors, patients, surgeries, ot_ids, first_day):
+    """Doctors, patients and surgeries packed into OT days from first_day on.
+
+    Each OT day runs from 08:00 with random case lengths and turnover gaps
+    until 20:00, so the schedule is dense like a real one. About 3% of
+    cases are cancelled and 5% are emergencies.
+    """
+    from booking_index import stamp_epoch_fields
+
+    doctor_docs = []
+    for i in range(doctors):
+        specialization, department = rng.choice(SPECIALIZATIONS)
+        doctor_docs.append({
+            "id": f"doctor-{i:05d}", "name": f"Dr. {person_name(rng)}", "specialization": specialization,
+            "email": f"doctor{i}@hospital.test", "phone": f"555-{i:07d}", "department": department,
+        })
+    patient_docs = [
+        {
+            "id": f"patient-{i:06d}", "name": person_name(rng), "age": rng.randrange(1, 95),
+            "gender": rng.choice(["female", "male"]), "medical_record_number": f"MRN{i:08d}",
+            "phone": f"555-{i:07d}", "emergency_contact": person_name(rng),
+        }
+        for i in range(patients)
+    ]
+    anesthesiologists = max(1, doctors // 10)
+    nurses = max(2, doctors // 4)
+
+    surgery_docs = []
+    day = first_day
+    while len(surgery_docs) < surgeries:
+        for ot_id in ot_ids:
+            start = 8 * 60 + rng.choice([0, 0, 15, 30])
+            while len(surgery_docs) < surgeries:
+                duration = rng.choice(DURATIONS)
+                if start + duration > 20 * 60:
+                    break
+                surgery_docs.append(stamp_epoch_fields({
+                    "id": f"surgery-{len(surgery_docs):07d}",
+                    "patient_id": rng.choice(patient_docs)["id"],
+                    "doctor_id": rng.choice(doctor_docs)["id"],
+                    "surgery_date": day.isoformat(),
+                    "surgery_time": f"{start // 60:02d}:{start % 60:02d}",
+                    "ot_id": ot_id,
+                    "anesthesiologist": f"anesthesiologist-{rng.randrange(anesthesiologists)}",
+                    "anesthesia_type": rng.choice(["general", "regional", "local"]),
+                    "nurses": [f"nurse-{rng.randrange(nurses)}" for _ in range(2)],
+                    "status": "cancelled" if rng.random() < 0.03 else "scheduled",
+                    "is_emergency": rng.random() < 0.05,
+                    "duration_minutes": duration,
+                    "created_by": "bench",
+                }))
+                start += duration + rng.choice([15, 30, 45, 60])
+        day += timedelta(days=1)
+    return doctor_docs, patient_docs, surgery_docs, day - timedelta(days=1)
+
+
+def seed(store, collections, chunk=500):
+    for collection, docs in collections.items():
+        for offset in range(0, len(docs), chunk):
+            store.write_batch([("set", collection, doc["id"], doc) for doc in docs[offset:offset + chunk]])
+
+
+def build_calls(rng, count, mix, doctors, ot_ids, days):
+    """Seeded (kind, method, path, params, body) list for the whole run"""
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    calls = []
+    for i in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        day = rng.choice(days)
+        ot_id = rng.choice(ot_ids)
+        start = rng.randrange(16, 40) * 30
+        slot = {
+            "surgery_date": day, "surgery_time": f"{start // 60:02d}:{start % 60:02d}", "ot_id": ot_id,
+            "duration_minutes": rng.choice(DURATIONS), "doctor_id": rng.choice(doctors)["id"],
+            "anesthesiologist": f"anesthesiologist-{rng.randrange(max(1, len(doctors) // 10))}",
+        }
+        if kind == "list":
+            calls.append((kind, "GET", "/api/surgeries", {"date": day, "limit": 50}, None))
+        elif kind == "check_conflict":
+            calls.append((kind, "POST", "/api/surgeries/check-conflict", None, slot))
+        elif kind == "available_slots":
+            calls.append((kind, "GET", f"/api/ots/{ot_id}/available-slots", {"date": day}, None))
+        else:
+            booking = dict(slot, patient_id=f"bench-patient-{i}", anesthesia_type="general")
+            calls.append((kind, "POST", "/api/surgeries", None, booking))
+    return calls
+
+
+async def replay(app, calls, concurrency, warmup):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers={"Authorization": "Bearer bench"}) as client:
+        async def call(kind, method, path, params, body):
+            started = time.perf_counter()
+            response = await client.request(method, path, params=params, json=body)
+            return kind, response.status_code, (time.perf_counter() - started) * 1000
+
+        for entry in calls[:warmup]:
+            await call(*entry)
+
+        queue = iter(calls[warmup:])
+
+        async def worker():
+            for entry in queue:
+                results.append(await call(*entry))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return results, elapsed
+
+
+def summarize(results, elapsed):
+    latencies = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    for kind, status, ms in results:
+        latencies[kind].append(ms)
+        statuses[kind][status] += 1
+    report = {"requests": len(results), "seconds": round(elapsed, 3), "throughput": round(len(results) / elapsed, 1), "calls": {}}
+    for kind, samples in sorted(latencies.items()):
+        samples.sort()
+        report["calls"][kind] = {
+            "n": len(samples),
+            "statuses": dict(sorted(statuses[kind].items())),
+            "mean_ms": round(statistics.mean(samples), 2),
+            "p50_ms": round(percentile(samples, 50), 2),
+            "p95_ms": round(percentile(samples, 95), 2),
+            "p99_ms": round(percentile(samples, 99), 2),
+        }
+    return report
+
+
+def print_report(report):
+    print(f"{report['requests']} requests in {report['seconds']}s, {report['throughput']} req/s")
+    print(f"{'call':<16} {'n':>6} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}  statuses")
+    for kind, row in report["calls"].items():
+        codes = " ".join(f"{code}={count}" for code, count in row["statuses"].items())
+        print(
+            f"{kind:<16} {row['n']:>6} {row['mean_ms']:>8.2f} {row['p50_ms']:>8.2f} "
+            f"{row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f}  {codes}"
+        )
+
+
+def regressions(report, baseline, max_regression):
+    found = []
+    for kind, row in report["calls"].items():
+        previous = baseline.get("calls", {}).get(kind)
+        if previous and row["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+            found.append(f"{kind}: p95 {previous['p95_ms']}ms -> {row['p95_ms']}ms")
+    return found
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown call type {kind!r}, expected one of {', '.join(DEFAULT_MIX)}")
+        mix[kind] = float(weight)
+    return mix
+
+
+def main(args):
+    ot_ids = [str(ot) for ot in range(1, args.ots + 1)]
+    os.environ["OT_IDS"] = ",".join(ot_ids)
+    if args.backend == "sqlite":
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        os.environ.setdefault("SQLITE_PATH", ":memory:")
+    import server
+    from metrics import InstrumentedRepository
+    from storage import FirestoreRepository
+
+    if args.backend == "fake":
+        from fake_firestore import FakeFirestore
+
+        server.repo = InstrumentedRepository(
+            FirestoreRepository(FakeFirestore(latency=args.latency_ms / 1000)),
+            "firestore", server.DATASTORE_LATENCY, server.DATASTORE_ERRORS,
+        )
+    elif args.backend == "emulator":
+        from google.cloud import firestore as cloud_firestore
+
+        if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+            sys.exit("Set FIRESTORE_EMULATOR_HOST to the emulator's host:port")
+        server.repo = InstrumentedRepository(
+            FirestoreRepository(cloud_firestore.Client(project=os.environ.get("GOOGLE_CLOUD_PROJECT", "bench"))),
+            "firestore", server.DATASTORE_LATENCY, server.DATASTORE_ERRORS,
+        )
+    else:
+        server.repo = server.connect_datastore()
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    doctors, patients, surgeries, last_day = generate_dataset(
+        rng, args.doctors, args.patients, args.surgeries, ot_ids, date_type.fromisoformat(args.first_day)
+    )
+    seed(server.repo, {"doctors": doctors, "patients": patients, "surgeries": surgeries})
+    print(
+        f"Seeded {len(doctors)} doctors, {len(patients)} patients and {len(surgeries)} surgeries "
+        f"({args.first_day} to {last_day}) in {time.perf_counter() - started:.1f}s"
+    )
+
+    # Calls target the last --days of the schedule, like planners looking ahead
+    days = [(last_day - timedelta(days=offset)).isoformat() for offset in range(args.days)]
+    calls = build_calls(rng, args.warmup + args.requests, args.mix, doctors, ot_ids, days)
+
+    async def run():
+        async with server.app.router.lifespan_context(server.app):
+            return await replay(server.app, calls, args.concurrency, args.warmup)
+
+    results, elapsed = asyncio.run(run())
+    report = summarize(results, elapsed)
+    report["config"] = {key: value for key, value in vars(args).items() if key not in ("json", "baseline")}
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(report, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            found = regressions(report, json.load(baseline), args.max_regression)
+        for line in found:
+            print(f"REGRESSION {line}")
+        return not found
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["fake", "sqlite", "emulator"], default="fake")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated RTT per call (fake backend)")
+    parser.add_argument("--doctors", type=int, default=2000)
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--surgeries", type=int, default=100000)
+    parser.add_argument("--ots", type=int, default=20)
+    parser.add_argument("--first-day", default="2030-01-01")
+    parser.add_argument("--days", type=int, default=30, help="how many of the last scheduled days calls target")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. list=40,check_conflict=25,available_slots=25,book=10")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="report from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 increase, as a fraction")
+    sys.exit(0 if main(parser.parse_args()) else 1)
@@ -0,0 +1,201 @@
+from bisect import bisect_left, insort
+from datetime import date as date_type
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# A resource is (kind, id): ("ot", "3"), ("doctor", doctor_id), ...
+Resource = Tuple[str, str]
+
+MINUTES_PER_DAY = 24 * 60
+EPOCH_ORDINAL = date_type(1970, 1, 1).toordinal()
+
+
+def time_to_minutes(value: str) -> int:
+    """Convert an "HH:MM" string to minutes since midnight"""
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def epoch_minutes(surgery_date: str, surgery_time: str) -> int:
+    """Minutes since 1970-01-01 00:00 for a "YYYY-MM-DD" date and "HH:MM" time"""
+    day = date_type.fromisoformat(surgery_date).toordinal() - EPOCH_ORDINAL
+    return day * MINUTES_PER_DAY + time_to_minutes(surgery_time)
+
+
+def stamp_epoch_fields(surgery_data: dict) -> dict:
+    """Store the numeric start/end (``start_epoch_min``/``end_epoch_min``)
+    derived from the date, time and duration, so readers never parse strings"""
+    start = epoch_minutes(surgery_data['surgery_date'], surgery_data['surgery_time'])
+    surgery_data['start_epoch_min'] = start
+    surgery_data['end_epoch_min'] = start + surgery_data['duration_minutes']
+    return surgery_data
+
+
+def surgery_span(surgery_data: dict) -> Tuple[int, int]:
+    """(start, end) in epoch minutes, from the stored fields when present"""
+    start = surgery_data.get('start_epoch_min')
+    end = surgery_data.get('end_epoch_min')
+    if start is None or end is None:
+        # Not backfilled yet, or an unsaved request body
+        start = epoch_minutes(surgery_data['surgery_date'], surgery_data['surgery_time'])
+        end = start + surgery_data['duration_minutes']
+    return start, end
+
+
+def surgery_resources(surgery_data: dict) -> List[Resource]:
+    """Everything a surgery occupies: its OT, surgeon, anesthesiologist and nurses"""
+    resources = []
+    if surgery_data.get('ot_id'):
+        resources.append(("ot", surgery_data['ot_id']))
+    if surgery_data.get('doctor_id'):
+        resources.append(("doctor", surgery_data['doctor_id']))
+    if surgery_data.get('anesthesiologist'):
+        resources.append(("anesthesiologist", surgery_data['anesthesiologist']))
+    for nurse in surgery_data.get('nurses') or []:
+        if nurse:
+            resources.append(("nurse", nurse))
+    return list(dict.fromkeys(resources))
+
+
+class IntervalIndex:
+    """Sorted booking intervals (in epoch minutes) for a single resource on a single day.
+
+    Intervals are kept ordered by start minute, and the longest duration seen
+    bounds how far back a query has to look, so an overlap probe is a bisect
+    plus a scan over the few bookings that can actually reach the window.
+    """
+
+    def __init__(self):
+        self._intervals: List[Tuple[int, int, str]] = []
+        self._max_duration = 0
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def add(self, start: int, end: int, surgery_id: str):
+        insort(self._intervals, (start, end, surgery_id))
+        self._max_duration = max(self._max_duration, end - start)
+
+    def remove(self, surgery_id: str):
+        self._intervals = [iv for iv in self._intervals if iv[2] != surgery_id]
+
+    def overlapping(self, start: int, end: int, exclude_id: Optional[str] = None) -> List[str]:
+        lo = bisect_left(self._intervals, (start - self._max_duration,))
+        hi = bisect_left(self._intervals, (end,))
+        return [
+            surgery_id
+            for iv_start, iv_end, surgery_id in self._intervals[lo:hi]
+            if iv_end > start and surgery_id != exclude_id
+        ]
+
+
+class BookingIndex:
+    """In-process index of active bookings per (resource, surgery_date).
+
+    A whole day is read from the datastore on first use, and every resource
+    booked that day (OT, surgeon, anesthesiologist, nurses) gets its own
+    interval index, so a multi-resource conflict check costs one read per day
+    rather than one per resource. The write endpoints keep loaded days current.
+    A day older than ``ttl_seconds`` is treated as a miss so writes made
+    outside this process are eventually picked up. Days can also carry the
+    datastore's version counter for that day, which lets guarded writers tell
+    exactly when the cached day is stale.
+    """
+
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self._buckets: Dict[Tuple[Resource, str], IntervalIndex] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._versions: Dict[str, int] = {}
+        self._locations: Dict[str, Tuple[str, List[Resource]]] = {}
+        self._lock = threading.Lock()
+
+    def is_loaded(self, date: str) -> bool:
+        loaded_at = self._loaded_at.get(date)
+        return loaded_at is not None and time.monotonic() - loaded_at < self.ttl_seconds
+
+    def is_current(self, date: str, version: int) -> bool:
+        """Loaded, fresh, and last seen at the given version"""
+        return self.is_loaded(date) and self._versions.get(date) == version
+
+    def set_version(self, date: str, version: int):
+        with self._lock:
+            if date in self._loaded_at:
+                self._versions[date] = version
+
+    def load(self, date: str, surgeries: Iterable[dict], version: Optional[int] = None):
+        """Replace a day with the given surgeries, skipping cancelled ones"""
+        rows = [s for s in surgeries if s.get('status') != 'cancelled' and s.get('id')]
+        with self._lock:
+            for surgery_id, (location, _) in list(self._locations.items()):
+                if location == date:
+                    del self._locations[surgery_id]
+            for key in [key for key in self._buckets if key[1] == date]:
+                del self._buckets[key]
+            for surgery in rows:
+                self._add_locked(surgery['id'], surgery)
+            self._loaded_at[date] = time.monotonic()
+            if version is None:
+                self._versions.pop(date, None)
+            else:
+                self._versions[date] = version
+
+    def conflicts(self, surgery_data: dict, exclude_id: Optional[str] = None) -> List[Tuple[Resource, str]]:
+        """(resource, surgery_id) pairs for every booking that overlaps"""
+        date = surgery_data['surgery_date']
+        start, end = surgery_span(surgery_data)
+        found = []
+        with self._lock:
+            for resource in surgery_resources(surgery_data):
+                bucket = self._buckets.get((resource, date))
+                if bucket is not None:
+                    found.extend((resource, surgery_id) for surgery_id in bucket.overlapping(start, end, exclude_id))
+        return found
+
+    def upsert(self, surgery_id: str, surgery_data: dict):
+        """Record a create or update; cancelled surgeries are dropped from the index"""
+        with self._lock:
+            self._remove_locked(surgery_id)
+            if surgery_data.get('status') == 'cancelled':
+                return
+            if surgery_data['surgery_date'] not in self._loaded_at:
+                # Not loaded yet; the next lookup will read it from the datastore
+                return
+            self._add_locked(surgery_id, surgery_data)
+
+    def remove(self, surgery_id: str):
+        with self._lock:
+            self._remove_locked(surgery_id)
+
+    def invalidate(self, dates: Iterable[str]):
+        """Forget days changed elsewhere; their next lookup reads them again"""
+        with self._lock:
+            for date in dates:
+                self._loaded_at.pop(date, None)
+                self._versions.pop(date, None)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._loaded_at.clear()
+            self._versions.clear()
+            self._locations.clear()
+
+    def _add_locked(self, surgery_id: str, surgery_data: dict):
+        date = surgery_data['surgery_date']
+        start, end = surgery_span(surgery_data)
+        resources = surgery_resources(surgery_data)
+        for resource in resources:
+            self._buckets.setdefault((resource, date), IntervalIndex()).add(start, end, surgery_id)
+        self._locations[surgery_id] = (date, resources)
+
+    def _remove_locked(self, surgery_id: str):
+        location = self._locations.pop(surgery_id, None)
+        if location is None:
+            return
+        date, resources = location
+        for resource in resources:
+            bucket = self._buckets.get((resource, date))
+            if bucket is not None:
+                bucket.remove(surgery_id)
@@ -0,0 +1,67 @@
+from typing import Dict, Iterable, List, Optional, Sequence
+
+# What the OT board shows for each booking
+SUMMARY_FIELDS = [
+    "id", "surgery_time", "duration_minutes", "start_epoch_min", "end_epoch_min",
+    "patient_id", "doctor_id", "anesthesiologist", "status", "is_emergency",
+]
+
+# A board is {ot_id: [summary, ...]} with each OT's bookings in start order
+Board = Dict[str, List[dict]]
+
+
+def booking_summary(surgery_data: dict) -> dict:
+    return {field: surgery_data.get(field) for field in SUMMARY_FIELDS}
+
+
+def _sort(entries: List[dict]):
+    entries.sort(key=lambda entry: (entry.get("surgery_time") or "", entry.get("id") or ""))
+
+
+def build_board(surgeries: Iterable[dict]) -> Board:
+    """Board for one day from its raw surgery documents"""
+    board: Board = {}
+    for surgery_data in surgeries:
+        board.setdefault(str(surgery_data.get("ot_id")), []).append(booking_summary(surgery_data))
+    for entries in board.values():
+        _sort(entries)
+    return board
+
+
+def _pop(boards: Dict[str, Board], surgery_id: str) -> Optional[tuple]:
+    """Remove a booking from whichever board holds it; returns (date, ot_id, summary)"""
+    for date, board in boards.items():
+        for ot_id, entries in board.items():
+            for position, entry in enumerate(entries):
+                if entry.get("id") == surgery_id:
+                    del entries[position]
+                    if not entries:
+                        del board[ot_id]
+                    return date, ot_id, entry
+    return None
+
+
+def apply_writes(boards: Dict[str, Board], writes: Sequence[tuple]):
+    """Update day boards in place for a list of repository writes.
+
+    Writes carrying a full surgery document replace the booking wherever it
+    was (it may have changed OT or day). Partial updates, such as a
+    cancellation, patch the existing summary in place.
+    """
+    for op, collection, doc_id, data in writes:
+        if collection != "surgeries":
+            continue
+        previous = _pop(boards, doc_id)
+        if "surgery_date" in data:
+            date, ot_id, summary = data["surgery_date"], str(data.get("ot_id")), booking_summary(data)
+            summary["id"] = doc_id
+        elif previous is not None:
+            date, ot_id, summary = previous
+            summary.update((field, data[field]) for field in SUMMARY_FIELDS if field in data)
+        else:
+            continue
+        board = boards.get(date)
+        if board is not None:
+            entries = board.setdefault(ot_id, [])
+            entries.append(summary)
+            _sort(entries)
@@ -0,0 +1,215 @@
+import gzip
+import hashlib
+import threading
+import time
+import uuid
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content types worth compressing; everything else (and server-sent events,
+# which must reach the client event by event) passes through untouched
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/csv", "text/plain")
+
+# Suffixes the compression middleware adds to the ETag of an encoded body
+ENCODING_SUFFIXES = ("-br", "-gzip")
+
+
+class VersionTable:
+    """Change markers for what read endpoints serve, bumped by the API's writes.
+
+    A response's ETag is derived from the markers of everything it read, so
+    checking If-None-Match costs a few dict lookups instead of a query.
+    Every write mixes a random token into the markers of the keys it
+    touched, and workers mix in the same token for writes announced by the
+    others, in any order, so all of them hand out the same tags. Markers
+    start over at each ttl_seconds boundary of the wall clock, which bounds
+    how long a write made by another process can go unnoticed and brings a
+    worker that missed a message back in step.
+    """
+
+    def __init__(self, ttl_seconds: float = 30.0):
+        self.ttl_seconds = ttl_seconds
+        self._versions: Dict[str, int] = {}
+        self._period = self._current_period()
+        # This process cannot know what was written earlier in the current
+        # period, so its tags are its own until the next boundary
+        self._local = uuid.uuid4().int
+        self._lock = threading.Lock()
+
+    def _current_period(self) -> int:
+        return int(time.time() // self.ttl_seconds)
+
+    def _roll_locked(self):
+        period = self._current_period()
+        if period != self._period:
+            self._period = period
+            self._versions.clear()
+            self._local = 0
+
+    def bump(self, keys: Iterable[str], token: Optional[str] = None) -> str:
+        """Record a write to keys. Pass the token another worker announced
+        for its write; without one a new token is made and returned"""
+        token = token or uuid.uuid4().hex
+        value = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "big")
+        with self._lock:
+            self._roll_locked()
+            for key in keys:
+                # XOR: the same set of writes gives the same marker in any order
+                self._versions[key] = self._versions.get(key, 0) ^ value
+        return token
+
+    def current(self, key: str) -> int:
+        with self._lock:
+            self._roll_locked()
+            return self._versions.get(key, 0)
+
+    def etag(self, keys: Iterable[str], variant: str) -> str:
+        """Strong ETag for a response built from keys; variant is whatever
+        else shapes the body (path and query string)"""
+        with self._lock:
+            self._roll_locked()
+            state = ",".join(f"{key}={self._versions.get(key, 0):x}" for key in keys)
+            prefix = f"{self._period}|{self._local:x}"
+        digest = hashlib.blake2b(f"{prefix}|{state}|{variant}".encode(), digest_size=12).hexdigest()
+        return f'"{digest}"'
+
+    def reset(self):
+        """Invalidate every tag handed out so far; tags are this process's
+        own until the next boundary"""
+        with self._lock:
+            self._local = uuid.uuid4().int
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"keys": len(self._versions), "shared": self._local == 0}
+
+
+def matching_etag(if_none_match: Optional[str], etag: str) -> Optional[str]:
+    """The tag from an If-None-Match header that names this representation,
+    compressed or not, or None"""
+    if not if_none_match:
+        return None
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return etag
+        # If-None-Match uses the weak comparison
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        unencoded = candidate
+        for suffix in ENCODING_SUFFIXES:
+            if candidate.endswith(suffix + '"'):
+                unencoded = candidate[:-len(suffix) - 1] + '"'
+        if unencoded == etag:
+            return candidate
+    return None
+
+
+def accepted_encodings(header: str) -> List[str]:
+    """Codings from an Accept-Encoding header that the client did not refuse with q=0"""
+    accepted = []
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.append(coding.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing large JSON, NDJSON and CSV responses.
+
+    Complete bodies get brotli when the client accepts it and the brotli
+    module is installed, gzip otherwise. Streamed bodies are gzipped with a
+    flush after every chunk so each page still reaches the client as soon
+    as it is ready. Encoded responses get the coding appended to their ETag,
+    keeping tags distinct per representation.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+        offered = accepted_encodings(accept)
+        coding = "br" if brotli is not None and "br" in offered else "gzip" if "gzip" in offered else None
+
+        start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                headers = dict(start["headers"])
+                content_type = headers.get(b"content-type", b"").decode("latin-1").split(";")[0].strip()
+                eligible = (
+                    content_type in COMPRESSIBLE_TYPES
+                    and b"content-encoding" not in headers
+                    and (more_body or len(body) >= self.minimum_size)
+                )
+                if eligible:
+                    stream_coding = "gzip" if more_body and coding is not None else coding
+                    start["headers"] = self._encoded_headers(start["headers"], stream_coding)
+                    if stream_coding == "br":
+                        body = brotli.compress(body, quality=self.brotli_quality)
+                    elif stream_coding == "gzip" and not more_body:
+                        body = gzip.compress(body, compresslevel=self.gzip_level)
+                    elif stream_coding == "gzip":
+                        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+                    if stream_coding is not None and not more_body:
+                        start["headers"].append((b"content-length", str(len(body)).encode()))
+                await send(start)
+                start = None
+            if compressor is not None:
+                body = compressor.compress(body) + compressor.flush(zlib.Z_FINISH if not more_body else zlib.Z_SYNC_FLUSH)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _encoded_headers(headers, coding: Optional[str]) -> list:
+        """Response headers once the body is sent with coding (None: as is)"""
+        encoded = []
+        vary = False
+        for name, value in headers:
+            if coding is not None and name == b"content-length":
+                continue
+            if coding is not None and name == b"etag" and value.endswith(b'"'):
+                value = value[:-1] + b"-" + coding.encode() + b'"'
+            if name == b"vary":
+                vary = True
+                if b"accept-encoding" not in value.lower():
+                    value += b", Accept-Encoding"
+            encoded.append((name, value))
+        if not vary:
+            encoded.append((b"vary", b"Accept-Encoding"))
+        if coding is not None:
+            encoded.append((b"content-encoding", coding.encode()))
+        return encoded
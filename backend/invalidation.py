@@ -0,0 +1,302 @@
+"""Cross-worker cache invalidation over Redis-style pub/sub.
+
+Each API worker keeps its own caches (directory lookups, search indexes,
+booking index, ETag versions). When one worker writes, it publishes a small
+JSON message and every other worker drops or patches what the write made
+stale. The client speaks just enough of the Redis protocol (RESP) for
+PUBLISH and SUBSCRIBE, so it works against a real Redis as well as the
+broker in this module, which start.sh runs on a Unix socket when there is
+no Redis:
+
+    python invalidation.py --socket /tmp/operation-invalidation.sock
+    python invalidation.py --port 6390
+"""
+import argparse
+import asyncio
+import json
+import os
+import uuid
+from typing import Callable, Dict, Optional, Set
+from urllib.parse import urlsplit
+
+DEFAULT_CHANNEL = "operation-cache-invalidation"
+RECONNECT_MIN_SECONDS = 0.2
+RECONNECT_MAX_SECONDS = 5.0
+# A subscriber this far behind is disconnected; it resets its caches on reconnect
+MAX_SUBSCRIBER_BUFFER = 4 * 1024 * 1024
+
+
+class ReplyError(Exception):
+    """Error reply from the server"""
+
+
+def encode_command(*parts) -> bytes:
+    frame = [b"*%d\r\n" % len(parts)]
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode()
+        frame.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(frame)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    """Read one RESP value: str, int, bytes, None or a list of those"""
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        raise ReplyError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind == b"*":
+        count = int(rest)
+        if count < 0:
+            return None
+        return [await read_reply(reader) for _ in range(count)]
+    raise ConnectionError(f"Unexpected reply: {line[:40]!r}")
+
+
+async def open_connection(url: str):
+    """Connect to redis://[:password@]host[:port] or unix:///path/to/socket"""
+    parsed = urlsplit(url)
+    if parsed.scheme == "unix":
+        reader, writer = await asyncio.open_unix_connection(parsed.path)
+    elif parsed.scheme == "redis":
+        reader, writer = await asyncio.open_connection(parsed.hostname or "localhost", parsed.port or 6379)
+    else:
+        raise ValueError(f"Unsupported invalidation URL: {url}")
+    if parsed.password:
+        credentials = [parsed.username, parsed.password] if parsed.username else [parsed.password]
+        writer.write(encode_command("AUTH", *credentials))
+        await read_reply(reader)
+    return reader, writer
+
+
+class InvalidationBus:
+    """Publishes this worker's invalidation messages and applies everyone else's.
+
+    ``publish`` never waits: messages are queued and sent in batches by a
+    background task. Received messages from other workers go to ``apply``.
+    Pub/sub does not keep messages for a disconnected subscriber, so after
+    the subscription drops and comes back ``on_reset`` is called to clear
+    whatever may have gone stale meanwhile.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        apply: Callable[[dict], None],
+        on_reset: Callable[[], None],
+        channel: str = DEFAULT_CHANNEL,
+        max_queue: int = 10000,
+    ):
+        self.url = url
+        self.apply = apply
+        self.on_reset = on_reset
+        self.channel = channel
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.connected = False
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self.resets = 0
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._missed = False
+        self._tasks = []
+
+    def publish(self, message: dict):
+        try:
+            self._outbox.put_nowait(dict(message, origin=self.worker_id))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._send())]
+
+    async def stop(self, timeout: float = 1.0):
+        """Give queued messages a moment to go out, then disconnect"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._outbox.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "queued": self._outbox.qsize(),
+            "published": self.published,
+            "received": self.received,
+            "dropped": self.dropped,
+            "resets": self.resets,
+        }
+
+    async def _listen(self):
+        delay = RECONNECT_MIN_SECONDS
+        while True:
+            try:
+                reader, writer = await open_connection(self.url)
+                try:
+                    writer.write(encode_command("SUBSCRIBE", self.channel))
+                    await writer.drain()
+                    await read_reply(reader)
+                    self.connected = True
+                    delay = RECONNECT_MIN_SECONDS
+                    if self._missed:
+                        # Only after subscribing, so nothing published from here on is lost
+                        self.resets += 1
+                        self.on_reset()
+                        self._missed = False
+                    while True:
+                        reply = await read_reply(reader)
+                        if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                            self._receive(reply[2])
+                finally:
+                    self.connected = False
+                    writer.close()
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, ReplyError, ValueError) as e:
+                print(f"Invalidation bus disconnected ({e}); retrying in {delay:.1f}s")
+            self._missed = True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+    def _receive(self, payload: bytes):
+        try:
+            message = json.loads(payload)
+            if message.get("origin") == self.worker_id:
+                return
+            self.received += 1
+            self.apply(message)
+        except Exception as e:
+            print(f"Could not apply invalidation, clearing caches: {e}")
+            self.on_reset()
+
+    async def _send(self):
+        reader = writer = None
+        while True:
+            batch = [await self._outbox.get()]
+            while not self._outbox.empty():
+                batch.append(self._outbox.get_nowait())
+            frames = b"".join(encode_command("PUBLISH", self.channel, json.dumps(message)) for message in batch)
+            for attempt in range(2):
+                try:
+                    if writer is None:
+                        reader, writer = await open_connection(self.url)
+                    writer.write(frames)
+                    await writer.drain()
+                    for _ in batch:
+                        await read_reply(reader)
+                    self.published += len(batch)
+                    break
+                except (OSError, ConnectionError, asyncio.IncompleteReadError, ReplyError, ValueError) as e:
+                    if writer is not None:
+                        writer.close()
+                    reader = writer = None
+                    if attempt:
+                        # Other workers fall back on their cache TTLs for these
+                        print(f"Could not publish {len(batch)} invalidations: {e}")
+                        self.dropped += len(batch)
+            for _ in batch:
+                self._outbox.task_done()
+
+
+class Broker:
+    """Minimal Redis-compatible pub/sub server: SUBSCRIBE, UNSUBSCRIBE,
+    PUBLISH and PING. Enough for the invalidation bus when no Redis is
+    deployed; messages are not persisted."""
+
+    def __init__(self):
+        self._channels: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+
+    async def serve_unix(self, path: str):
+        if os.path.exists(path):
+            # Left behind by a broker that did not shut down cleanly
+            os.remove(path)
+        return await asyncio.start_unix_server(self._handle, path)
+
+    async def serve_tcp(self, host: str, port: int):
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscribed = set()
+        try:
+            while True:
+                try:
+                    command = await read_reply(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                if not isinstance(command, list) or not command or not isinstance(command[0], bytes):
+                    writer.write(b"-ERR expected a command array\r\n")
+                    await writer.drain()
+                    continue
+                name, arguments = command[0].upper(), command[1:]
+                if name == b"PUBLISH" and len(arguments) == 2:
+                    channel, payload = arguments
+                    receivers = self._channels.get(channel, set())
+                    frame = encode_command(b"message", channel, payload)
+                    for receiver in list(receivers):
+                        if receiver.transport.get_write_buffer_size() > MAX_SUBSCRIBER_BUFFER:
+                            receivers.discard(receiver)
+                            receiver.close()
+                        else:
+                            receiver.write(frame)
+                    writer.write(b":%d\r\n" % len(receivers))
+                elif name in (b"SUBSCRIBE", b"UNSUBSCRIBE"):
+                    for channel in arguments:
+                        if name == b"SUBSCRIBE":
+                            self._channels.setdefault(channel, set()).add(writer)
+                            subscribed.add(channel)
+                        else:
+                            self._channels.get(channel, set()).discard(writer)
+                            subscribed.discard(channel)
+                        kind = name.lower()
+                        writer.write(b"*3\r\n$%d\r\n%s\r\n$%d\r\n%s\r\n:%d\r\n" % (len(kind), kind, len(channel), channel, len(subscribed)))
+                elif name == b"PING":
+                    writer.write(b"+PONG\r\n")
+                elif name == b"QUIT":
+                    writer.write(b"+OK\r\n")
+                    break
+                else:
+                    writer.write(b"-ERR unknown command '%s'\r\n" % name)
+                await writer.drain()
+        finally:
+            for channel in subscribed:
+                self._channels.get(channel, set()).discard(writer)
+            writer.close()
+
+
+async def run_broker(socket_path: Optional[str], host: str, port: int):
+    broker = Broker()
+    if socket_path:
+        server = await broker.serve_unix(socket_path)
+        print(f"Invalidation broker listening on {socket_path}")
+    else:
+        server = await broker.serve_tcp(host, port)
+        print(f"Invalidation broker listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the local pub/sub broker for cache invalidation")
+    parser.add_argument("--socket", help="Unix socket path (default: TCP)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_broker(args.socket, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
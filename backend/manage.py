@@ -0,0 +1,122 @@
+"""Maintenance commands for the datastore selected by STORAGE_BACKEND.
+
+    python manage.py backfill-epoch-fields [--dry-run]
+    python manage.py rebuild-day-boards [--from YYYY-MM-DD --to YYYY-MM-DD]
+    python manage.py backfill-log-ids
+"""
+import argparse
+from datetime import date as date_type, timedelta
+
+from booking_index import stamp_epoch_fields
+from day_board import build_board
+
+PAGE_SIZE = 500
+
+
+def scan(store, collection, fields=None):
+    """Yield pages of a whole collection in id order"""
+    position = None
+    while True:
+        page = store.find(collection, order_by=[('id', 'asc')], limit=PAGE_SIZE, start_after=position, fields=fields)
+        if page:
+            yield page
+        if len(page) < PAGE_SIZE:
+            return
+        position = [page[-1]['id']]
+
+
+def backfill_epoch_fields(store, dry_run=False):
+    """Add or correct start_epoch_min/end_epoch_min on every surgery"""
+    scanned = updated = skipped = 0
+    for page in scan(store, 'surgeries'):
+        writes = []
+        for surgery_data in page:
+            scanned += 1
+            try:
+                derived = stamp_epoch_fields(dict(surgery_data))
+            except (KeyError, TypeError, ValueError):
+                print(f"Skipping surgery {surgery_data.get('id')}: bad date, time or duration")
+                skipped += 1
+                continue
+            fields = {key: derived[key] for key in ('start_epoch_min', 'end_epoch_min')}
+            if any(surgery_data.get(key) != value for key, value in fields.items()):
+                writes.append(('update', 'surgeries', surgery_data['id'], fields))
+        if writes and not dry_run:
+            store.write_batch(writes)
+        updated += len(writes)
+    verb = "would update" if dry_run else "updated"
+    print(f"Scanned {scanned} surgeries, {verb} {updated}, skipped {skipped}")
+
+
+def rebuild_day_boards(store, guard_collection, first=None, last=None):
+    """Regenerate day boards from the surgeries collection"""
+    if first and last:
+        start, end = date_type.fromisoformat(first), date_type.fromisoformat(last)
+        dates = [(start + timedelta(days=offset)).isoformat() for offset in range((end - start).days + 1)]
+    else:
+        dates = sorted({s['surgery_date'] for page in scan(store, 'surgeries', ['surgery_date']) for s in page if s.get('surgery_date')})
+    drifted = 0
+    for date in dates:
+        def decide(guards, find):
+            board = build_board(find('surgeries', [('surgery_date', '==', date)]))
+            if guards[date].get('ots') != board:
+                guards[date].update(date=date, ots=board)
+                return [], True
+            return [], False
+        # Same transaction as bookings, so a rebuild never loses a concurrent write
+        changed, _ = store.guarded_write(guard_collection, [date], decide)
+        drifted += changed
+    print(f"Rebuilt {len(dates)} day boards, {drifted} had drifted")
+
+
+def backfill_log_ids(store):
+    """Store each log entry's document id in its data. Log listings order by
+    (timestamp, id), and Firestore leaves out documents missing an ordered
+    field, so entries written before ids were stored would not show up"""
+    updated = 0
+    since, seen = None, set()
+    while True:
+        # Resume at the last timestamp seen (not after it), so entries sharing
+        # a timestamp across a page boundary are not skipped
+        filters = [('timestamp', '>=', since)] if since is not None else []
+        page = store.find('logs', filters, [('timestamp', 'asc')], PAGE_SIZE)
+        fresh = [entry for entry in page if entry['id'] not in seen]
+        if fresh:
+            store.write_batch([('update', 'logs', entry['id'], {'id': entry['id']}) for entry in fresh])
+            updated += len(fresh)
+        if len(page) < PAGE_SIZE:
+            break
+        if not fresh:
+            print(f"More than {PAGE_SIZE} log entries share timestamp {since}; stopping")
+            break
+        last = page[-1]['timestamp']
+        seen = (seen if last == since else set()) | {entry['id'] for entry in page if entry['timestamp'] == last}
+        since = last
+    print(f"Stored ids on {updated} log entries")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill = commands.add_parser("backfill-epoch-fields", help="store numeric start/end minutes on existing surgeries")
+    backfill.add_argument("--dry-run", action="store_true")
+    rebuild = commands.add_parser("rebuild-day-boards", help="regenerate materialized day boards from raw surgeries")
+    rebuild.add_argument("--from", dest="first", help="first day (default: every day with surgeries)")
+    rebuild.add_argument("--to", dest="last")
+    commands.add_parser("backfill-log-ids", help="store document ids in log entries written by older versions")
+    args = parser.parse_args()
+
+    # Same backend selection and credentials as the API
+    from server import SCHEDULE_GUARDS, connect_datastore
+
+    repo = connect_datastore()
+    if repo is None:
+        parser.exit(1, "No datastore configured\n")
+    if args.command == "backfill-epoch-fields":
+        backfill_epoch_fields(repo, args.dry_run)
+    elif args.command == "rebuild-day-boards":
+        if bool(args.first) != bool(args.last):
+            parser.exit(2, "--from and --to go together\n")
+        rebuild_day_boards(repo, SCHEDULE_GUARDS, args.first, args.last)
+    elif args.command == "backfill-log-ids":
+        backfill_log_ids(repo)
@@ -0,0 +1,338 @@
+import collections
+import sys
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; wide enough for a local cache hit and a slow Firestore round trip
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# A collected sample: (metric name, {label: value}, value)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        name += "{" + ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items()) + "}"
+    if value == float("inf"):
+        return f"{name} +Inf"
+    return f"{name} {value!r}"
+
+
+class Metric:
+    """A named family of samples keyed by label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _labels(self, values: tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = collections.defaultdict(float)
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] += amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = collections.defaultdict(float)
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] += amount
+
+    def dec(self, *labelvalues, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value: float, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labelvalues)
+            if counts is None:
+                counts = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def time(self, *labelvalues):
+        """Context manager observing the time spent inside it"""
+        return _Timer(self, labelvalues)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = [(key, list(counts)) for key, counts in self._values.items()]
+        for key, counts in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((self.name + "_bucket", dict(labels, le="+Inf" if bound == float("inf") else f"{bound:g}"), cumulative))
+            samples.append((self.name + "_count", labels, cumulative))
+            samples.append((self.name + "_sum", labels, counts[-1]))
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labelvalues: tuple):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format.
+
+    Numbers that already live elsewhere (cache counters, queue sizes) are
+    exported through collectors, callables that return (metric, samples)
+    pairs at scrape time, instead of being copied on every change.
+    """
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[Metric, List[Sample]]]]] = []
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, collect: Callable[[], Iterable[Tuple[Metric, List[Sample]]]]):
+        self._collectors.append(collect)
+        return collect
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        families = [(metric, metric.samples()) for metric in self._metrics]
+        for collect in self._collectors:
+            families.extend(collect())
+        lines = []
+        for metric, samples in families:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(_format(name, labels, value) for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording in-flight requests and latency per route.
+
+    Requests are labelled by route template (``/api/surgeries/{surgery_id}``)
+    rather than raw path, so ids do not explode the label space.
+    """
+
+    def __init__(self, app, latency: Histogram, in_flight: Gauge):
+        self.app = app
+        self.latency = latency
+        self.in_flight = in_flight
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.in_flight.dec()
+            route = scope.get("route")
+            self.latency.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status[0]),
+            )
+
+
+class InstrumentedRepository:
+    """Wraps a Repository and times every call by collection and operation"""
+
+    OPERATIONS = {"get", "set", "update", "delete", "add", "find", "get_many", "write_batch", "watch", "guarded_write"}
+
+    def __init__(self, inner, backend: str, latency: Histogram, errors: Counter):
+        self._inner = inner
+        self._backend = backend
+        self._latency = latency
+        self._errors = errors
+
+    def __getattr__(self, name):
+        attribute = getattr(self._inner, name)
+        if name not in self.OPERATIONS:
+            return attribute
+
+        def timed(*args, **kwargs):
+            # Exceptions from the caller's own callback (a guarded_write
+            # decide() rejecting a booking) are not datastore errors
+            raised_by_caller = []
+            if name == "guarded_write":
+                args = list(args)
+                decide = args[2] if len(args) > 2 else kwargs["decide"]
+
+                def checked_decide(*decide_args):
+                    try:
+                        return decide(*decide_args)
+                    except Exception as exc:
+                        raised_by_caller.append(exc)
+                        raise
+
+                if len(args) > 2:
+                    args[2] = checked_decide
+                else:
+                    kwargs["decide"] = checked_decide
+            if name == "write_batch":
+                writes = args[0] if args else kwargs.get("writes", ())
+                collection = ",".join(sorted({write[1] for write in writes})) or "none"
+            else:
+                collection = args[0] if args else kwargs.get("collection", kwargs.get("guard_collection", ""))
+            started = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            except Exception as exc:
+                if not any(exc is raised for raised in raised_by_caller):
+                    self._errors.inc(self._backend, collection, name)
+                raise
+            finally:
+                self._latency.observe(time.perf_counter() - started, self._backend, collection, name)
+
+        return timed
+
+
+class SamplingProfiler:
+    """Statistical profiler that can be switched on in a live process.
+
+    A background thread snapshots every other thread's stack each
+    ``interval`` seconds and counts identical stacks. ``folded()`` returns
+    them in the "frame;frame;frame count" format that flame graph tools
+    read. Overhead is one stack walk per thread per interval, and nothing
+    at all while stopped.
+    """
+
+    def __init__(self, max_depth: int = 64):
+        self.max_depth = max_depth
+        self.interval: Optional[float] = None
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self._stacks: collections.Counter = collections.Counter()
+        # folded() and stats() read the counter while the sampler thread adds to it
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.005):
+        if self.running:
+            return
+        self.interval = interval
+        self.samples = 0
+        self.started_at = time.time()
+        with self._lock:
+            self._stacks.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+
+    def folded(self, limit: Optional[int] = None) -> str:
+        with self._lock:
+            stacks = self._stacks.copy()
+        stacks = stacks.most_common(limit)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "samples": self.samples,
+            "distinct_stacks": len(self._stacks),
+            "started_at": self.started_at,
+        }
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            sample = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                names = []
+                while frame is not None and len(names) < self.max_depth:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                sample.append(";".join(reversed(names)))
+            with self._lock:
+                self._stacks.update(sample)
+            self.samples += 1
@@ -0,0 +1,148 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+SubscriptionKey = Tuple[str, Optional[str]]
+
+
+class Subscriber:
+    """One connected client: a bounded queue of events to send"""
+
+    def __init__(self, max_events: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_events)
+        self.overflowed = False
+
+    def push(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow client; it is told to reconnect instead of growing unbounded
+            self.overflowed = True
+
+
+class ScheduleHub:
+    """Fans schedule changes for a (date, ot_id) out to every connected client.
+
+    Each key has a single datastore listener, opened for the first subscriber
+    and closed after the last one leaves. The hub keeps the key's current
+    documents so late joiners get a full snapshot, then everyone receives the
+    same small added/modified/cancelled/removed deltas.
+    """
+
+    def __init__(self, watch: Callable[..., Awaitable[Callable[[], None]]], max_events: int = 1000):
+        # await watch(filters, callback) -> unsubscribe
+        self.watch = watch
+        self.max_events = max_events
+        self._subscribers: Dict[SubscriptionKey, List[Subscriber]] = {}
+        self._documents: Dict[SubscriptionKey, Dict[str, dict]] = {}
+        self._initialized = set()
+        self._unsubscribe: Dict[SubscriptionKey, Callable[[], None]] = {}
+        # Listeners still opening; everyone subscribing meanwhile waits on the same one
+        self._opening: Dict[SubscriptionKey, asyncio.Task] = {}
+
+    def listener_count(self) -> int:
+        return len(self._unsubscribe)
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    async def subscribe(self, key: SubscriptionKey) -> Subscriber:
+        subscriber = Subscriber(self.max_events)
+        self._subscribers.setdefault(key, []).append(subscriber)
+        if key in self._initialized:
+            subscriber.push(self._snapshot_event(key))
+            return subscriber
+        opening = self._opening.get(key)
+        if opening is None and key not in self._unsubscribe:
+            # First subscriber opens the listener; anyone joining before its
+            # initial result arrives gets that result as their snapshot
+            self._documents[key] = {}
+            opening = self._opening[key] = asyncio.create_task(self._open(key))
+        if opening is not None:
+            try:
+                await asyncio.shield(opening)
+            except BaseException:
+                self.unsubscribe(key, subscriber)
+                raise
+        return subscriber
+
+    async def _open(self, key: SubscriptionKey):
+        loop = asyncio.get_running_loop()
+        date, ot_id = key
+        filters = [('surgery_date', '==', date)]
+        if ot_id:
+            filters.append(('ot_id', '==', ot_id))
+
+        def callback(changes):
+            # Listener callbacks arrive on datastore threads
+            loop.call_soon_threadsafe(self._apply, key, changes)
+
+        try:
+            stop = await self.watch(filters, callback)
+        except BaseException:
+            # Nothing is listening; the next subscriber tries again
+            self._documents.pop(key, None)
+            self._initialized.discard(key)
+            raise
+        finally:
+            self._opening.pop(key, None)
+        if key in self._subscribers:
+            self._unsubscribe[key] = stop
+        else:
+            # Everyone left while the listener was opening
+            stop()
+            self._documents.pop(key, None)
+            self._initialized.discard(key)
+
+    def unsubscribe(self, key: SubscriptionKey, subscriber: Subscriber):
+        subscribers = self._subscribers.get(key, [])
+        if subscriber in subscribers:
+            subscribers.remove(subscriber)
+        if not subscribers:
+            self._subscribers.pop(key, None)
+            if key in self._opening:
+                # _open stops the listener once it is up, unless someone rejoins
+                return
+            self._documents.pop(key, None)
+            self._initialized.discard(key)
+            stop = self._unsubscribe.pop(key, None)
+            if stop is not None:
+                stop()
+
+    def close(self):
+        for opening in self._opening.values():
+            opening.cancel()
+        self._opening.clear()
+        for stop in self._unsubscribe.values():
+            stop()
+        self._unsubscribe.clear()
+        self._subscribers.clear()
+        self._documents.clear()
+        self._initialized.clear()
+
+    def _snapshot_event(self, key: SubscriptionKey) -> dict:
+        documents = sorted(self._documents[key].values(), key=lambda s: (s.get('surgery_time', ''), s.get('ot_id', '')))
+        return {"type": "snapshot", "surgeries": documents}
+
+    def _apply(self, key: SubscriptionKey, changes):
+        documents = self._documents.get(key)
+        if documents is None:
+            return
+        first_delivery = key not in self._initialized
+        self._initialized.add(key)
+        events = []
+        for kind, surgery_data in changes:
+            surgery_id = surgery_data.get('id')
+            if kind == "removed":
+                documents.pop(surgery_id, None)
+            else:
+                if kind == "modified" and surgery_data.get('status') == 'cancelled' \
+                        and documents.get(surgery_id, {}).get('status') != 'cancelled':
+                    kind = "cancelled"
+                documents[surgery_id] = surgery_data
+            events.append({"type": kind, "surgery": surgery_data})
+        if first_delivery:
+            # The listener's initial result set becomes everyone's snapshot
+            events = [self._snapshot_event(key)]
+        for subscriber in self._subscribers.get(key, []):
+            for event in events:
+                subscriber.push(event)
@@ -0,0 +1,227 @@
+import threading
+import time
+from datetime import date as date_type, timedelta
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from booking_index import MINUTES_PER_DAY, epoch_minutes, surgery_span, time_to_minutes
+
+# RRULE BYDAY codes, in date.weekday() order
+WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+
+def validate_block(block: dict) -> Optional[str]:
+    """What is wrong with a block's rule, or None"""
+    if not block.get('weekdays') or any(day not in WEEKDAYS for day in block['weekdays']):
+        return f"weekdays must be a non-empty list of {', '.join(WEEKDAYS)}"
+    try:
+        start, end = time_to_minutes(block['start_time']), time_to_minutes(block['end_time'])
+    except (ValueError, AttributeError):
+        return "start_time and end_time must be HH:MM"
+    if not 0 <= start < end <= MINUTES_PER_DAY:
+        return "start_time must be before end_time on the same day"
+    try:
+        first = date_type.fromisoformat(block['starts_on'])
+        last = date_type.fromisoformat(block['ends_on']) if block.get('ends_on') else None
+        for skipped in block.get('skip_dates') or []:
+            date_type.fromisoformat(skipped)
+    except (TypeError, ValueError):
+        return "starts_on, ends_on and skip_dates must be YYYY-MM-DD"
+    if last is not None and last < first:
+        return "ends_on must not be before starts_on"
+    if block.get('interval_weeks', 1) < 1:
+        return "interval_weeks must be at least 1"
+    return None
+
+
+def describe_rule(block: dict) -> str:
+    """The block's rule as an RRULE string"""
+    parts = [f"FREQ=WEEKLY;INTERVAL={block.get('interval_weeks', 1)};BYDAY={','.join(block['weekdays'])}"]
+    if block.get('ends_on'):
+        parts.append(f"UNTIL={block['ends_on'].replace('-', '')}")
+    return ";".join(parts)
+
+
+def _anchor(block: dict) -> date_type:
+    # Weeks are counted from the Monday of the week the block starts in
+    first = date_type.fromisoformat(block['starts_on'])
+    return first - timedelta(days=first.weekday())
+
+
+def occurs_on(block: dict, day: date_type) -> bool:
+    """Whether the block applies on day, straight from the rule"""
+    if day < date_type.fromisoformat(block['starts_on']):
+        return False
+    if block.get('ends_on') and day > date_type.fromisoformat(block['ends_on']):
+        return False
+    if WEEKDAYS[day.weekday()] not in block['weekdays']:
+        return False
+    if ((day - _anchor(block)).days // 7) % block.get('interval_weeks', 1):
+        return False
+    return day.isoformat() not in (block.get('skip_dates') or ())
+
+
+def occurrences(block: dict, first: date_type, last: date_type) -> Iterator[date_type]:
+    """Dates in [first, last] on which the block applies, in order. Computed
+    week by week as they are consumed, so an open-ended rule costs nothing
+    beyond the range asked for"""
+    first = max(first, date_type.fromisoformat(block['starts_on']))
+    if block.get('ends_on'):
+        last = min(last, date_type.fromisoformat(block['ends_on']))
+    if first > last:
+        return
+    interval = block.get('interval_weeks', 1)
+    anchor = _anchor(block)
+    skipped = set(block.get('skip_dates') or ())
+    weekdays = sorted(WEEKDAYS.index(day) for day in set(block['weekdays']))
+    # First week of the rule's cycle at or before the one holding first
+    week = (first - anchor).days // 7
+    week -= week % interval
+    while True:
+        monday = anchor + timedelta(weeks=week)
+        if monday > last:
+            return
+        for weekday in weekdays:
+            day = monday + timedelta(days=weekday)
+            if first <= day <= last and day.isoformat() not in skipped:
+                yield day
+        week += interval
+
+
+class BlockCalendar:
+    """Recurring OT blocks ("Dr. X, OT 3, every Tuesday 08:00-14:00").
+
+    Only the rules are held, grouped by OT. Occurrences are never stored:
+    checking one booking asks each of its OT's rules whether it applies on
+    that day, and range queries expand the rules lazily for just the dates
+    requested. Loaded from one read of the blocks collection, patched by
+    the API's own writes, and reloaded after ttl_seconds. Bookings read it
+    from datastore worker threads while writes land on the event loop, so
+    every access takes a lock.
+    """
+
+    def __init__(self, ttl_seconds: float = 300.0):
+        self.ttl_seconds = ttl_seconds
+        self.loaded_at: Optional[float] = None
+        self._expired = False
+        self._blocks: Dict[str, dict] = {}
+        self._by_ot: Dict[str, Dict[str, dict]] = {}
+        # Writes seen while a reload is reading the collection
+        self._pending: Optional[list] = None
+        # Versions of the block writes applied here; a few per block ever saved
+        self._seen: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def is_loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def is_stale(self) -> bool:
+        return self.loaded_at is not None and (self._expired or time.monotonic() - self.loaded_at > self.ttl_seconds)
+
+    def expire(self):
+        self._expired = True
+
+    def begin_load(self):
+        with self._lock:
+            self._pending = []
+
+    def abort_load(self):
+        with self._lock:
+            self._pending = None
+
+    def install(self, blocks: List[dict]):
+        """Replace every rule with a full read and replay the writes made meanwhile"""
+        with self._lock:
+            pending, self._pending = self._pending or [], None
+            self._blocks, self._by_ot = {}, {}
+            for block in blocks:
+                self._apply_locked(block['id'], block)
+            for block_id, block in pending:
+                self._apply_locked(block_id, block)
+            self.loaded_at = time.monotonic()
+            self._expired = False
+
+    def upsert(self, block: dict):
+        self._write(block['id'], block)
+
+    def remove(self, block_id: str):
+        self._write(block_id, None)
+
+    def _write(self, block_id: str, block: Optional[dict]):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((block_id, block))
+            if self.is_loaded():
+                self._apply_locked(block_id, block)
+
+    def saw(self, version: str):
+        """Record that a block write is applied here"""
+        with self._lock:
+            self._seen.add(version)
+
+    def has_seen(self, version: str) -> bool:
+        with self._lock:
+            return version in self._seen
+
+    def _apply_locked(self, block_id: str, block: Optional[dict]):
+        previous = self._blocks.pop(block_id, None)
+        if previous is not None:
+            self._by_ot.get(previous['ot_id'], {}).pop(block_id, None)
+        if block is not None:
+            self._blocks[block_id] = block
+            self._by_ot.setdefault(block['ot_id'], {})[block_id] = block
+
+    def get(self, block_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._blocks.get(block_id)
+
+    def blocks(self, ot_ids: Optional[List[str]] = None) -> List[dict]:
+        with self._lock:
+            if ot_ids is None:
+                return list(self._blocks.values())
+            return [block for ot_id in ot_ids for block in self._by_ot.get(ot_id, {}).values()]
+
+    def windows(self, ot_id: str, day: date_type) -> List[Tuple[int, int, dict]]:
+        """(start, end, block) in minutes since midnight for blocks held in an OT on day"""
+        with self._lock:
+            blocks = list(self._by_ot.get(ot_id, {}).values())
+        return sorted(
+            (
+                (time_to_minutes(block['start_time']), time_to_minutes(block['end_time']), block)
+                for block in blocks
+                if occurs_on(block, day)
+            ),
+            key=lambda window: (window[0], window[1], window[2]['id']),
+        )
+
+    def conflicts(self, surgery_data: dict) -> List[dict]:
+        """Blocks held by another surgeon that overlap a booking in their OT"""
+        if surgery_data.get('status') == 'cancelled':
+            return []
+        with self._lock:
+            if not self._by_ot.get(surgery_data.get('ot_id')):
+                return []
+        start, end = surgery_span(surgery_data)
+        first = date_type.fromisoformat(surgery_data['surgery_date'])
+        # A late case can run past midnight into the next day's blocks
+        days = [first + timedelta(days=offset) for offset in range((end - 1) // MINUTES_PER_DAY - start // MINUTES_PER_DAY + 1)]
+        found = []
+        for day in days:
+            for window_start, window_end, block in self.windows(surgery_data['ot_id'], day):
+                if block.get('doctor_id') == surgery_data.get('doctor_id'):
+                    continue
+                block_start = epoch_minutes(day.isoformat(), "00:00") + window_start
+                if start < block_start + (window_end - window_start) and block_start < end:
+                    found.append({
+                        "block_id": block['id'],
+                        "doctor_id": block.get('doctor_id'),
+                        "date": day.isoformat(),
+                        "resources": [{"type": "ot", "id": block['ot_id']}],
+                    })
+        return found
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.is_loaded(),
+            "blocks": len(self._blocks),
+            "age_seconds": round(time.monotonic() - self.loaded_at, 1) if self.loaded_at is not None else None,
+        }
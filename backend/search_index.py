@@ -0,0 +1,163 @@
+import re
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+_WORD = re.compile(r"\w+")
+
+
+def name_tokens(text) -> List[str]:
+    """Lowercase words of a name: "Dr. Anne-Marie O'Neil" -> dr, anne, marie, o, neil"""
+    return _WORD.findall(str(text or "").casefold())
+
+
+def normalize(value) -> str:
+    return str(value or "").strip().casefold()
+
+
+class SearchIndex:
+    """In-memory search over one directory collection (doctors or patients).
+
+    Name words are kept as a sorted list of (token, id) pairs, so every
+    document with a word starting with some prefix is one bisect away, and
+    fields such as the MRN or specialization get exact-match maps. Only the
+    fields needed to show a result are held.
+
+    The index is built from one projected scan, then patched by the API's
+    own writes. Once older than ttl_seconds it is rebuilt, which also picks
+    up writes made by other processes.
+    """
+
+    def __init__(self, fields: Sequence[str], exact_fields: Sequence[str], ttl_seconds: float = 300.0):
+        self.fields = list(dict.fromkeys(["id", "name", *fields, *exact_fields]))
+        self.exact_fields = list(exact_fields)
+        self.ttl_seconds = ttl_seconds
+        self.loaded_at: Optional[float] = None
+        self._expired = False
+        self._docs: Dict[str, dict] = {}
+        self._tokens: List[Tuple[str, str]] = []
+        self._exact: Dict[str, Dict[str, Set[str]]] = {field: {} for field in self.exact_fields}
+        # Writes seen while a rebuild is reading the collection
+        self._pending: Optional[list] = None
+
+    def is_loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def is_stale(self) -> bool:
+        return self.loaded_at is not None and (self._expired or time.monotonic() - self.loaded_at > self.ttl_seconds)
+
+    def expire(self):
+        """Keep serving, but rebuild on next use (writes may have been missed)"""
+        self._expired = True
+
+    def begin_load(self):
+        self._pending = []
+
+    def abort_load(self):
+        self._pending = None
+
+    def build(self, documents: Iterable[dict]) -> tuple:
+        """Index contents for a full scan; CPU only, so it can run off the event loop"""
+        docs, pairs = {}, []
+        exact = {field: {} for field in self.exact_fields}
+        for document in documents:
+            summary = {field: document.get(field) for field in self.fields}
+            doc_id = summary["id"]
+            docs[doc_id] = summary
+            pairs.extend((token, doc_id) for token in set(name_tokens(summary["name"])))
+            for field in self.exact_fields:
+                exact[field].setdefault(normalize(summary[field]), set()).add(doc_id)
+        pairs.sort()
+        return docs, pairs, exact
+
+    def install(self, state: tuple):
+        """Swap in a built index and replay the writes made meanwhile"""
+        self._docs, self._tokens, self._exact = state
+        pending, self._pending = self._pending or [], None
+        self.loaded_at = time.monotonic()
+        self._expired = False
+        for doc_id, document in pending:
+            self._apply(doc_id, document)
+
+    def upsert(self, document: dict):
+        self._write(document["id"], document)
+
+    def remove(self, doc_id: str):
+        self._write(doc_id, None)
+
+    def _write(self, doc_id: str, document: Optional[dict]):
+        if self._pending is not None:
+            self._pending.append((doc_id, document))
+        if self.is_loaded():
+            self._apply(doc_id, document)
+
+    def _apply(self, doc_id: str, document: Optional[dict]):
+        previous = self._docs.pop(doc_id, None)
+        if previous is not None:
+            for token in set(name_tokens(previous["name"])):
+                position = bisect_left(self._tokens, (token, doc_id))
+                if position < len(self._tokens) and self._tokens[position] == (token, doc_id):
+                    del self._tokens[position]
+            for field in self.exact_fields:
+                ids = self._exact[field].get(normalize(previous[field]))
+                if ids is not None:
+                    ids.discard(doc_id)
+                    if not ids:
+                        del self._exact[field][normalize(previous[field])]
+        if document is None:
+            return
+        summary = {field: document.get(field) for field in self.fields}
+        summary["id"] = doc_id
+        self._docs[doc_id] = summary
+        for token in set(name_tokens(summary["name"])):
+            self._tokens.insert(bisect_left(self._tokens, (token, doc_id)), (token, doc_id))
+        for field in self.exact_fields:
+            self._exact[field].setdefault(normalize(summary[field]), set()).add(doc_id)
+
+    def _prefix_range(self, prefix: str) -> Tuple[int, int]:
+        # Every token starting with prefix sorts between (prefix,) and (prefix + max char,)
+        return bisect_left(self._tokens, (prefix,)), bisect_left(self._tokens, (prefix + "\U0010ffff",))
+
+    def search(self, query: str, filters: Dict[str, str], limit: int, max_scan: int) -> List[dict]:
+        """Up to limit documents whose name has a word starting with every
+        query word and whose filter fields match exactly.
+
+        Results come in the order of the most selective query word's index
+        range, so exact word matches rank before longer completions. At most
+        max_scan candidates are examined, which bounds latency for one-letter
+        queries at the price of completeness.
+        """
+        words = name_tokens(query)
+        required = [self._exact[field].get(normalize(value), set()) for field, value in filters.items()]
+        smallest = min(required, key=len) if required else None
+
+        if words:
+            start, end = min((self._prefix_range(word) for word in words), key=lambda bounds: bounds[1] - bounds[0])
+        if words and (smallest is None or end - start <= len(smallest)):
+            candidates = (doc_id for _, doc_id in self._tokens[start:min(end, start + max_scan)])
+        elif smallest is not None:
+            candidates = sorted(smallest, key=lambda doc_id: (normalize(self._docs[doc_id]["name"]), doc_id))[:max_scan]
+        else:
+            return []
+
+        results, seen = [], set()
+        for doc_id in candidates:
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            if not all(doc_id in ids for ids in required):
+                continue
+            tokens = name_tokens(self._docs[doc_id]["name"])
+            if all(any(token.startswith(word) for token in tokens) for word in words):
+                results.append(dict(self._docs[doc_id]))
+                if len(results) == limit:
+                    break
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.is_loaded(),
+            "documents": len(self._docs),
+            "tokens": len(self._tokens),
+            "age_seconds": round(time.monotonic() - self.loaded_at, 1) if self.loaded_at is not None else None,
+        }
@@ -1,18 +1,47 @@
-from fastapi import FastAPI, HTTPException, Depends
+import time
+
+# Taken before the imports below so startup can report how long they took
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer
 from pydantic import BaseModel
-from datetime import datetime, timedelta
+from datetime import date as date_type, datetime, timedelta
 from typing import List, Optional
-import firebase_admin
-from firebase_admin import credentials, firestore, auth, storage
+import asyncio
+import base64
+import binascii
+import csv
+import functools
+import io
 import json
 import os
+import orjson
 import uuid
-from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+from analytics import ANALYTICS_FIELDS, day_summaries, empty_summary, utilization_report
+from availability import available_slots, free_intervals, merge_intervals, minutes_to_time
+from audit_log import AuditLogWriter
+from booking_index import MINUTES_PER_DAY, BookingIndex, epoch_minutes, stamp_epoch_fields, surgery_span, time_to_minutes
+from day_board import apply_writes, build_board
+from http_cache import CompressionMiddleware, VersionTable, matching_etag
+from invalidation import InvalidationBus
+from lookup_cache import LRUCache
+from metrics import Counter, Gauge, InstrumentedRepository, MetricsMiddleware, Registry, SamplingProfiler
+from realtime import ScheduleHub
+from recurrence import BlockCalendar, describe_rule, occurrences, validate_block
+from search_index import SearchIndex
+from solver import plan_emergency
+from storage import FIRESTORE_BATCH_LIMIT, DocumentNotFound, FirestoreRepository, SqliteRepository
 
 # Initialize Firebase Admin
 def initialize_firebase():
+    # The SDK is imported on first use; it is a large share of import time
+    import firebase_admin
+
     if not firebase_admin._apps:
         try:
             # For MVP, we'll use Application Default Credentials
@@ -25,27 +54,166 @@ def initialize_firebase():
             # The client-side Firebase will handle authentication
             return None
 
-# Initialize Firebase
-initialize_firebase()
+# Storage backend: "firestore" (default) or "sqlite" for local benchmarking
+# and single-node deployments
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "firestore").lower()
+# Startup waits this long for the datastore, then serves anyway while the
+# connection finishes in the background (readiness reports 503 until then)
+DATASTORE_CONNECT_TIMEOUT = float(os.environ.get("DATASTORE_CONNECT_TIMEOUT", "10"))
+READINESS_TIMEOUT_SECONDS = float(os.environ.get("READINESS_TIMEOUT_SECONDS", "2"))
+READINESS_CACHE_SECONDS = float(os.environ.get("READINESS_CACHE_SECONDS", "5"))
+
+# Metrics, exported in Prometheus text format on /metrics
+metrics = Registry()
+REQUEST_LATENCY = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ["method", "route", "status"]
+)
+REQUESTS_IN_FLIGHT = metrics.gauge("http_requests_in_flight", "HTTP requests currently being served")
+DATASTORE_LATENCY = metrics.histogram(
+    "datastore_call_duration_seconds", "Datastore call latency by collection and operation", ["backend", "collection", "operation"]
+)
+DATASTORE_ERRORS = metrics.counter(
+    "datastore_call_errors_total", "Datastore calls that raised", ["backend", "collection", "operation"]
+)
+CONFLICT_CHECK_LATENCY = metrics.histogram(
+    "conflict_check_duration_seconds", "Time to check one booking against the booking index"
+)
+BOOKING_INDEX_LOOKUPS = metrics.counter(
+    "booking_index_lookups_total", "Booking index day lookups, by whether the day had to be read", ["result"]
+)
+STARTUP_SECONDS = metrics.gauge("startup_duration_seconds", "Time spent in each startup phase", ["phase"])
+# Off until switched on through /api/debug/profiler/start
+profiler = SamplingProfiler()
+
+# Opened by the lifespan hook rather than at import, so a worker answers
+# liveness probes without waiting on credentials and the first round trip
+repo = None
+
+def connect_datastore():
+    """Open the configured datastore; None when it cannot be reached"""
+    if STORAGE_BACKEND == "sqlite":
+        store = SqliteRepository(os.environ.get("SQLITE_PATH", "operation.db"))
+        print(f"SQLite storage initialized at {store.path}")
+    else:
+        # Initialize Firebase
+        initialize_firebase()
+
+        # For development, we'll serve sample data if Firebase fails
+        # In production, this would always use Firestore
+        try:
+            from firebase_admin import firestore
+
+            store = FirestoreRepository(firestore.client())
+            print("Firestore client initialized")
+        except Exception as e:
+            print(f"Firestore client error: {e}")
+            return None
+    return InstrumentedRepository(store, STORAGE_BACKEND, DATASTORE_LATENCY, DATASTORE_ERRORS)
+
+# The storage clients are synchronous, so every call goes through a bounded
+# thread pool instead of blocking the event loop
+db_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("DB_MAX_WORKERS", "16")),
+    thread_name_prefix="db",
+)
+
+async def run_db(fn, *args, **kwargs):
+    """Run a blocking storage call on the database thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(fn, *args, **kwargs))
+
+def require_repo():
+    """Return the active repository or fail with 503 when storage is down"""
+    if not repo:
+        raise HTTPException(status_code=503, detail="Database service unavailable")
+    return repo
 
-# For development, we'll use a simple in-memory store if Firebase fails
-# In production, this would always use Firestore
-try:
-    db = firestore.client()
-    print("Firestore client initialized")
-except Exception as e:
-    print(f"Firestore client error: {e}")
-    db = None
+async def write_logs(entries: List[dict]):
+    # Ids are fixed on the first attempt, so replaying a spilled batch that
+    # partly made it in overwrites instead of duplicating; they also break
+    # timestamp ties in the log listing
+    await run_db(require_repo().write_batch, [('set', 'logs', entry.setdefault('id', uuid.uuid4().hex), entry) for entry in entries])
+
+async def watch_surgeries(filters: list, callback):
+    return await run_db(require_repo().watch, 'surgeries', filters, callback)
+
+# One datastore listener per (date, ot_id), shared by all streaming clients
+schedule_hub = ScheduleHub(watch_surgeries)
+SSE_HEARTBEAT_SECONDS = 15
+
+# Audit logs are written off the request path in batches
+audit_log = AuditLogWriter(
+    write_logs,
+    spill_path=os.environ.get("AUDIT_LOG_SPILL_PATH", "audit_log_spill.jsonl"),
+    batch_size=int(os.environ.get("AUDIT_LOG_BATCH_SIZE", "200")),
+    flush_interval=float(os.environ.get("AUDIT_LOG_FLUSH_SECONDS", "1.0")),
+)
+
+# Last readiness probe; refreshed at most every READINESS_CACHE_SECONDS
+datastore_status = {"ready": False, "error": "not connected", "checked_at": None}
+_last_probe = [0.0]
+
+def probe_datastore():
+    """One small read: proves credentials, network and the datastore all work"""
+    repo.get(SCHEDULE_GUARDS, "readiness-probe")
+
+async def check_readiness(force: bool = False) -> dict:
+    if not force and time.monotonic() - _last_probe[0] < READINESS_CACHE_SECONDS:
+        return datastore_status
+    _last_probe[0] = time.monotonic()
+    if repo is None:
+        datastore_status.update(ready=False, error="not connected")
+    else:
+        try:
+            await asyncio.wait_for(run_db(probe_datastore), READINESS_TIMEOUT_SECONDS)
+            datastore_status.update(ready=True, error=None)
+        except asyncio.TimeoutError:
+            datastore_status.update(ready=False, error=f"no response within {READINESS_TIMEOUT_SECONDS:g}s")
+        except Exception as e:
+            datastore_status.update(ready=False, error=str(e) or type(e).__name__)
+    datastore_status["checked_at"] = datetime.now().isoformat()
+    return datastore_status
+
+async def open_datastore():
+    """Connect (unless a repository was installed already) and warm up the
+    connection, so the first real request does not pay for the handshake"""
+    global repo
+    started = time.perf_counter()
+    if repo is None:
+        repo = await run_db(connect_datastore)
+    await check_readiness(force=True)
+    STARTUP_SECONDS.set(time.perf_counter() - started, "datastore")
+    state = "ready" if datastore_status["ready"] else f"not ready ({datastore_status['error']})"
+    print(f"Datastore {state} after {time.perf_counter() - started:.2f}s")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("Starting up...")
+    started = time.perf_counter()
+    if invalidation_bus is not None:
+        await invalidation_bus.start()
+    connecting = asyncio.create_task(open_datastore())
+    try:
+        await asyncio.wait_for(asyncio.shield(connecting), DATASTORE_CONNECT_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"Datastore still connecting after {DATASTORE_CONNECT_TIMEOUT:g}s; serving without it meanwhile")
+    # After the datastore, so entries spilled by a previous run can be replayed
+    await audit_log.start()
+    STARTUP_SECONDS.set(time.perf_counter() - started, "lifespan")
+    print(f"Startup took {time.perf_counter() - started:.2f}s after {IMPORT_SECONDS:.2f}s of imports")
     yield
     # Shutdown
     print("Shutting down...")
+    connecting.cancel()
+    profiler.stop()
+    schedule_hub.close()
+    await audit_log.stop()
+    if invalidation_bus is not None:
+        await invalidation_bus.stop()
+    db_executor.shutdown(wait=True)
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -54,10 +222,311 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.environ.get("COMPRESSION_MIN_BYTES", "1024")))
+app.add_middleware(MetricsMiddleware, latency=REQUEST_LATENCY, in_flight=REQUESTS_IN_FLIGHT)
 
 security = HTTPBearer()
 
+# Cursor pagination: every list is ordered on a unique key so a cursor (the
+# last row's ordering values) resumes exactly where the previous page ended
+LIST_ORDERING = {
+    'doctors': [('id', 'asc')],
+    'patients': [('id', 'asc')],
+    'surgeries': [('surgery_date', 'asc'), ('surgery_time', 'asc'), ('id', 'asc')],
+    'logs': [('timestamp', 'desc'), ('id', 'desc')],
+}
+# Time-window queries range over the numeric start, so they must order by it first
+START_ORDERING = [('start_epoch_min', 'asc'), ('id', 'asc')]
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_PAGE_SIZE = 500
+
+def encode_cursor(row: dict, order_by) -> str:
+    values = [row.get(field) for field, _ in order_by]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str, order_by) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(order_by):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+async def list_page(collection: str, filters: list, limit: Optional[int], cursor: Optional[str], expand: List[str] = (), order_by: list = None) -> dict:
+    """Fetch one page of a collection and the cursor for the next one"""
+    order_by = order_by or LIST_ORDERING[collection]
+    start_after = decode_cursor(cursor, order_by) if cursor else None
+    limit = limit or DEFAULT_PAGE_SIZE
+    items = await run_db(require_repo().find, collection, filters, order_by, limit, start_after)
+    if expand:
+        await expand_surgeries(items, expand)
+    next_cursor = encode_cursor(items[-1], order_by) if len(items) == limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+async def iter_pages(collection: str, filters: list, cursor: Optional[str], order_by: list = None):
+    """Walk a query page by page (keyset pagination), one page in memory at a time"""
+    store = require_repo()
+    order_by = order_by or LIST_ORDERING[collection]
+    position = decode_cursor(cursor, order_by) if cursor else None
+    while True:
+        page = await run_db(store.find, collection, filters, order_by, STREAM_PAGE_SIZE, position)
+        if page:
+            yield page
+        if len(page) < STREAM_PAGE_SIZE:
+            return
+        position = [page[-1].get(field) for field, _ in order_by]
+
+def stream_collection(collection: str, filters: list, cursor: Optional[str], expand: List[str] = (), order_by: list = None) -> StreamingResponse:
+    """Stream a collection as NDJSON, holding at most one page in memory"""
+    require_repo()
+
+    async def rows():
+        async for page in iter_pages(collection, filters, cursor, order_by):
+            if expand:
+                await expand_surgeries(page, expand)
+            yield b"".join(orjson.dumps(item) + b"\n" for item in page)
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+def parse_epoch_minutes(value: str) -> int:
+    """Parse "YYYY-MM-DD" or "YYYY-MM-DDTHH:MM" into epoch minutes"""
+    day, _, time_of_day = value.partition('T')
+    try:
+        return epoch_minutes(day, time_of_day[:5] or "00:00")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Times must be YYYY-MM-DD or YYYY-MM-DDTHH:MM")
+
+# Conditional GETs: list and availability responses are tagged with version
+# markers of what they read ("doctors", "surgeries", "surgeries:<date>"),
+# bumped after every write, so a poll with nothing new is answered 304
+# without a query. Writes announce their token on the invalidation channel,
+# so every worker hands out and accepts the same tags
+resource_versions = VersionTable(ttl_seconds=float(os.environ.get("ETAG_TTL_SECONDS", "30")))
+
+def surgery_version_keys(dates) -> List[str]:
+    return ['surgeries', *(f"surgeries:{date}" for date in dates)]
+
+def check_etag(request: Request, keys: List[str]) -> tuple:
+    """(etag, 304 response or None) for a read of keys. Taken before reading,
+    so a write landing mid-read at worst costs the client one extra fetch"""
+    etag = resource_versions.etag(keys, f"{request.url.path}?{request.url.query}")
+    matched = matching_etag(request.headers.get("if-none-match"), etag)
+    if matched:
+        return etag, Response(status_code=304, headers={"ETag": matched, "Cache-Control": "no-cache"})
+    return etag, None
+
+def tagged(content, etag: str) -> ORJSONResponse:
+    # Returning the response directly also skips FastAPI's jsonable_encoder pass
+    return ORJSONResponse(content, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+# Doctor and patient lookups are read far more often than they change, so
+# they are served through bounded read-through caches
+DIRECTORY_CACHES = {
+    'doctors': LRUCache(
+        maxsize=int(os.environ.get("DOCTOR_CACHE_SIZE", "2000")),
+        ttl_seconds=float(os.environ.get("DIRECTORY_CACHE_TTL_SECONDS", "300")),
+    ),
+    'patients': LRUCache(
+        maxsize=int(os.environ.get("PATIENT_CACHE_SIZE", "10000")),
+        ttl_seconds=float(os.environ.get("DIRECTORY_CACHE_TTL_SECONDS", "300")),
+    ),
+}
+
+# Name/MRN/specialization search, served from memory instead of shipping
+# whole collections to the browser
+SEARCH_INDEX_TTL_SECONDS = float(os.environ.get("SEARCH_INDEX_TTL_SECONDS", "300"))
+MAX_SEARCH_RESULTS = 100
+SEARCH_SCAN_LIMIT = int(os.environ.get("SEARCH_SCAN_LIMIT", "5000"))
+SEARCH_INDEXES = {
+    'doctors': SearchIndex(['email'], ['specialization', 'department'], SEARCH_INDEX_TTL_SECONDS),
+    'patients': SearchIndex(['age', 'gender'], ['medical_record_number'], SEARCH_INDEX_TTL_SECONDS),
+}
+search_index_loads = {}
+
+async def load_search_index(collection: str):
+    index = SEARCH_INDEXES[collection]
+    index.begin_load()
+    try:
+        documents = await run_db(require_repo().find, collection, fields=index.fields)
+        state = await run_db(index.build, documents)
+    except BaseException:
+        index.abort_load()
+        raise
+    index.install(state)
+
+def log_failed_load(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Search index refresh failed: {task.exception()}")
+
+async def get_search_index(collection: str) -> SearchIndex:
+    """The collection's search index; the first search builds it, later
+    refreshes run in the background while the current one keeps serving"""
+    index = SEARCH_INDEXES[collection]
+    if not index.is_loaded() or index.is_stale():
+        task = search_index_loads.get(collection)
+        if task is None or task.done():
+            task = search_index_loads[collection] = asyncio.create_task(load_search_index(collection))
+            task.add_done_callback(log_failed_load)
+        if not index.is_loaded():
+            await asyncio.shield(task)
+    return index
+
+async def get_cached(collection: str, doc_id: str) -> Optional[dict]:
+    """Read a doctor or patient through its cache"""
+    cache = DIRECTORY_CACHES[collection]
+    data = cache.get(doc_id)
+    if data is None:
+        data = await run_db(require_repo().get, collection, doc_id)
+        if data is not None:
+            cache.put(doc_id, data)
+    return data
+
+async def get_many_cached(collection: str, doc_ids: List[str]) -> dict:
+    """Resolve many doctors or patients, fetching only cache misses in one batch read"""
+    cache = DIRECTORY_CACHES[collection]
+    found, missing = {}, []
+    for doc_id in dict.fromkeys(doc_ids):
+        data = cache.get(doc_id)
+        if data is None:
+            missing.append(doc_id)
+        else:
+            found[doc_id] = data
+    if missing:
+        fetched = await run_db(require_repo().get_many, collection, missing)
+        for doc_id, data in fetched.items():
+            cache.put(doc_id, data)
+        found.update(fetched)
+    return found
+
+def split_ids(ids: str) -> List[str]:
+    return [doc_id.strip() for doc_id in ids.split(",") if doc_id.strip()]
+
+# Related documents that can be embedded in surgery responses: name -> (collection, reference field)
+SURGERY_EXPANSIONS = {
+    'doctor': ('doctors', 'doctor_id'),
+    'patient': ('patients', 'patient_id'),
+}
+
+def parse_expand(expand: Optional[str]) -> List[str]:
+    fields = split_ids(expand) if expand else []
+    unknown = [field for field in fields if field not in SURGERY_EXPANSIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot expand: {', '.join(unknown)}")
+    return list(dict.fromkeys(fields))
+
+async def expand_surgeries(surgeries: List[dict], fields: List[str]):
+    """Embed doctor/patient documents in place, one batched read per collection"""
+    pending = []
+    for field in fields:
+        collection, id_field = SURGERY_EXPANSIONS[field]
+        ids = [s[id_field] for s in surgeries if s.get(id_field)]
+        pending.append(get_many_cached(collection, ids))
+    lookups = await asyncio.gather(*pending)
+    for field, found in zip(fields, lookups):
+        id_field = SURGERY_EXPANSIONS[field][1]
+        for surgery_data in surgeries:
+            surgery_data[field] = found.get(surgery_data.get(id_field))
+
+# Active bookings per (resource, date), filled lazily one day at a time
+booking_index = BookingIndex(ttl_seconds=float(os.environ.get("BOOKING_INDEX_TTL_SECONDS", "300")))
+
+# Recurring OT blocks, held as rules and expanded only for the dates asked about
+block_calendar = BlockCalendar(ttl_seconds=float(os.environ.get("BLOCK_CALENDAR_TTL_SECONDS", "300")))
+block_calendar_load = None
+
+async def load_block_calendar():
+    block_calendar.begin_load()
+    try:
+        blocks = await run_db(require_repo().find, 'blocks')
+    except BaseException:
+        block_calendar.abort_load()
+        raise
+    block_calendar.install(blocks)
+
+def log_failed_block_load(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Block calendar refresh failed: {task.exception()}")
+
+async def get_block_calendar() -> BlockCalendar:
+    """The block rules; the first caller loads them, later refreshes run in
+    the background while the current rules keep serving"""
+    global block_calendar_load
+    if not block_calendar.is_loaded() or block_calendar.is_stale():
+        task = block_calendar_load
+        if task is None or task.done():
+            task = block_calendar_load = asyncio.create_task(load_block_calendar())
+            task.add_done_callback(log_failed_block_load)
+        if not block_calendar.is_loaded():
+            await asyncio.shield(task)
+    return block_calendar
+
+# With several workers (WEB_CONCURRENCY > 1) each one holds the caches above.
+# Writes are announced on a pub/sub channel so the other workers drop what
+# went stale; without INVALIDATION_URL this process is assumed to be alone
+INVALIDATION_URL = os.environ.get("INVALIDATION_URL")
+
+def forget_directory_entry(collection: str, doc_id: str, document: Optional[dict], version: Optional[str] = None) -> str:
+    DIRECTORY_CACHES[collection].invalidate([doc_id])
+    if document is None:
+        SEARCH_INDEXES[collection].remove(doc_id)
+    else:
+        SEARCH_INDEXES[collection].upsert(document)
+    return resource_versions.bump([collection], version)
+
+def forget_schedule_days(dates: List[str], version: Optional[str] = None) -> str:
+    booking_index.invalidate(dates)
+    analytics_cache.invalidate(dates)
+    return resource_versions.bump(surgery_version_keys(dates), version)
+
+def forget_block(block_id: str, block: Optional[dict], version: Optional[str] = None) -> str:
+    if block is None:
+        block_calendar.remove(block_id)
+    else:
+        block_calendar.upsert(block)
+    version = resource_versions.bump(['blocks'], version)
+    block_calendar.saw(version)
+    return version
+
+def apply_invalidation(message: dict):
+    """Another worker wrote; drop or patch what that made stale here"""
+    if message['kind'] == 'directory':
+        forget_directory_entry(message['collection'], message['id'], message.get('document'), message.get('version'))
+    elif message['kind'] == 'schedule':
+        forget_schedule_days(message['dates'], message.get('version'))
+    elif message['kind'] == 'block':
+        forget_block(message['id'], message.get('block'), message.get('version'))
+
+def reset_caches():
+    """Invalidations may have been missed; start over from the datastore"""
+    for cache in DIRECTORY_CACHES.values():
+        cache.clear()
+    for index in SEARCH_INDEXES.values():
+        index.expire()
+    booking_index.clear()
+    block_calendar.expire()
+    analytics_cache.clear()
+    resource_versions.reset()
+
+invalidation_bus = InvalidationBus(INVALIDATION_URL, apply_invalidation, reset_caches) if INVALIDATION_URL else None
+
+def publish_invalidation(message: dict):
+    if invalidation_bus is not None:
+        invalidation_bus.publish(message)
+
+def directory_changed(collection: str, doc_id: str, document: Optional[dict]):
+    """Update this worker's doctor/patient caches after a write and tell the others"""
+    version = forget_directory_entry(collection, doc_id, document)
+    publish_invalidation({"kind": "directory", "collection": collection, "id": doc_id, "document": document, "version": version})
+
+def block_changed(block_id: str, block: Optional[dict], version: Optional[str] = None):
+    """Update this worker's block rules after a write and tell the others"""
+    version = forget_block(block_id, block, version)
+    publish_invalidation({"kind": "block", "id": block_id, "block": block, "version": version})
+
 # Pydantic models
 class Doctor(BaseModel):
     id: Optional[str] = None
@@ -96,12 +565,55 @@ class Surgery(BaseModel):
     is_emergency: bool = False
     duration_minutes: int = 120  # default 2 hours
 
+class Block(BaseModel):
+    """An OT reserved for one surgeon on a weekly rule, e.g. every Tuesday 08:00-14:00"""
+    id: Optional[str] = None
+    doctor_id: str
+    ot_id: str
+    weekdays: List[str]  # MO, TU, WE, TH, FR, SA, SU
+    start_time: str
+    end_time: str
+    starts_on: str
+    ends_on: Optional[str] = None  # open-ended when not set
+    interval_weeks: int = 1
+    skip_dates: List[str] = []
+    notes: str = ""
+
+MAX_BULK_SURGERIES = 1000
+
+# Operating theatres and default operating hours used for availability
+OT_IDS = [ot.strip() for ot in os.environ.get("OT_IDS", "1,2,3,4,5").split(",") if ot.strip()]
+DEFAULT_DAY_START = "08:00"
+DEFAULT_DAY_END = "20:00"
+MAX_AVAILABILITY_DAYS = 62
+MAX_ANALYTICS_DAYS = 366
+EMERGENCY_PLAN_BUDGET_MS = float(os.environ.get("EMERGENCY_PLAN_BUDGET_MS", "200"))
+MAX_EMERGENCY_PLAN_BUDGET_MS = 5000
+
+class PlannedMove(BaseModel):
+    surgery_id: str
+    previous_ot_id: str
+    previous_time: str
+    ot_id: str
+    surgery_time: str
+
+class EmergencyPlan(BaseModel):
+    surgery: Surgery
+    # Set when the emergency was already saved by POST /api/surgeries/emergency
+    surgery_id: Optional[str] = None
+    ot_id: str
+    surgery_time: str
+    moves: List[PlannedMove] = []
+
 class ConflictCheck(BaseModel):
     surgery_date: str
     surgery_time: str
     ot_id: str
     duration_minutes: int
     exclude_surgery_id: Optional[str] = None
+    doctor_id: Optional[str] = None
+    anesthesiologist: Optional[str] = None
+    nurses: Optional[List[str]] = None
 
 # Auth dependency
 async def get_current_user(token: str = Depends(security)):
@@ -112,69 +624,186 @@ async def get_current_user(token: str = Depends(security)):
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid authentication")
 
-# Core scheduling logic with fallback
-def check_scheduling_conflict(surgery_data: dict, exclude_id: str = None) -> bool:
-    """Check if a surgery conflicts with existing schedules"""
+async def load_bookings(date: str):
+    """Make sure the booking index holds every booking on the date"""
+    if booking_index.is_loaded(date):
+        BOOKING_INDEX_LOOKUPS.inc("hit")
+    else:
+        # Cache miss: one read covers every OT and staff member that day
+        BOOKING_INDEX_LOOKUPS.inc("miss")
+        booking_index.load(date, await run_db(repo.find, 'surgeries', [('surgery_date', '==', date)]))
+
+def check_bookings(surgery_data: dict, exclude_id: str = None) -> list:
+    """Timed booking index probe: (resource, surgery_id) pairs that overlap"""
+    with CONFLICT_CHECK_LATENCY.time():
+        return booking_index.conflicts(surgery_data, exclude_id)
+
+def describe_conflicts(pairs) -> List[dict]:
+    """Group (resource, surgery_id) pairs into one entry per conflicting surgery"""
+    grouped = {}
+    for (kind, resource_id), surgery_id in pairs:
+        grouped.setdefault(surgery_id, []).append({"type": kind, "id": resource_id})
+    return [{"surgery_id": surgery_id, "resources": resources} for surgery_id, resources in grouped.items()]
+
+def schedule_conflicts(surgery_data: dict, exclude_id: str = None) -> List[dict]:
+    """Overlapping bookings, then blocks the OT is reserved under for another surgeon"""
+    return describe_conflicts(check_bookings(surgery_data, exclude_id)) + block_calendar.conflicts(surgery_data)
+
+# Core scheduling logic
+async def find_scheduling_conflicts(surgery_data: dict, exclude_id: str = None) -> List[dict]:
+    """Surgeries that overlap on the same OT, surgeon, anesthesiologist or nurse"""
+    require_repo()
     try:
-        if not db:
-            # For development without Firestore, we'll return False
-            return False
-            
-        surgery_datetime = datetime.strptime(f"{surgery_data['surgery_date']} {surgery_data['surgery_time']}", "%Y-%m-%d %H:%M")
-        surgery_end = surgery_datetime + timedelta(minutes=surgery_data['duration_minutes'])
-        
-        # Query existing surgeries for the same OT and date
-        surgeries_ref = db.collection('surgeries')
-        query = surgeries_ref.where('ot_id', '==', surgery_data['ot_id']).where('surgery_date', '==', surgery_data['surgery_date'])
-        
-        if exclude_id:
-            query = query.where('id', '!=', exclude_id)
-        
-        existing_surgeries = query.stream()
-        
-        for surgery_doc in existing_surgeries:
-            existing_surgery = surgery_doc.to_dict()
-            if existing_surgery['status'] == 'cancelled':
-                continue
-                
-            existing_datetime = datetime.strptime(f"{existing_surgery['surgery_date']} {existing_surgery['surgery_time']}", "%Y-%m-%d %H:%M")
-            existing_end = existing_datetime + timedelta(minutes=existing_surgery['duration_minutes'])
-            
-            # Check for overlap
-            if (surgery_datetime < existing_end and surgery_end > existing_datetime):
-                return True
-                
-        return False
+        await load_bookings(surgery_data['surgery_date'])
+        await get_block_calendar()
     except Exception as e:
+        # Never let a booking through unchecked
         print(f"Error checking conflict: {e}")
-        return False
+        raise HTTPException(status_code=503, detail="Could not check the schedule for conflicts")
+    return schedule_conflicts(surgery_data, exclude_id)
+
+# Bookings for a day are serialised twice: in process by a striped lock, so
+# concurrent requests queue instead of retrying, and in the datastore by a
+# transaction that bumps the day's version document, which covers other
+# workers. The version also tells us whether the booking index is current.
+# The same document carries the day board: every booking of the day
+# summarised per OT in start order, so the board view is a single read.
+SCHEDULE_GUARDS = 'schedule_days'
+booking_locks = [asyncio.Lock() for _ in range(int(os.environ.get("BOOKING_LOCK_STRIPES", "64")))]
+
+def refresh_block_rules(guards: dict, find):
+    """Re-read the block rules if a block was saved on these days by a worker
+    whose announcement has not reached this one yet"""
+    versions = {guard.get('block_version') for guard in guards.values()}
+    unseen = [version for version in versions if version and not block_calendar.has_seen(version)]
+    if unseen:
+        for block in find('blocks', []):
+            block_calendar.upsert(block)
+        for version in unseen:
+            block_calendar.saw(version)
+
+async def guarded_booking(store, dates, decide, block_version: Optional[str] = None):
+    """Run ``decide(find)`` against an up-to-date booking index for the given
+    days and commit the (writes, result) it returns atomically with respect to
+    every other booking on those days. ``find`` reads inside the transaction;
+    ``decide`` raises to refuse. Block saves pass ``block_version`` to mark
+    the days' guards."""
+    dates = sorted(set(dates))
+    try:
+        # decide() runs on a worker thread, so the block rules must be in memory first
+        await get_block_calendar()
+    except Exception as e:
+        print(f"Error loading block calendar: {e}")
+        raise HTTPException(status_code=503, detail="Could not check the schedule for conflicts")
+    async with AsyncExitStack() as stack:
+        # Always take stripes in the same order so multi-day bookings can't deadlock
+        for stripe in sorted({hash(date) % len(booking_locks) for date in dates}):
+            await stack.enter_async_context(booking_locks[stripe])
+        
+        def attempt(guards, find):
+            if block_version:
+                for date in dates:
+                    guards[date]['block_version'] = block_version
+            else:
+                refresh_block_rules(guards, find)
+            day_surgeries = {}
+            for date in dates:
+                version = guards[date].get('version', 0)
+                if booking_index.is_current(date, version):
+                    BOOKING_INDEX_LOOKUPS.inc("hit")
+                else:
+                    # Someone else booked since we last looked (or we never did)
+                    BOOKING_INDEX_LOOKUPS.inc("miss")
+                    day_surgeries[date] = find('surgeries', [('surgery_date', '==', date)])
+                    booking_index.load(date, day_surgeries[date], version)
+            writes, result = decide(find)
+            for _, collection, _, data in writes:
+                if collection == 'surgeries' and 'surgery_time' in data:
+                    # Every stored booking carries its numeric start/end
+                    stamp_epoch_fields(data)
+            for date in dates:
+                if 'ots' not in guards[date]:
+                    # First write since boards were introduced (or a rebuild)
+                    surgeries = day_surgeries.get(date)
+                    if surgeries is None:
+                        surgeries = find('surgeries', [('surgery_date', '==', date)])
+                    guards[date].update(date=date, ots=build_board(surgeries))
+            apply_writes({date: guards[date]['ots'] for date in dates}, writes)
+            return writes, (writes, result)
+        
+        (writes, result), versions = await run_db(store.guarded_write, SCHEDULE_GUARDS, dates, attempt)
+        for _, collection, doc_id, data in writes:
+            if collection == 'surgeries':
+                booking_index.upsert(doc_id, data)
+        for date in dates:
+            booking_index.set_version(date, versions[date] + 1)
+        analytics_cache.invalidate(dates)
+        version = resource_versions.bump(surgery_version_keys(dates))
+        publish_invalidation({"kind": "schedule", "dates": dates, "version": version})
+        return result
+
+def conflict_error(conflicts: List[dict]) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail={"message": "Surgery time conflicts with existing schedule", "conflicts": conflicts},
+    )
 
 # API Routes
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    """Always 200 for existing monitors, but says when the datastore is down"""
+    status = await check_readiness()
+    return {
+        "status": "healthy" if status["ready"] else "degraded",
+        "datastore": "connected" if status["ready"] else "unavailable",
+        "timestamp": datetime.now().isoformat(),
+    }
+
+@app.get("/api/health/live")
+async def liveness_check():
+    """The process is up and its event loop responds; never touches storage"""
+    return {"status": "alive", "timestamp": datetime.now().isoformat()}
+
+@app.get("/api/health/ready")
+async def readiness_check():
+    """200 once the datastore answers reads, 503 until then or while it is down"""
+    status = await check_readiness()
+    body = {
+        "status": "ready" if status["ready"] else "unavailable",
+        "backend": STORAGE_BACKEND,
+        "error": status["error"],
+        "checked_at": status["checked_at"],
+    }
+    return JSONResponse(body, status_code=200 if status["ready"] else 503)
 
 # Doctor endpoints
 @app.post("/api/doctors")
 async def create_doctor(doctor: Doctor, current_user: dict = Depends(get_current_user)):
     try:
-        if not db:
-            raise HTTPException(status_code=503, detail="Database service unavailable")
-            
+        store = require_repo()
         doctor_id = str(uuid.uuid4())
         doctor_data = doctor.dict()
         doctor_data['id'] = doctor_id
         doctor_data['created_at'] = datetime.now().isoformat()
         
-        db.collection('doctors').document(doctor_id).set(doctor_data)
+        await run_db(store.set, 'doctors', doctor_id, doctor_data)
+        directory_changed('doctors', doctor_id, doctor_data)
         return {"id": doctor_id, "message": "Doctor created successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/doctors")
-async def get_doctors():
+async def get_doctors(
+    request: Request,
+    ids: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    response_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
     try:
-        if not db:
+        if not repo:
             # Return sample data for development
             return [
                 {
@@ -206,24 +835,54 @@ async def get_doctors():
                 }
             ]
             
-        doctors_ref = db.collection('doctors')
-        doctors = []
-        for doc in doctors_ref.stream():
-            doctor_data = doc.to_dict()
-            doctors.append(doctor_data)
-        return doctors
+        if response_format == "ndjson":
+            return stream_collection('doctors', [], cursor)
+        etag, unchanged = check_etag(request, ['doctors'])
+        if unchanged:
+            return unchanged
+        if ids is not None:
+            # Batch lookup, returned in request order
+            requested = split_ids(ids)
+            if len(requested) > MAX_PAGE_SIZE:
+                raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} ids per request")
+            found = await get_many_cached('doctors', requested)
+            return tagged([found[doc_id] for doc_id in dict.fromkeys(requested) if doc_id in found], etag)
+        if limit is not None or cursor is not None:
+            return tagged(await list_page('doctors', [], limit, cursor), etag)
+        return tagged(await run_db(repo.find, 'doctors'), etag)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/doctors/search")
+async def search_doctors(
+    q: Optional[str] = None,
+    specialization: Optional[str] = None,
+    department: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_RESULTS),
+):
+    try:
+        filters = {field: value for field, value in (('specialization', specialization), ('department', department)) if value}
+        if not (q and q.strip()) and not filters:
+            raise HTTPException(status_code=400, detail="Give q, specialization or department")
+        index = await get_search_index('doctors')
+        return {"items": index.search(q or "", filters, limit, SEARCH_SCAN_LIMIT)}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/doctors/{doctor_id}")
 async def get_doctor(doctor_id: str):
     try:
-        doc_ref = db.collection('doctors').document(doctor_id)
-        doc = doc_ref.get()
-        if doc.exists:
-            return doc.to_dict()
+        doctor_data = await get_cached('doctors', doctor_id)
+        if doctor_data is not None:
+            return doctor_data
         else:
             raise HTTPException(status_code=404, detail="Doctor not found")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -231,18 +890,27 @@ async def get_doctor(doctor_id: str):
 async def update_doctor(doctor_id: str, doctor: Doctor, current_user: dict = Depends(get_current_user)):
     try:
         doctor_data = doctor.dict()
+        doctor_data['id'] = doctor_id
         doctor_data['updated_at'] = datetime.now().isoformat()
         
-        db.collection('doctors').document(doctor_id).update(doctor_data)
+        await run_db(require_repo().update, 'doctors', doctor_id, doctor_data)
+        directory_changed('doctors', doctor_id, doctor_data)
         return {"message": "Doctor updated successfully"}
+    except HTTPException:
+        raise
+    except DocumentNotFound:
+        raise HTTPException(status_code=404, detail="Doctor not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/doctors/{doctor_id}")
 async def delete_doctor(doctor_id: str, current_user: dict = Depends(get_current_user)):
     try:
-        db.collection('doctors').document(doctor_id).delete()
+        await run_db(require_repo().delete, 'doctors', doctor_id)
+        directory_changed('doctors', doctor_id, None)
         return {"message": "Doctor deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -250,20 +918,30 @@ async def delete_doctor(doctor_id: str, current_user: dict = Depends(get_current
 @app.post("/api/patients")
 async def create_patient(patient: Patient, current_user: dict = Depends(get_current_user)):
     try:
+        store = require_repo()
         patient_id = str(uuid.uuid4())
         patient_data = patient.dict()
         patient_data['id'] = patient_id
         patient_data['created_at'] = datetime.now().isoformat()
         
-        db.collection('patients').document(patient_id).set(patient_data)
+        await run_db(store.set, 'patients', patient_id, patient_data)
+        directory_changed('patients', patient_id, patient_data)
         return {"id": patient_id, "message": "Patient created successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/patients")
-async def get_patients():
+async def get_patients(
+    request: Request,
+    ids: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    response_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
     try:
-        if not db:
+        if not repo:
             # Return sample data for development
             return [
                 {
@@ -298,24 +976,53 @@ async def get_patients():
                 }
             ]
             
-        patients_ref = db.collection('patients')
-        patients = []
-        for doc in patients_ref.stream():
-            patient_data = doc.to_dict()
-            patients.append(patient_data)
-        return patients
+        if response_format == "ndjson":
+            return stream_collection('patients', [], cursor)
+        etag, unchanged = check_etag(request, ['patients'])
+        if unchanged:
+            return unchanged
+        if ids is not None:
+            # Batch lookup, returned in request order
+            requested = split_ids(ids)
+            if len(requested) > MAX_PAGE_SIZE:
+                raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} ids per request")
+            found = await get_many_cached('patients', requested)
+            return tagged([found[doc_id] for doc_id in dict.fromkeys(requested) if doc_id in found], etag)
+        if limit is not None or cursor is not None:
+            return tagged(await list_page('patients', [], limit, cursor), etag)
+        return tagged(await run_db(repo.find, 'patients'), etag)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/patients/search")
+async def search_patients(
+    q: Optional[str] = None,
+    mrn: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_RESULTS),
+):
+    try:
+        filters = {'medical_record_number': mrn} if mrn else {}
+        if not (q and q.strip()) and not filters:
+            raise HTTPException(status_code=400, detail="Give q or mrn")
+        index = await get_search_index('patients')
+        return {"items": index.search(q or "", filters, limit, SEARCH_SCAN_LIMIT)}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/patients/{patient_id}")
 async def get_patient(patient_id: str):
     try:
-        doc_ref = db.collection('patients').document(patient_id)
-        doc = doc_ref.get()
-        if doc.exists:
-            return doc.to_dict()
+        patient_data = await get_cached('patients', patient_id)
+        if patient_data is not None:
+            return patient_data
         else:
             raise HTTPException(status_code=404, detail="Patient not found")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -323,18 +1030,27 @@ async def get_patient(patient_id: str):
 async def update_patient(patient_id: str, patient: Patient, current_user: dict = Depends(get_current_user)):
     try:
         patient_data = patient.dict()
+        patient_data['id'] = patient_id
         patient_data['updated_at'] = datetime.now().isoformat()
         
-        db.collection('patients').document(patient_id).update(patient_data)
+        await run_db(require_repo().update, 'patients', patient_id, patient_data)
+        directory_changed('patients', patient_id, patient_data)
         return {"message": "Patient updated successfully"}
+    except HTTPException:
+        raise
+    except DocumentNotFound:
+        raise HTTPException(status_code=404, detail="Patient not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/patients/{patient_id}")
 async def delete_patient(patient_id: str, current_user: dict = Depends(get_current_user)):
     try:
-        db.collection('patients').document(patient_id).delete()
+        await run_db(require_repo().delete, 'patients', patient_id)
+        directory_changed('patients', patient_id, None)
         return {"message": "Patient deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -342,16 +1058,18 @@ async def delete_patient(patient_id: str, current_user: dict = Depends(get_curre
 @app.post("/api/surgeries")
 async def create_surgery(surgery: Surgery, current_user: dict = Depends(get_current_user)):
     try:
+        store = require_repo()
         surgery_id = str(uuid.uuid4())
         surgery_data = surgery.dict()
         surgery_data['id'] = surgery_id
         surgery_data['created_at'] = datetime.now().isoformat()
         
-        # Check for conflicts
-        if check_scheduling_conflict(surgery_data):
-            raise HTTPException(status_code=409, detail="Surgery time conflicts with existing schedule")
-        
-        db.collection('surgeries').document(surgery_id).set(surgery_data)
+        def decide(find):
+            # Check for conflicts on the OT and on every staff member involved
+            conflicts = schedule_conflicts(surgery_data)
+            if conflicts:
+                raise conflict_error(conflicts)
+            return [('set', 'surgeries', surgery_id, surgery_data)], None
         
         # Log the action
         log_data = {
@@ -361,7 +1079,8 @@ async def create_surgery(surgery: Surgery, current_user: dict = Depends(get_curr
             "timestamp": datetime.now().isoformat(),
             "details": f"Surgery scheduled for {surgery_data['surgery_date']} at {surgery_data['surgery_time']}"
         }
-        db.collection('logs').add(log_data)
+        await guarded_booking(store, [surgery_data['surgery_date']], decide)
+        audit_log.submit(log_data)
         
         return {"id": surgery_id, "message": "Surgery scheduled successfully"}
     except HTTPException:
@@ -369,6 +1088,113 @@ async def create_surgery(surgery: Surgery, current_user: dict = Depends(get_curr
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/surgeries/bulk")
+async def create_surgeries_bulk(surgeries: List[Surgery], current_user: dict = Depends(get_current_user)):
+    """Schedule many surgeries at once, reporting accept/reject per row"""
+    try:
+        store = require_repo()
+        if len(surgeries) > MAX_BULK_SURGERIES:
+            raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_SURGERIES} surgeries per request")
+        
+        now = datetime.now().isoformat()
+        rows = []
+        for surgery in surgeries:
+            surgery_data = surgery.dict()
+            surgery_data['id'] = str(uuid.uuid4())
+            surgery_data['created_at'] = now
+            rows.append(surgery_data)
+        row_of = {surgery_data['id']: index for index, surgery_data in enumerate(rows)}
+        
+        dates = {surgery_data['surgery_date'] for surgery_data in rows}
+        order = sorted(range(len(rows)), key=lambda i: (rows[i]['surgery_date'], time_to_minutes(rows[i]['surgery_time']), i))
+        
+        # A guarded write commits the accepted rows plus one guard document
+        # per day in one transaction, which Firestore caps at
+        # FIRESTORE_BATCH_LIMIT writes; larger requests go in several
+        # chunks, in start order, each committed atomically
+        chunks, chunk, chunk_dates = [], [], set()
+        for index in order:
+            date = rows[index]['surgery_date']
+            if len(chunk) + len(chunk_dates) + (date not in chunk_dates) + 1 > FIRESTORE_BATCH_LIMIT:
+                chunks.append(chunk)
+                chunk, chunk_dates = [], set()
+            chunk.append(index)
+            chunk_dates.add(date)
+        if chunk:
+            chunks.append(chunk)
+        
+        results = [None] * len(rows)
+        accepted = []
+        
+        def decide_chunk(chunk):
+            def decide(find):
+                # Sweep the rows in start order: a row is rejected if it overlaps an
+                # existing booking or a row accepted before it on any shared resource
+                accepted_index = BookingIndex(ttl_seconds=float("inf"))
+                for date in dates:
+                    accepted_index.load(date, [])
+                for surgery_data in accepted:
+                    accepted_index.upsert(surgery_data['id'], surgery_data)
+                chunk_results = {}
+                for index in chunk:
+                    sweep(index, accepted_index, chunk_results)
+                chunk_accepted = [rows[index] for index, result in chunk_results.items() if result['status'] == 'accepted']
+                writes = [('set', 'surgeries', surgery_data['id'], surgery_data) for surgery_data in chunk_accepted]
+                return writes, (chunk_results, chunk_accepted)
+            return decide
+        
+        def sweep(index, accepted_index, results):
+            surgery_data = rows[index]
+            if surgery_data['status'] == 'cancelled':
+                results[index] = {"index": index, "status": "accepted", "id": surgery_data['id']}
+                return
+            # Rows committed by earlier chunks are in the booking index by now;
+            # they are reported as clashes within the batch below
+            existing = [conflict for conflict in schedule_conflicts(surgery_data) if conflict.get('surgery_id') not in row_of]
+            in_batch = accepted_index.conflicts(surgery_data)
+            if existing:
+                results[index] = {
+                    "index": index,
+                    "status": "rejected",
+                    "reason": "Surgery time conflicts with existing schedule",
+                    "conflicts": existing,
+                }
+            elif in_batch:
+                clashes = describe_conflicts(in_batch)
+                for clash in clashes:
+                    clash['row'] = row_of[clash.pop('surgery_id')]
+                results[index] = {
+                    "index": index,
+                    "status": "rejected",
+                    "reason": "Surgery time conflicts with other rows in this batch",
+                    "conflicts": clashes,
+                }
+            else:
+                results[index] = {"index": index, "status": "accepted", "id": surgery_data['id']}
+                accepted_index.upsert(surgery_data['id'], surgery_data)
+        
+        for chunk in chunks:
+            chunk_results, chunk_accepted = await guarded_booking(
+                store, {rows[index]['surgery_date'] for index in chunk}, decide_chunk(chunk)
+            )
+            for index, result in chunk_results.items():
+                results[index] = result
+            accepted.extend(chunk_accepted)
+        for surgery_data in accepted:
+            audit_log.submit({
+                "action": "surgery_created",
+                "surgery_id": surgery_data['id'],
+                "user_id": current_user.get("uid", "unknown"),
+                "timestamp": now,
+                "details": f"Surgery scheduled for {surgery_data['surgery_date']} at {surgery_data['surgery_time']} (bulk import)"
+            })
+        
+        return {"accepted": len(accepted), "rejected": len(rows) - len(accepted), "results": results}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/surgeries/check-conflict")
 async def check_conflict(conflict_check: ConflictCheck):
     try:
@@ -376,18 +1202,34 @@ async def check_conflict(conflict_check: ConflictCheck):
             "surgery_date": conflict_check.surgery_date,
             "surgery_time": conflict_check.surgery_time,
             "ot_id": conflict_check.ot_id,
-            "duration_minutes": conflict_check.duration_minutes
+            "duration_minutes": conflict_check.duration_minutes,
+            "doctor_id": conflict_check.doctor_id,
+            "anesthesiologist": conflict_check.anesthesiologist,
+            "nurses": conflict_check.nurses,
         }
         
-        has_conflict = check_scheduling_conflict(surgery_data, conflict_check.exclude_surgery_id)
-        return {"has_conflict": has_conflict}
+        conflicts = await find_scheduling_conflicts(surgery_data, conflict_check.exclude_surgery_id)
+        return {"has_conflict": bool(conflicts), "conflicts": conflicts}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/surgeries")
-async def get_surgeries(date: Optional[str] = None, ot_id: Optional[str] = None):
+async def get_surgeries(
+    request: Request,
+    date: Optional[str] = None,
+    ot_id: Optional[str] = None,
+    starts_from: Optional[str] = None,
+    starts_before: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    response_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    expand: Optional[str] = None,
+):
     try:
-        if not db:
+        expand_fields = parse_expand(expand)
+        if not repo:
             # Return sample data for development
             today = datetime.now().date().isoformat()
             return [
@@ -435,47 +1277,106 @@ async def get_surgeries(date: Optional[str] = None, ot_id: Optional[str] = None)
                 }
             ]
             
-        surgeries_ref = db.collection('surgeries')
-        
+        filters = []
         if date:
-            surgeries_ref = surgeries_ref.where('surgery_date', '==', date)
+            filters.append(('surgery_date', '==', date))
         if ot_id:
-            surgeries_ref = surgeries_ref.where('ot_id', '==', ot_id)
+            filters.append(('ot_id', '==', ot_id))
+        # Time windows are numeric range filters on the indexed start_epoch_min
+        order_by = None
+        if starts_from:
+            filters.append(('start_epoch_min', '>=', parse_epoch_minutes(starts_from)))
+        if starts_before:
+            filters.append(('start_epoch_min', '<', parse_epoch_minutes(starts_before)))
+        if starts_from or starts_before:
+            order_by = START_ORDERING
+            
+        if response_format == "ndjson":
+            return stream_collection('surgeries', filters, cursor, expand_fields, order_by)
+        # One day's listing only changes with that day's bookings
+        keys = [f"surgeries:{date}"] if date else ['surgeries']
+        keys += [SURGERY_EXPANSIONS[field][0] for field in expand_fields]
+        etag, unchanged = check_etag(request, keys)
+        if unchanged:
+            return unchanged
+        if limit is not None or cursor is not None:
+            return tagged(await list_page('surgeries', filters, limit, cursor, expand_fields, order_by), etag)
             
-        surgeries = []
-        for doc in surgeries_ref.stream():
-            surgery_data = doc.to_dict()
-            surgeries.append(surgery_data)
+        surgeries = await run_db(repo.find, 'surgeries', filters)
             
         # Sort by date and time
-        surgeries.sort(key=lambda x: f"{x['surgery_date']} {x['surgery_time']}")
-        return surgeries
+        surgeries.sort(key=lambda x: (x['surgery_date'], x['surgery_time']))
+        if expand_fields:
+            await expand_surgeries(surgeries, expand_fields)
+        return tagged(surgeries, etag)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/surgeries/stream")
+async def stream_surgeries(request: Request, date: str, ot_id: Optional[str] = None):
+    """Server-Sent Events feed of a day's schedule: a snapshot, then deltas"""
+    require_repo()
+    key = (date, ot_id)
+    subscriber = await schedule_hub.subscribe(key)
+    
+    async def events():
+        try:
+            while True:
+                if subscriber.overflowed:
+                    yield "event: reset\ndata: {\"type\": \"reset\"}\n\n"
+                    break
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            schedule_hub.unsubscribe(key, subscriber)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.get("/api/surgeries/{surgery_id}")
-async def get_surgery(surgery_id: str):
+async def get_surgery(surgery_id: str, expand: Optional[str] = None):
     try:
-        doc_ref = db.collection('surgeries').document(surgery_id)
-        doc = doc_ref.get()
-        if doc.exists:
-            return doc.to_dict()
+        expand_fields = parse_expand(expand)
+        surgery_data = await run_db(require_repo().get, 'surgeries', surgery_id)
+        if surgery_data is not None:
+            if expand_fields:
+                await expand_surgeries([surgery_data], expand_fields)
+            return surgery_data
         else:
             raise HTTPException(status_code=404, detail="Surgery not found")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/surgeries/{surgery_id}")
 async def update_surgery(surgery_id: str, surgery: Surgery, current_user: dict = Depends(get_current_user)):
     try:
+        store = require_repo()
         surgery_data = surgery.dict()
+        surgery_data['id'] = surgery_id
         surgery_data['updated_at'] = datetime.now().isoformat()
+        current = await run_db(store.get, 'surgeries', surgery_id)
+        if current is None:
+            raise DocumentNotFound(surgery_id)
         
-        # Check for conflicts (excluding current surgery)
-        if check_scheduling_conflict(surgery_data, surgery_id):
-            raise HTTPException(status_code=409, detail="Surgery time conflicts with existing schedule")
-        
-        db.collection('surgeries').document(surgery_id).update(surgery_data)
+        def decide(find):
+            # Check for conflicts (excluding current surgery)
+            conflicts = schedule_conflicts(surgery_data, surgery_id)
+            if conflicts:
+                raise conflict_error(conflicts)
+            return [('update', 'surgeries', surgery_id, surgery_data)], None
         
         # Log the action
         log_data = {
@@ -485,22 +1386,27 @@ async def update_surgery(surgery_id: str, surgery: Surgery, current_user: dict =
             "timestamp": datetime.now().isoformat(),
             "details": f"Surgery updated for {surgery_data['surgery_date']} at {surgery_data['surgery_time']}"
         }
-        db.collection('logs').add(log_data)
+        # Guard the old day too, in case the surgery moves between days
+        await guarded_booking(store, [current['surgery_date'], surgery_data['surgery_date']], decide)
+        audit_log.submit(log_data)
         
         return {"message": "Surgery updated successfully"}
     except HTTPException:
         raise
+    except DocumentNotFound:
+        raise HTTPException(status_code=404, detail="Surgery not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/api/surgeries/{surgery_id}")
 async def delete_surgery(surgery_id: str, current_user: dict = Depends(get_current_user)):
     try:
+        store = require_repo()
         # Instead of deleting, mark as cancelled
-        db.collection('surgeries').document(surgery_id).update({
+        cancel_data = {
             "status": "cancelled",
             "cancelled_at": datetime.now().isoformat()
-        })
+        }
         
         # Log the action
         log_data = {
@@ -509,9 +1415,17 @@ async def delete_surgery(surgery_id: str, current_user: dict = Depends(get_curre
             "user_id": current_user.get("uid", "unknown"),
             "timestamp": datetime.now().isoformat()
         }
-        db.collection('logs').add(log_data)
+        current = await run_db(store.get, 'surgeries', surgery_id)
+        if current is None:
+            raise DocumentNotFound(surgery_id)
+        await guarded_booking(store, [current['surgery_date']], lambda find: ([('update', 'surgeries', surgery_id, cancel_data)], None))
+        audit_log.submit(log_data)
         
         return {"message": "Surgery cancelled successfully"}
+    except HTTPException:
+        raise
+    except DocumentNotFound:
+        raise HTTPException(status_code=404, detail="Surgery not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -519,18 +1433,30 @@ async def delete_surgery(surgery_id: str, current_user: dict = Depends(get_curre
 @app.post("/api/surgeries/emergency")
 async def schedule_emergency_surgery(surgery: Surgery, current_user: dict = Depends(get_current_user)):
     try:
+        store = require_repo()
         surgery_id = str(uuid.uuid4())
         surgery_data = surgery.dict()
         surgery_data['id'] = surgery_id
         surgery_data['is_emergency'] = True
         surgery_data['created_at'] = datetime.now().isoformat()
         
-        # For emergency surgeries, we still check conflicts but with priority handling
-        if check_scheduling_conflict(surgery_data):
-            # Emergency surgery takes priority - we'll flag this for manual resolution
-            surgery_data['needs_manual_resolution'] = True
+        def decide(find):
+            surgery_data.pop('needs_manual_resolution', None)
+            surgery_data.pop('conflicts', None)
+            # For emergency surgeries, we still check conflicts but with priority handling
+            conflicts = schedule_conflicts(surgery_data)
+            if conflicts:
+                # Emergency surgery takes priority - we'll flag this for manual resolution
+                surgery_data['needs_manual_resolution'] = True
+                surgery_data['conflicts'] = conflicts
+            return [('set', 'surgeries', surgery_id, surgery_data)], conflicts
         
-        db.collection('surgeries').document(surgery_id).set(surgery_data)
+        conflicts = await guarded_booking(store, [surgery_data['surgery_date']], decide)
+        proposed_plan = None
+        if conflicts:
+            proposed_plan = await propose_emergency_plan(surgery_data, DEFAULT_DAY_START, DEFAULT_DAY_END, EMERGENCY_PLAN_BUDGET_MS)
+            # Applying the plan moves this booking rather than adding another
+            proposed_plan['surgery_id'] = surgery_id
         
         # Log the emergency action
         log_data = {
@@ -540,75 +1466,695 @@ async def schedule_emergency_surgery(surgery: Surgery, current_user: dict = Depe
             "timestamp": datetime.now().isoformat(),
             "details": f"Emergency surgery scheduled for {surgery_data['surgery_date']} at {surgery_data['surgery_time']}"
         }
-        db.collection('logs').add(log_data)
+        audit_log.submit(log_data)
+        
+        return {
+            "id": surgery_id,
+            "message": "Emergency surgery scheduled",
+            "needs_manual_resolution": surgery_data.get('needs_manual_resolution', False),
+            "conflicts": conflicts,
+            "proposed_plan": proposed_plan,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def propose_emergency_plan(surgery_data: dict, day_start: str, day_end: str, budget_ms: float) -> dict:
+    """Run the preemption solver over the emergency's day"""
+    start, end = parse_operating_hours(day_start, day_end, surgery_data['duration_minutes'], 1)
+    day = await run_db(repo.find, 'surgeries', [('surgery_date', '==', surgery_data['surgery_date'])])
+    # An emergency that is already saved must not block its own placement
+    day = [s for s in day if s['id'] != surgery_data.get('id')]
+    calendar = await get_block_calendar()
+    plan_date = date_type.fromisoformat(surgery_data['surgery_date'])
+    held = {
+        ot_id: [(window_start, window_end, block.get('doctor_id')) for window_start, window_end, block in calendar.windows(ot_id, plan_date)]
+        for ot_id in OT_IDS
+    }
+    # Solve off the event loop; the budget bounds how long the thread is busy
+    return await run_db(plan_emergency, day, surgery_data, OT_IDS, start, end, budget_ms, held)
+
+@app.post("/api/surgeries/emergency/plan")
+async def plan_emergency_surgery(
+    surgery: Surgery,
+    day_start: str = DEFAULT_DAY_START,
+    day_end: str = DEFAULT_DAY_END,
+    budget_ms: float = EMERGENCY_PLAN_BUDGET_MS,
+):
+    """Earliest slot for an emergency across all OTs, or the fewest elective moves that make room"""
+    try:
+        require_repo()
+        if not 0 < budget_ms <= MAX_EMERGENCY_PLAN_BUDGET_MS:
+            raise HTTPException(status_code=400, detail=f"budget_ms must be between 0 and {MAX_EMERGENCY_PLAN_BUDGET_MS}")
+        return await propose_emergency_plan(surgery.dict(), day_start, day_end, budget_ms)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/surgeries/emergency/apply")
+async def apply_emergency_plan(plan: EmergencyPlan, current_user: dict = Depends(get_current_user)):
+    """Book the emergency (or move the one already saved as ``surgery_id``) and
+    the planned electives in one batch, if the plan still holds"""
+    try:
+        store = require_repo()
+        date = plan.surgery.surgery_date
+        now = datetime.now().isoformat()
+        surgery_id = plan.surgery_id or str(uuid.uuid4())
+        surgery_data = plan.surgery.dict()
+        surgery_data.update(id=surgery_id, ot_id=plan.ot_id, surgery_time=plan.surgery_time, is_emergency=True, created_at=now)
+        
+        def decide(find):
+            day = {s['id']: s for s in find('surgeries', [('surgery_date', '==', date)])}
+            if plan.surgery_id:
+                saved = day.get(surgery_id)
+                if saved is None or saved.get('status') == 'cancelled':
+                    raise HTTPException(status_code=404, detail="Emergency surgery not found on the plan's day")
+                emergency = stamp_epoch_fields(dict(
+                    saved, ot_id=plan.ot_id, surgery_time=plan.surgery_time,
+                    needs_manual_resolution=False, conflicts=[], rescheduled_at=now,
+                ))
+                writes = [('update', 'surgeries', surgery_id, emergency)]
+            else:
+                emergency = surgery_data
+                writes = [('set', 'surgeries', surgery_id, surgery_data)]
+            # The plan was computed against an earlier read; refuse it if anything it moves has changed
+            for move in plan.moves:
+                moved = day.get(move.surgery_id)
+                if moved is None or moved.get('status') == 'cancelled' \
+                        or (moved['ot_id'], moved['surgery_time']) != (move.previous_ot_id, move.previous_time):
+                    raise HTTPException(status_code=409, detail="Plan is out of date, request a new one")
+                day[move.surgery_id] = stamp_epoch_fields(
+                    dict(moved, ot_id=move.ot_id, surgery_time=move.surgery_time, rescheduled_at=now, rescheduled_for=surgery_id)
+                )
+                writes.append(('update', 'surgeries', move.surgery_id, day[move.surgery_id]))
+            day[surgery_id] = emergency
+            
+            # Check the day as it will look after the plan is applied
+            planned_index = BookingIndex(ttl_seconds=float("inf"))
+            planned_index.load(date, day.values())
+            for _, _, touched_id, _ in writes:
+                conflicts = describe_conflicts(planned_index.conflicts(day[touched_id], touched_id)) + block_calendar.conflicts(day[touched_id])
+                if conflicts:
+                    raise HTTPException(
+                        status_code=409,
+                        detail={"message": "Plan is out of date, request a new one", "conflicts": conflicts},
+                    )
+            return writes, None
+        
+        await guarded_booking(store, [date], decide)
+        
+        user_id = current_user.get("uid", "unknown")
+        audit_log.submit({
+            "action": "surgery_rescheduled" if plan.surgery_id else "emergency_surgery_scheduled",
+            "surgery_id": surgery_id,
+            "user_id": user_id,
+            "timestamp": now,
+            "details": f"Emergency surgery scheduled for {date} at {plan.surgery_time} in OT {plan.ot_id} ({len(plan.moves)} surgeries moved)"
+        })
+        for move in plan.moves:
+            audit_log.submit({
+                "action": "surgery_rescheduled",
+                "surgery_id": move.surgery_id,
+                "user_id": user_id,
+                "timestamp": now,
+                "details": f"Moved from OT {move.previous_ot_id} at {move.previous_time} to OT {move.ot_id} at {move.surgery_time} for emergency {surgery_id}"
+            })
         
-        return {"id": surgery_id, "message": "Emergency surgery scheduled", "needs_manual_resolution": surgery_data.get('needs_manual_resolution', False)}
+        return {"id": surgery_id, "message": "Emergency surgery scheduled", "moved": len(plan.moves)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def day_availability(
+    surgeries: list, day_start: int, day_end: int, slot_minutes: int, step_minutes: int, blocks=(), doctor_id: str = None
+) -> dict:
+    """Booked, free and bookable slots for one OT on one day. ``blocks`` are
+    the day's (start, end, block) windows; those held by anyone but
+    doctor_id are not bookable"""
+    booked = []
+    for surgery_data in surgeries:
+        if surgery_data['status'] != 'cancelled':
+            start, end = surgery_span(surgery_data)
+            # Back to minutes since midnight; days start on multiples of MINUTES_PER_DAY
+            offset = start - start % MINUTES_PER_DAY
+            booked.append((start - offset, end - offset, surgery_data['id']))
+    booked.sort()
+    
+    busy = [(start, end) for start, end, _ in booked]
+    busy += [(start, end) for start, end, block in blocks if block.get('doctor_id') != doctor_id]
+    free = free_intervals(merge_intervals(busy), day_start, day_end)
+    slots = available_slots(free, day_start, slot_minutes, step_minutes)
+    return {
+        "available_slots": [{"start": minutes_to_time(start), "end": minutes_to_time(end)} for start, end in slots],
+        "booked_slots": [
+            {"start": minutes_to_time(start), "end": minutes_to_time(end), "surgery_id": surgery_id}
+            for start, end, surgery_id in booked
+        ],
+        "blocked_slots": [
+            {"start": minutes_to_time(start), "end": minutes_to_time(end), "block_id": block['id'], "doctor_id": block.get('doctor_id')}
+            for start, end, block in blocks
+        ],
+        "free_intervals": [{"start": minutes_to_time(start), "end": minutes_to_time(end)} for start, end in free],
+    }
+
+def parse_operating_hours(day_start: str, day_end: str, slot_minutes: int, step_minutes: int) -> tuple:
+    try:
+        start, end = time_to_minutes(day_start), time_to_minutes(day_end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Operating hours must be HH:MM")
+    if not 0 <= start < end <= 24 * 60:
+        raise HTTPException(status_code=400, detail="day_start must be before day_end")
+    if slot_minutes <= 0 or step_minutes <= 0:
+        raise HTTPException(status_code=400, detail="Slot length and granularity must be positive")
+    return start, end
+
+@app.get("/api/ots/board")
+async def get_day_board(request: Request, date: str):
+    """Every booking of a day grouped by OT in start order, from one document read"""
+    try:
+        store = require_repo()
+        etag, unchanged = check_etag(request, [f"surgeries:{date}"])
+        if unchanged:
+            return unchanged
+        board = await run_db(store.get, SCHEDULE_GUARDS, date)
+        if board is None or 'ots' not in board:
+            # Nothing booked through the API yet; build it from the raw surgeries
+            surgeries = await run_db(store.find, 'surgeries', [('surgery_date', '==', date)])
+            board = {"date": date, "version": (board or {}).get('version', 0), "ots": build_board(surgeries)}
+        return tagged(board, etag)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Get available time slots across many OTs and days
+@app.get("/api/ots/available-slots")
+async def get_available_slots_range(
+    request: Request,
+    from_date: str = Query(..., alias="from"),
+    to_date: str = Query(..., alias="to"),
+    ot_ids: Optional[str] = None,
+    day_start: str = DEFAULT_DAY_START,
+    day_end: str = DEFAULT_DAY_END,
+    slot_minutes: int = 120,
+    step_minutes: int = 60,
+    doctor_id: Optional[str] = None,
+):
+    """Bookable slots per OT and day; with doctor_id, that surgeon's own blocks count as free"""
+    try:
+        store = require_repo()
+        start, end = parse_operating_hours(day_start, day_end, slot_minutes, step_minutes)
+        try:
+            first, last = date_type.fromisoformat(from_date), date_type.fromisoformat(to_date)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+        days = (last - first).days + 1
+        if days < 1 or days > MAX_AVAILABILITY_DAYS:
+            raise HTTPException(status_code=400, detail=f"Date range must cover 1 to {MAX_AVAILABILITY_DAYS} days")
+        ots = [ot.strip() for ot in ot_ids.split(",") if ot.strip()] if ot_ids else OT_IDS
+        dates = [(first + timedelta(days=offset)).isoformat() for offset in range(days)]
+        etag, unchanged = check_etag(request, ['blocks'] + [f"surgeries:{date}" for date in dates])
+        if unchanged:
+            return unchanged
+        calendar = await get_block_calendar()
+        
+        # One query for the whole range, then bucket by (ot_id, date)
+        filters = [('surgery_date', '>=', first.isoformat()), ('surgery_date', '<=', last.isoformat())]
+        buckets = {}
+        for surgery_data in await run_db(store.find, 'surgeries', filters):
+            buckets.setdefault((surgery_data['ot_id'], surgery_data['surgery_date']), []).append(surgery_data)
+        
+        return tagged({
+            "from": dates[0],
+            "to": dates[-1],
+            "slot_minutes": slot_minutes,
+            "ots": {
+                ot: {
+                    day.isoformat(): day_availability(
+                        buckets.get((ot, day.isoformat()), []), start, end, slot_minutes, step_minutes,
+                        calendar.windows(ot, day), doctor_id,
+                    )
+                    for day in (first + timedelta(days=offset) for offset in range(days))
+                }
+                for ot in ots
+            },
+        }, etag)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Get available time slots for a specific date and OT
 @app.get("/api/ots/{ot_id}/available-slots")
-async def get_available_slots(ot_id: str, date: str):
+async def get_available_slots(
+    request: Request,
+    ot_id: str,
+    date: str,
+    day_start: str = DEFAULT_DAY_START,
+    day_end: str = DEFAULT_DAY_END,
+    slot_minutes: int = 120,
+    step_minutes: int = 60,
+    doctor_id: Optional[str] = None,
+):
     try:
+        start, end = parse_operating_hours(day_start, day_end, slot_minutes, step_minutes)
+        try:
+            day = date_type.fromisoformat(date)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Date must be YYYY-MM-DD")
+        store = require_repo()
+        etag, unchanged = check_etag(request, ['blocks', f"surgeries:{date}"])
+        if unchanged:
+            return unchanged
+        calendar = await get_block_calendar()
         # Get all surgeries for the OT on the given date
-        surgeries_ref = db.collection('surgeries')
-        surgeries = surgeries_ref.where('ot_id', '==', ot_id).where('surgery_date', '==', date).stream()
-        
-        booked_slots = []
-        for surgery_doc in surgeries:
-            surgery_data = surgery_doc.to_dict()
-            if surgery_data['status'] != 'cancelled':
-                start_time = datetime.strptime(surgery_data['surgery_time'], "%H:%M")
-                end_time = start_time + timedelta(minutes=surgery_data['duration_minutes'])
-                booked_slots.append({
-                    "start": start_time.strftime("%H:%M"),
-                    "end": end_time.strftime("%H:%M"),
-                    "surgery_id": surgery_data['id']
-                })
-        
-        # Calculate available slots (assuming OT operates 8 AM to 8 PM)
-        available_slots = []
-        current_time = datetime.strptime("08:00", "%H:%M")
-        end_of_day = datetime.strptime("20:00", "%H:%M")
-        
-        while current_time < end_of_day:
-            slot_end = current_time + timedelta(hours=2)  # 2-hour slots
-            
-            # Check if this slot conflicts with any booked slot
-            is_available = True
-            for booked in booked_slots:
-                booked_start = datetime.strptime(booked['start'], "%H:%M")
-                booked_end = datetime.strptime(booked['end'], "%H:%M")
-                
-                if (current_time < booked_end and slot_end > booked_start):
-                    is_available = False
-                    break
-            
-            if is_available:
-                available_slots.append({
-                    "start": current_time.strftime("%H:%M"),
-                    "end": slot_end.strftime("%H:%M")
-                })
-            
-            current_time += timedelta(hours=1)  # Move to next hour
+        filters = [('ot_id', '==', ot_id), ('surgery_date', '==', date)]
+        surgeries = await run_db(store.find, 'surgeries', filters)
+        availability = day_availability(surgeries, start, end, slot_minutes, step_minutes, calendar.windows(ot_id, day), doctor_id)
+        return tagged(availability, etag)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Recurring OT blocks. Only the rule is stored; occurrences are worked out
+# from it for whichever dates a request or a booking touches. Saving a block
+# takes the schedule guard of each day it covers this many days ahead, all
+# in one transaction; bookings further out are only checked before the write
+BLOCK_GUARD_DAYS = min(int(os.environ.get("BLOCK_GUARD_DAYS", "366")), FIRESTORE_BATCH_LIMIT - 1)
+
+def block_clashes(block_data: dict, surgeries: List[dict]) -> List[dict]:
+    """Bookings by other surgeons inside the block's windows"""
+    rule = BlockCalendar()
+    rule.install([block_data])
+    clashes = []
+    for surgery_data in surgeries:
+        for conflict in rule.conflicts(surgery_data):
+            clashes.append({"surgery_id": surgery_data['id'], "date": conflict['date'], "doctor_id": surgery_data.get('doctor_id')})
+    return clashes
+
+def block_clash_error(clashes: List[dict]) -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail={"message": "Block overlaps surgeries already booked for other surgeons", "conflicts": clashes},
+    )
+
+async def save_block(store, block_id: str, block: Block, operation: str) -> dict:
+    block_data = block.dict()
+    block_data['id'] = block_id
+    problem = validate_block(block_data)
+    if problem:
+        raise HTTPException(status_code=400, detail=problem)
+    calendar = await get_block_calendar()
+    previous = calendar.get(block_id)
+    # Bookings on this worker that decide from now on already see the block,
+    # and taking every booking lock once lets those deciding without it finish
+    calendar.upsert(block_data)
+    try:
+        async with AsyncExitStack() as stack:
+            for lock in booking_locks:
+                await stack.enter_async_context(lock)
+        # Days already gone keep whatever was booked there, so a block that is
+        # already running can still be edited
+        today = date_type.today()
+        filters = [('ot_id', '==', block_data['ot_id']), ('surgery_date', '>=', max(block_data['starts_on'], today.isoformat()))]
+        if block_data.get('ends_on'):
+            filters.append(('surgery_date', '<=', block_data['ends_on']))
+        surgeries = await run_db(store.find, 'surgeries', filters)
+        clashes = block_clashes(block_data, surgeries)
+        if clashes:
+            raise block_clash_error(clashes)
+        
+        # The block is re-checked and written under the schedule guards of
+        # every day it covers within the horizon (and the day before, whose
+        # late cases can run into it). A booking there by another worker
+        # either commits first and is seen here, or is retried after us and
+        # finds the version mark, which makes it re-read the block rules
+        horizon = today + timedelta(days=BLOCK_GUARD_DAYS - 1)
+        guarded = set()
+        for day in occurrences(block_data, today, horizon):
+            guarded.add(day.isoformat())
+            if day > today:
+                guarded.add((day - timedelta(days=1)).isoformat())
+        dates = sorted(guarded)
+        version = uuid.uuid4().hex
+        
+        def decide(find):
+            if dates:
+                filters = [('ot_id', '==', block_data['ot_id']), ('surgery_date', '>=', dates[0]), ('surgery_date', '<=', dates[-1])]
+                clashes = block_clashes(block_data, find('surgeries', filters))
+                if clashes:
+                    raise block_clash_error(clashes)
+            return [(operation, 'blocks', block_id, block_data)], None
         
-        return {"available_slots": available_slots, "booked_slots": booked_slots}
+        await guarded_booking(store, dates, decide, block_version=version)
+    except BaseException:
+        if previous is None:
+            calendar.remove(block_id)
+        else:
+            calendar.upsert(previous)
+        raise
+    block_changed(block_id, block_data, version)
+    return block_data
+
+def describe_block(block_data: dict) -> dict:
+    return dict(block_data, rule=describe_rule(block_data))
+
+@app.post("/api/blocks")
+async def create_block(block: Block, current_user: dict = Depends(get_current_user)):
+    try:
+        store = require_repo()
+        block_data = await save_block(store, str(uuid.uuid4()), block, 'set')
+        return {"id": block_data['id'], "rule": describe_rule(block_data), "message": "Block created successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Logs endpoint
+@app.get("/api/blocks")
+async def get_blocks(request: Request, ot_id: Optional[str] = None, doctor_id: Optional[str] = None):
+    try:
+        etag, unchanged = check_etag(request, ['blocks'])
+        if unchanged:
+            return unchanged
+        calendar = await get_block_calendar()
+        blocks = calendar.blocks([ot_id] if ot_id else None)
+        if doctor_id:
+            blocks = [block for block in blocks if block.get('doctor_id') == doctor_id]
+        return tagged([describe_block(block) for block in sorted(blocks, key=lambda block: block['id'])], etag)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/blocks/occurrences")
+async def get_block_occurrences(
+    request: Request,
+    from_date: str = Query(..., alias="from"),
+    to_date: str = Query(..., alias="to"),
+    ot_ids: Optional[str] = None,
+    doctor_id: Optional[str] = None,
+):
+    """Every dated block window in a range, expanded from the rules on the fly"""
+    try:
+        try:
+            first, last = date_type.fromisoformat(from_date), date_type.fromisoformat(to_date)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+        days = (last - first).days + 1
+        if days < 1 or days > MAX_ANALYTICS_DAYS:
+            raise HTTPException(status_code=400, detail=f"Date range must cover 1 to {MAX_ANALYTICS_DAYS} days")
+        etag, unchanged = check_etag(request, ['blocks'])
+        if unchanged:
+            return unchanged
+        calendar = await get_block_calendar()
+        blocks = calendar.blocks(split_ids(ot_ids) if ot_ids else None)
+        if doctor_id:
+            blocks = [block for block in blocks if block.get('doctor_id') == doctor_id]
+        found = [
+            {
+                "date": day.isoformat(),
+                "start": block['start_time'],
+                "end": block['end_time'],
+                "ot_id": block['ot_id'],
+                "doctor_id": block.get('doctor_id'),
+                "block_id": block['id'],
+            }
+            for block in blocks
+            for day in occurrences(block, first, last)
+        ]
+        found.sort(key=lambda occurrence: (occurrence['date'], occurrence['start'], occurrence['ot_id'], occurrence['block_id']))
+        return tagged({"from": first.isoformat(), "to": last.isoformat(), "occurrences": found}, etag)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/blocks/{block_id}")
+async def get_block(block_id: str):
+    try:
+        block_data = (await get_block_calendar()).get(block_id)
+        if block_data is None:
+            raise HTTPException(status_code=404, detail="Block not found")
+        return describe_block(block_data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.put("/api/blocks/{block_id}")
+async def update_block(block_id: str, block: Block, current_user: dict = Depends(get_current_user)):
+    try:
+        store = require_repo()
+        if await run_db(store.get, 'blocks', block_id) is None:
+            raise DocumentNotFound(block_id)
+        block_data = await save_block(store, block_id, block, 'update')
+        return {"id": block_id, "rule": describe_rule(block_data), "message": "Block updated successfully"}
+    except HTTPException:
+        raise
+    except DocumentNotFound:
+        raise HTTPException(status_code=404, detail="Block not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/api/blocks/{block_id}")
+async def delete_block(block_id: str, current_user: dict = Depends(get_current_user)):
+    try:
+        await run_db(require_repo().delete, 'blocks', block_id)
+        block_changed(block_id, None)
+        return {"message": "Block deleted successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Utilization summaries of past days, keyed by date and then by operating
+# hours and OTs; bookings written for a day drop its entry
+analytics_cache = LRUCache(
+    maxsize=int(os.environ.get("ANALYTICS_CACHE_DAYS", "3660")),
+    ttl_seconds=float(os.environ.get("ANALYTICS_CACHE_TTL_SECONDS", "86400")),
+)
+
+@app.get("/api/analytics/utilization")
+async def get_utilization(
+    from_date: str = Query(..., alias="from"),
+    to_date: str = Query(..., alias="to"),
+    ot_ids: Optional[str] = None,
+    day_start: str = DEFAULT_DAY_START,
+    day_end: str = DEFAULT_DAY_END,
+):
+    """OT utilization, idle gaps, emergency share and surgeon hours over a date range"""
+    try:
+        store = require_repo()
+        start, end = parse_operating_hours(day_start, day_end, 1, 1)
+        try:
+            first, last = date_type.fromisoformat(from_date), date_type.fromisoformat(to_date)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+        days = (last - first).days + 1
+        if days < 1 or days > MAX_ANALYTICS_DAYS:
+            raise HTTPException(status_code=400, detail=f"Date range must cover 1 to {MAX_ANALYTICS_DAYS} days")
+        ots = [ot.strip() for ot in ot_ids.split(",") if ot.strip()] if ot_ids else OT_IDS
+        dates = [(first + timedelta(days=offset)).isoformat() for offset in range(days)]
+        
+        # Closed days come from the cache; everything else is one projected range query
+        today = date_type.today().isoformat()
+        # Every total is scoped to the requested OTs, so they are part of the key
+        scope = (start, end, tuple(sorted(set(ots))))
+        summaries, missing = {}, []
+        for day in dates:
+            cached = analytics_cache.get(day) if day < today else None
+            if cached is not None and scope in cached:
+                summaries[day] = cached[scope]
+            else:
+                missing.append(day)
+        if missing:
+            filters = [('surgery_date', '>=', missing[0]), ('surgery_date', '<=', missing[-1])]
+            records = await run_db(store.find, 'surgeries', filters, fields=ANALYTICS_FIELDS)
+            computed = await run_db(day_summaries, records, start, end, ots)
+            for day in missing:
+                summaries[day] = computed.get(day) or empty_summary()
+                if day < today:
+                    cached = analytics_cache.get(day) or {}
+                    cached[scope] = summaries[day]
+                    analytics_cache.put(day, cached)
+        
+        report = utilization_report(summaries, ots, start, end)
+        report.update({"from": dates[0], "to": dates[-1], "day_start": day_start, "day_end": day_end, "cached_days": days - len(missing)})
+        return report
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Cache statistics for monitoring
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    stats = {collection: cache.stats() for collection, cache in DIRECTORY_CACHES.items()}
+    stats['analytics'] = analytics_cache.stats()
+    stats['etags'] = resource_versions.stats()
+    if invalidation_bus is not None:
+        stats['invalidation'] = invalidation_bus.stats()
+    stats['search'] = {collection: index.stats() for collection, index in SEARCH_INDEXES.items()}
+    stats['blocks'] = block_calendar.stats()
+    stats['audit_log'] = audit_log.stats()
+    stats['schedule_stream'] = {
+        "listeners": schedule_hub.listener_count(),
+        "subscribers": schedule_hub.subscriber_count(),
+    }
+    return stats
+
+# Cache and queue counters live on their owners; read them at scrape time
+CACHE_HITS = Counter("cache_hits_total", "Cache lookups answered from memory", ["cache"])
+CACHE_MISSES = Counter("cache_misses_total", "Cache lookups that went to the datastore", ["cache"])
+CACHE_EVICTIONS = Counter("cache_evictions_total", "Entries evicted to stay within maxsize", ["cache"])
+CACHE_ENTRIES = Gauge("cache_entries", "Entries currently cached", ["cache"])
+AUDIT_LOG_QUEUED = Gauge("audit_log_queued", "Audit log entries waiting to be written")
+AUDIT_LOG_WRITTEN = Counter("audit_log_written_total", "Audit log entries written")
+SCHEDULE_SUBSCRIBERS = Gauge("schedule_stream_subscribers", "Open schedule event streams")
+INVALIDATIONS = Counter("cache_invalidations_total", "Cross-worker invalidation messages", ["direction"])
+INVALIDATION_CONNECTED = Gauge("cache_invalidation_connected", "1 while subscribed to the invalidation channel")
+
+@metrics.collector
+def collect_runtime_stats():
+    caches = dict(DIRECTORY_CACHES, analytics=analytics_cache)
+    stats = {name: cache.stats() for name, cache in caches.items()}
+    audit = audit_log.stats()
+    return [
+        (CACHE_HITS, [(CACHE_HITS.name, {"cache": name}, s["hits"]) for name, s in stats.items()]),
+        (CACHE_MISSES, [(CACHE_MISSES.name, {"cache": name}, s["misses"]) for name, s in stats.items()]),
+        (CACHE_EVICTIONS, [(CACHE_EVICTIONS.name, {"cache": name}, s["evictions"]) for name, s in stats.items()]),
+        (CACHE_ENTRIES, [(CACHE_ENTRIES.name, {"cache": name}, s["size"]) for name, s in stats.items()]),
+        (AUDIT_LOG_QUEUED, [(AUDIT_LOG_QUEUED.name, {}, audit["queued"])]),
+        (AUDIT_LOG_WRITTEN, [(AUDIT_LOG_WRITTEN.name, {}, audit["written"])]),
+        (SCHEDULE_SUBSCRIBERS, [(SCHEDULE_SUBSCRIBERS.name, {}, schedule_hub.subscriber_count())]),
+    ] + invalidation_samples()
+
+def invalidation_samples():
+    if invalidation_bus is None:
+        return []
+    bus = invalidation_bus.stats()
+    return [
+        (INVALIDATIONS, [(INVALIDATIONS.name, {"direction": direction}, bus[direction]) for direction in ("published", "received", "dropped")]),
+        (INVALIDATION_CONNECTED, [(INVALIDATION_CONNECTED.name, {}, int(bus["connected"]))]),
+    ]
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Sampling profiler, for looking inside a live process
+MAX_PROFILER_INTERVAL_MS = 1000
+
+@app.post("/api/debug/profiler/start")
+async def start_profiler(
+    interval_ms: float = Query(5, gt=0, le=MAX_PROFILER_INTERVAL_MS),
+    current_user: dict = Depends(get_current_user),
+):
+    profiler.start(interval_ms / 1000)
+    return profiler.stats()
+
+@app.post("/api/debug/profiler/stop")
+async def stop_profiler(current_user: dict = Depends(get_current_user)):
+    await asyncio.get_running_loop().run_in_executor(None, profiler.stop)
+    return profiler.stats()
+
+@app.get("/api/debug/profiler")
+async def get_profile(
+    limit: Optional[int] = Query(None, ge=1),
+    current_user: dict = Depends(get_current_user),
+):
+    """Collected stacks in folded format, for flamegraph.pl or speedscope"""
+    return PlainTextResponse(profiler.folded(limit))
+
+# Logs endpoints. Each equality filter is paired with (timestamp, id) in a
+# composite index, and Firestore merges those indexes for any combination
+LOG_EXPORT_COLUMNS = ["id", "timestamp", "action", "surgery_id", "user_id", "details"]
+
+def parse_timestamp(value: str, name: str) -> str:
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO date or date-time")
+
+def log_filters(surgery_id, user_id, action, since, until) -> list:
+    filters = [(field, '==', value) for field, value in (('surgery_id', surgery_id), ('user_id', user_id), ('action', action)) if value]
+    if since:
+        filters.append(('timestamp', '>=', parse_timestamp(since, "since")))
+    if until:
+        filters.append(('timestamp', '<', parse_timestamp(until, "until")))
+    return filters
+
 @app.get("/api/logs")
-async def get_logs(limit: int = 50):
+async def get_logs(
+    surgery_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    action: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    paginate: bool = False,
+):
+    """Newest first, as a list of up to limit entries. With a cursor or
+    paginate=true the response is a page with next_cursor instead"""
     try:
-        logs_ref = db.collection('logs').order_by('timestamp', direction=firestore.Query.DESCENDING).limit(limit)
-        logs = []
-        for doc in logs_ref.stream():
-            log_data = doc.to_dict()
-            logs.append(log_data)
-        return logs
+        filters = log_filters(surgery_id, user_id, action, since, until)
+        if paginate or cursor is not None:
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                raise HTTPException(status_code=400, detail=f"Page size must be between 1 and {MAX_PAGE_SIZE}")
+            return await list_page('logs', filters, limit, cursor)
+        return await run_db(require_repo().find, 'logs', filters, LIST_ORDERING['logs'], limit)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/logs/export")
+async def export_logs(
+    surgery_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    action: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    cursor: Optional[str] = None,
+    export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    current_user: dict = Depends(get_current_user),
+):
+    """Every matching log entry, streamed page by page"""
+    try:
+        filters = log_filters(surgery_id, user_id, action, since, until)
+        if export_format == "ndjson":
+            response = stream_collection('logs', filters, cursor)
+        else:
+            require_repo()
+
+            async def rows():
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, LOG_EXPORT_COLUMNS, extrasaction='ignore')
+                writer.writeheader()
+                async for page in iter_pages('logs', filters, cursor):
+                    writer.writerows(page)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                if buffer.tell():
+                    yield buffer.getvalue()
+
+            response = StreamingResponse(rows(), media_type="text/csv")
+        response.headers["Content-Disposition"] = f'attachment; filename="logs.{export_format}"'
+        return response
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+STARTUP_SECONDS.set(IMPORT_SECONDS, "import")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -0,0 +1,197 @@
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from availability import free_intervals, merge_intervals, minutes_to_time
+from booking_index import Resource, surgery_resources, time_to_minutes
+
+# Surgeries in these states are never moved to make room
+FIXED_STATUSES = {"in_progress", "completed"}
+
+
+# (start, end, doctor_id) of a block window in an OT, in minutes since midnight
+HeldWindow = Tuple[int, int, Optional[str]]
+
+
+class DaySchedule:
+    """Busy intervals per resource for one day, editable while planning.
+    OTs are also busy for everyone but the block's surgeon in ``held`` windows"""
+
+    def __init__(self, surgeries: Iterable[dict], held: Optional[Dict[str, List[HeldWindow]]] = None):
+        self.surgeries: Dict[str, dict] = {}
+        self._busy: Dict[Resource, Dict[str, Tuple[int, int]]] = {}
+        self._held = held or {}
+        for surgery_data in surgeries:
+            if surgery_data.get('status') != 'cancelled' and surgery_data.get('id'):
+                self.place(surgery_data['id'], surgery_data)
+
+    def place(self, surgery_id: str, surgery_data: dict):
+        start = time_to_minutes(surgery_data['surgery_time'])
+        span = (start, start + surgery_data['duration_minutes'])
+        self.surgeries[surgery_id] = surgery_data
+        for resource in surgery_resources(surgery_data):
+            self._busy.setdefault(resource, {})[surgery_id] = span
+
+    def unplace(self, surgery_id: str):
+        surgery_data = self.surgeries.pop(surgery_id)
+        for resource in surgery_resources(surgery_data):
+            self._busy.get(resource, {}).pop(surgery_id, None)
+
+    def busy(self, resources: Iterable[Resource], doctor_id: Optional[str] = None) -> List[Tuple[int, int]]:
+        """Merged busy intervals across the given resources, for doctor_id"""
+        spans = [span for resource in resources for span in self._busy.get(resource, {}).values()]
+        for kind, resource_id in resources:
+            if kind == "ot":
+                spans.extend((start, end) for start, end, holder in self._held.get(resource_id, ()) if holder != doctor_id)
+        return merge_intervals(spans)
+
+    def held_by_others(self, ot_id: str, doctor_id: Optional[str], start: int, end: int) -> bool:
+        """Whether [start, end) in the OT overlaps another surgeon's block"""
+        return any(
+            held_start < end and start < held_end
+            for held_start, held_end, holder in self._held.get(ot_id, ())
+            if holder != doctor_id
+        )
+
+    def blockers(self, resources: Iterable[Resource], start: int, end: int) -> List[str]:
+        """Surgeries holding any of the resources somewhere inside [start, end)"""
+        found = []
+        for resource in resources:
+            for surgery_id, (busy_start, busy_end) in self._busy.get(resource, {}).items():
+                if busy_start < end and busy_end > start and surgery_id not in found:
+                    found.append(surgery_id)
+        return found
+
+
+def with_slot(surgery_data: dict, ot_id: str, start: int) -> dict:
+    return dict(surgery_data, ot_id=ot_id, surgery_time=minutes_to_time(start))
+
+
+def earliest_slot(schedule: DaySchedule, surgery_data: dict, ot_ids: List[str], earliest: int, day_end: int) -> Optional[Tuple[str, int]]:
+    """Earliest (ot_id, start) where the surgery fits without touching anyone"""
+    duration = surgery_data['duration_minutes']
+    best = None
+    for ot_id in ot_ids:
+        resources = surgery_resources(with_slot(surgery_data, ot_id, earliest))
+        for free_start, free_end in free_intervals(schedule.busy(resources, surgery_data.get('doctor_id')), earliest, day_end):
+            if free_end - free_start >= duration:
+                if best is None or free_start < best[1]:
+                    best = (ot_id, free_start)
+                break
+    return best
+
+
+def closest_slot(schedule: DaySchedule, surgery_data: dict, ot_ids: List[str], day_start: int, day_end: int) -> Optional[Tuple[str, int]]:
+    """Free (ot_id, start) nearest the surgery's current time, preferring its own OT"""
+    duration = surgery_data['duration_minutes']
+    original = time_to_minutes(surgery_data['surgery_time'])
+    best, best_cost = None, None
+    for ot_id in ot_ids:
+        resources = surgery_resources(with_slot(surgery_data, ot_id, original))
+        for free_start, free_end in free_intervals(schedule.busy(resources, surgery_data.get('doctor_id')), day_start, day_end):
+            if free_end - free_start < duration:
+                continue
+            start = min(max(original, free_start), free_end - duration)
+            cost = (abs(start - original), ot_id != surgery_data['ot_id'], start)
+            if best_cost is None or cost < best_cost:
+                best, best_cost = (ot_id, start), cost
+    return best
+
+
+def plan_emergency(
+    surgeries: Iterable[dict],
+    emergency: dict,
+    ot_ids: List[str],
+    day_start: int,
+    day_end: int,
+    budget_ms: float,
+    held: Optional[Dict[str, List[HeldWindow]]] = None,
+) -> dict:
+    """Place an emergency surgery on its day, moving as few electives as possible.
+
+    The earliest free slot across all OTs wins if there is one. Otherwise
+    every window that starts at the requested time or when some booking ends
+    is a candidate; candidates are tried in order of how many electives they
+    displace, and each displaced elective is greedily re-placed at the free
+    slot closest to its old time. The first candidate whose electives all
+    find a new slot is the plan. Planning stops once ``budget_ms`` is spent.
+    Nothing is placed in a block window (``held``, per OT) of another surgeon.
+    """
+    started = time.perf_counter()
+    deadline = started + budget_ms / 1000
+    schedule = DaySchedule(surgeries, held)
+    emergency = dict(emergency)
+    emergency.pop('id', None)
+    duration = emergency['duration_minutes']
+    earliest = max(day_start, time_to_minutes(emergency['surgery_time']))
+    # Try the requested OT first so it wins ties
+    ot_ids = sorted(ot_ids, key=lambda ot_id: ot_id != emergency['ot_id'])
+
+    def result(slot=None, moves=(), timed_out=False):
+        return {
+            "feasible": slot is not None,
+            "surgery_date": emergency['surgery_date'],
+            "ot_id": slot[0] if slot else None,
+            "surgery_time": minutes_to_time(slot[1]) if slot else None,
+            "duration_minutes": duration,
+            "moves": list(moves),
+            "timed_out": timed_out,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+    slot = earliest_slot(schedule, emergency, ot_ids, earliest, day_end)
+    if slot is not None:
+        return result(slot)
+
+    # Candidate windows, cheapest first: (number of blockers, start, OT order)
+    starts = {earliest} | {
+        end for surgery_data in schedule.surgeries.values()
+        for end in [time_to_minutes(surgery_data['surgery_time']) + surgery_data['duration_minutes']]
+        if earliest <= end <= day_end - duration
+    }
+    candidates = []
+    for rank, ot_id in enumerate(ot_ids):
+        resources = surgery_resources(with_slot(emergency, ot_id, earliest))
+        for start in starts:
+            if start + duration > day_end or schedule.held_by_others(ot_id, emergency.get('doctor_id'), start, start + duration):
+                continue
+            blockers = schedule.blockers(resources, start, start + duration)
+            if all(
+                schedule.surgeries[surgery_id].get('status') not in FIXED_STATUSES
+                and not schedule.surgeries[surgery_id].get('is_emergency')
+                for surgery_id in blockers
+            ):
+                candidates.append((len(blockers), start, rank, ot_id, blockers))
+    candidates.sort(key=lambda candidate: candidate[:3])
+
+    for _, start, _, ot_id, blockers in candidates:
+        if time.perf_counter() > deadline:
+            return result(timed_out=True)
+        displaced = {surgery_id: schedule.surgeries[surgery_id] for surgery_id in blockers}
+        for surgery_id in blockers:
+            schedule.unplace(surgery_id)
+        schedule.place("__emergency__", with_slot(emergency, ot_id, start))
+        moves, placed = [], []
+        # Longest first: they are the hardest to fit
+        for surgery_id in sorted(blockers, key=lambda surgery_id: -displaced[surgery_id]['duration_minutes']):
+            surgery_data = displaced[surgery_id]
+            target = closest_slot(schedule, surgery_data, ot_ids, day_start, day_end)
+            if target is None:
+                break
+            schedule.place(surgery_id, with_slot(surgery_data, *target))
+            placed.append(surgery_id)
+            moves.append({
+                "surgery_id": surgery_id,
+                "previous_ot_id": surgery_data['ot_id'],
+                "previous_time": surgery_data['surgery_time'],
+                "ot_id": target[0],
+                "surgery_time": minutes_to_time(target[1]),
+            })
+        if len(moves) == len(blockers):
+            return result((ot_id, start), moves)
+        # Undo and try the next window
+        for surgery_id in placed:
+            schedule.unplace(surgery_id)
+        schedule.unplace("__emergency__")
+        for surgery_id, surgery_data in displaced.items():
+            schedule.place(surgery_id, surgery_data)
+    return result()
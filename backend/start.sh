@@ -1,2 +1,29 @@
 #!/bin/bash
-uvicorn server:app --host 0.0.0.0 --port $PORT
+# WEB_CONCURRENCY worker processes (default 1). Workers keep their caches
+# coherent over pub/sub: INVALIDATION_URL (redis://host:port) if set,
+# otherwise a local broker started here on INVALIDATION_SOCKET.
+WORKERS=${WEB_CONCURRENCY:-1}
+
+if [ "$WORKERS" -le 1 ]; then
+    exec uvicorn server:app --host 0.0.0.0 --port $PORT
+fi
+
+if [ -z "$INVALIDATION_URL" ]; then
+    SOCKET=${INVALIDATION_SOCKET:-/tmp/operation-invalidation-$PORT.sock}
+    python invalidation.py --socket "$SOCKET" &
+    BROKER_PID=$!
+    export INVALIDATION_URL="unix://$SOCKET"
+fi
+
+uvicorn server:app --host 0.0.0.0 --port $PORT --workers $WORKERS &
+SERVER_PID=$!
+trap 'kill -TERM $SERVER_PID 2>/dev/null' TERM INT
+wait $SERVER_PID
+STATUS=$?
+if kill -0 $SERVER_PID 2>/dev/null; then
+    # wait returned early for a signal; let the workers finish shutting down
+    wait $SERVER_PID
+    STATUS=$?
+fi
+[ -n "$BROKER_PID" ] && kill $BROKER_PID 2>/dev/null
+exit $STATUS
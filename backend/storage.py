@@ -0,0 +1,526 @@
+import json
+import operator
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# A filter is (field, op, value) with Firestore operator names, an ordering is
+# (field, "asc" | "desc") and a write is ("set" | "update" | "add",
+# collection, doc_id, data) with doc_id ignored for "add"
+Filter = Tuple[str, str, Any]
+Ordering = Tuple[str, str]
+Write = Tuple[str, str, Optional[str], dict]
+# Watch callbacks receive [(kind, document)] with kind "added", "modified" or "removed"
+Change = Tuple[str, dict]
+
+# Firestore rejects batches with more than 500 writes
+FIRESTORE_BATCH_LIMIT = 500
+# Firestore's name for ordering by document id
+DOCUMENT_ID = "__name__"
+
+
+class DocumentNotFound(Exception):
+    """Raised when updating a document that does not exist"""
+
+
+class Repository:
+    """Document store used by the route handlers.
+
+    Documents are plain dicts grouped into named collections (doctors,
+    patients, surgeries, logs). Implementations are synchronous; the server
+    calls them through its database thread pool.
+    """
+
+    def get(self, collection: str, doc_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def set(self, collection: str, doc_id: str, data: dict):
+        raise NotImplementedError
+
+    def update(self, collection: str, doc_id: str, data: dict):
+        raise NotImplementedError
+
+    def delete(self, collection: str, doc_id: str):
+        raise NotImplementedError
+
+    def add(self, collection: str, data: dict) -> str:
+        raise NotImplementedError
+
+    def find(
+        self,
+        collection: str,
+        filters: Sequence[Filter] = (),
+        order_by: Sequence[Ordering] = (),
+        limit: Optional[int] = None,
+        start_after: Optional[Sequence[Any]] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> List[dict]:
+        """Query a collection. ``start_after`` holds one value per ``order_by``
+        field and resumes the scan after that position (keyset pagination).
+        ``fields`` projects each document down to those fields (plus ``id``).
+        Every result carries its document ``id``, stored in the data or not."""
+        raise NotImplementedError
+
+    def write_batch(self, writes: Sequence[Write]):
+        """Apply several writes with as few round trips as the backend allows"""
+        raise NotImplementedError
+
+    def get_many(self, collection: str, doc_ids: Sequence[str]) -> Dict[str, dict]:
+        """Fetch several documents in one round trip, keyed by id (missing ids are left out)"""
+        raise NotImplementedError
+
+    def guarded_write(
+        self,
+        guard_collection: str,
+        guard_ids: Sequence[str],
+        decide: Callable[[Dict[str, dict], Callable[[str, Sequence[Filter]], List[dict]]], Tuple[Sequence[Write], Any]],
+    ) -> Tuple[Any, Dict[str, int]]:
+        """Read-check-write as one transaction serialised on guard documents.
+
+        ``decide(guards, find)`` gets every guard document (``{}`` if it does
+        not exist yet) and a ``find(collection, filters)`` that reads inside
+        the transaction, and returns ``(writes, result)``. The writes are
+        committed together with the guard documents, which ``decide`` may
+        modify in place and whose ``version`` counter is bumped, so two
+        guarded writes sharing a guard never interleave. ``decide`` may run
+        more than once and may raise to abort. Returns ``(result, versions)``
+        with the guard versions seen by the committed attempt.
+        """
+        raise NotImplementedError
+
+    def watch(self, collection: str, filters: Sequence[Filter], callback: Callable[[List[Change]], None]) -> Callable[[], None]:
+        """Call ``callback`` with the matching documents (as "added") and then
+        with every later change to them. Returns a function that stops the
+        watch. Callbacks may run on a background thread."""
+        raise NotImplementedError
+
+
+class FirestoreRepository(Repository):
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, collection, doc_id):
+        doc = self.client.collection(collection).document(doc_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def set(self, collection, doc_id, data):
+        self.client.collection(collection).document(doc_id).set(data)
+
+    def get_many(self, collection, doc_ids):
+        refs = [self.client.collection(collection).document(doc_id) for doc_id in dict.fromkeys(doc_ids)]
+        if not refs:
+            return {}
+        return {doc.id: doc.to_dict() for doc in self.client.get_all(refs) if doc.exists}
+
+    def update(self, collection, doc_id, data):
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self.client.collection(collection).document(doc_id).update(data)
+        except NotFound as e:
+            raise DocumentNotFound(doc_id) from e
+
+    def delete(self, collection, doc_id):
+        self.client.collection(collection).document(doc_id).delete()
+
+    def add(self, collection, data):
+        _, doc_ref = self.client.collection(collection).add(data)
+        return doc_ref.id
+
+    def find(self, collection, filters=(), order_by=(), limit=None, start_after=None, fields=None):
+        query = self._query(collection, filters, order_by, limit, start_after)
+        if fields is not None:
+            # Server-side projection: only these fields cross the wire
+            query = query.select(list(dict.fromkeys(["id", *fields])))
+        return [dict(doc.to_dict(), id=doc.id) for doc in query.stream()]
+
+    def write_batch(self, writes):
+        # Each chunk commits atomically; Firestore caps a batch at 500 writes
+        for offset in range(0, len(writes), FIRESTORE_BATCH_LIMIT):
+            batch = self.client.batch()
+            self._stage(batch, writes[offset:offset + FIRESTORE_BATCH_LIMIT])
+            batch.commit()
+
+    def guarded_write(self, guard_collection, guard_ids, decide):
+        from firebase_admin import firestore
+        from google.api_core.exceptions import NotFound
+
+        refs = {guard_id: self.client.collection(guard_collection).document(guard_id) for guard_id in guard_ids}
+
+        @firestore.transactional
+        def attempt(transaction):
+            # Firestore wants every read before the first write
+            guards = {}
+            for guard_id, ref in refs.items():
+                snapshot = ref.get(transaction=transaction)
+                guards[guard_id] = (snapshot.to_dict() or {}) if snapshot.exists else {}
+            versions = {guard_id: guard.get("version", 0) for guard_id, guard in guards.items()}
+
+            def find(collection, filters):
+                query = self._query(collection, filters, (), None)
+                return [doc.to_dict() for doc in query.stream(transaction=transaction)]
+
+            writes, result = decide(guards, find)
+            for guard_id, ref in refs.items():
+                transaction.set(ref, dict(guards[guard_id], version=versions[guard_id] + 1))
+            self._stage(transaction, writes)
+            return result, versions
+
+        try:
+            return attempt(self.client.transaction())
+        except NotFound as e:
+            raise DocumentNotFound(str(e)) from e
+
+    def _stage(self, batch, writes):
+        """Queue writes on a WriteBatch or Transaction"""
+        for op, collection, doc_id, data in writes:
+            if op == "add":
+                batch.set(self.client.collection(collection).document(), data)
+            elif op == "set":
+                batch.set(self.client.collection(collection).document(doc_id), data)
+            elif op == "update":
+                batch.update(self.client.collection(collection).document(doc_id), data)
+            else:
+                raise ValueError(f"Unsupported write: {op}")
+
+    def watch(self, collection, filters, callback):
+        def on_snapshot(docs, changes, read_time):
+            callback([(change.type.name.lower(), change.document.to_dict()) for change in changes])
+
+        listener = self._query(collection, filters, (), None).on_snapshot(on_snapshot)
+        return listener.unsubscribe
+
+    def _query(self, collection, filters, order_by, limit, start_after=None):
+        from firebase_admin import firestore
+
+        query = self.client.collection(collection)
+        for field, op, value in filters:
+            query = query.where(field, op, value)
+        # Documents are keyed by their id, so "id" orders by document name:
+        # Firestore leaves out documents missing an ordered field, and older
+        # documents may not store their id
+        order_by = [(DOCUMENT_ID if field == "id" else field, direction) for field, direction in order_by]
+        for field, direction in order_by:
+            query = query.order_by(
+                field,
+                direction=firestore.Query.DESCENDING if direction == "desc" else firestore.Query.ASCENDING,
+            )
+        if start_after is not None:
+            query = query.start_after({field: value for (field, _), value in zip(order_by, start_after)})
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+
+# Fields promoted to real, indexed SQLite columns; everything else is only
+# reachable through json_extract on the stored document
+SQLITE_COLUMNS = {
+    "doctors": ["specialization", "department"],
+    "patients": ["medical_record_number"],
+    "surgeries": ["ot_id", "surgery_date", "surgery_time", "doctor_id", "patient_id", "status", "start_epoch_min", "end_epoch_min"],
+    "logs": ["timestamp", "surgery_id", "user_id", "action"],
+    "blocks": ["ot_id", "doctor_id"],
+}
+
+SQLITE_INDEXES = {
+    "doctors": [("specialization",), ("department",)],
+    "patients": [("medical_record_number",)],
+    "surgeries": [
+        ("ot_id", "surgery_date"), ("surgery_date", "surgery_time"), ("doctor_id",), ("patient_id",),
+        ("start_epoch_min",), ("ot_id", "start_epoch_min"),
+    ],
+    "logs": [("timestamp",), ("surgery_id", "timestamp"), ("user_id", "timestamp"), ("action", "timestamp")],
+}
+
+SQLITE_OPERATORS = {"==": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+PYTHON_OPERATORS = {
+    "==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le,
+    ">": operator.gt, ">=": operator.ge, "in": lambda value, options: value in options,
+}
+
+
+def matches(data: dict, filters: Iterable[Filter]) -> bool:
+    """Evaluate repository filters against a document in memory"""
+    for field, op, value in filters:
+        current = data.get(field)
+        if current is None and op != "==":
+            return False
+        if not PYTHON_OPERATORS[op](current, value):
+            return False
+    return True
+
+
+class SqliteRepository(Repository):
+    """Embedded single-node store: one table per collection, JSON documents
+    plus indexed columns for the fields the API filters on."""
+
+    def __init__(self, path: str = "operation.db"):
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._tables = set()
+        # SQLite has no change feed, so writes made through this repository
+        # notify in-process watchers after they commit
+        self._watchers: Dict[str, list] = {}
+        self._watch_lock = threading.Lock()
+        self._memory_write_lock = None
+        if path == ":memory:":
+            # Give every thread the same private in-memory database. Shared
+            # cache mode fails lock conflicts at once instead of waiting out
+            # the busy timeout, so writers queue on a lock of our own and
+            # readers skip table locks
+            self.path = f"file:operation-{uuid.uuid4().hex}?mode=memory&cache=shared"
+            self._memory_write_lock = threading.RLock()
+            self._keepalive = self._connect()
+            # Creating a table mid-run would briefly lock every reader out
+            for collection in SQLITE_COLUMNS:
+                self._table(collection)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, uri=self.path.startswith("file:"), timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if self._memory_write_lock is not None:
+            conn.execute("PRAGMA read_uncommitted=1")
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _writer(self):
+        return self._memory_write_lock if self._memory_write_lock is not None else nullcontext()
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction that takes the database lock up front"""
+        conn = self.conn
+        self._local.changes = []
+        with self._writer():
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                # The rollback also undoes any CREATE TABLE run inside it
+                with self._schema_lock:
+                    self._tables &= {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+                raise
+            conn.execute("COMMIT")
+        if self._local.changes:
+            self._dispatch(self._local.changes)
+
+    def _table(self, collection: str) -> str:
+        if not collection.isidentifier():
+            raise ValueError(f"Invalid collection name: {collection}")
+        if collection not in self._tables:
+            with self._writer(), self._schema_lock:
+                columns = "".join(f", {column}" for column in SQLITE_COLUMNS.get(collection, []))
+                self.conn.execute(f"CREATE TABLE IF NOT EXISTS {collection} (id TEXT PRIMARY KEY{columns}, data TEXT NOT NULL)")
+                # Tables created by an older version lack newly promoted columns;
+                # add them and fill them from the stored documents
+                existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({collection})")}
+                for column in SQLITE_COLUMNS.get(collection, []):
+                    if column not in existing:
+                        self.conn.execute(f"ALTER TABLE {collection} ADD COLUMN {column}")
+                        self.conn.execute(f"UPDATE {collection} SET {column} = json_extract(data, ?)", (f"$.{column}",))
+                for fields in SQLITE_INDEXES.get(collection, []):
+                    name = f"idx_{collection}_{'_'.join(fields)}"
+                    self.conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {collection} ({', '.join(fields)})")
+                self._tables.add(collection)
+        return collection
+
+    def _column(self, collection: str, field: str) -> Tuple[str, list]:
+        if field == "id" or field in SQLITE_COLUMNS.get(collection, []):
+            return field, []
+        return "json_extract(data, ?)", [f"$.{field}"]
+
+    def _write(self, collection: str, doc_id: str, data: dict):
+        table = self._table(collection)
+        if self._watchers.get(collection):
+            self._local.changes.append((collection, self.get(collection, doc_id), data))
+        columns = SQLITE_COLUMNS.get(collection, [])
+        placeholders = ", ".join("?" for _ in range(len(columns) + 2))
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO {table} (id, {''.join(c + ', ' for c in columns)}data) VALUES ({placeholders})",
+            [doc_id, *(data.get(c) for c in columns), json.dumps(data)],
+        )
+
+    def get(self, collection, doc_id):
+        row = self.conn.execute(f"SELECT data FROM {self._table(collection)} WHERE id = ?", (doc_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, collection, doc_ids):
+        doc_ids = list(dict.fromkeys(doc_ids))
+        table = self._table(collection)
+        found = {}
+        # Stay under SQLite's bound-parameter limit
+        for offset in range(0, len(doc_ids), 500):
+            chunk = doc_ids[offset:offset + 500]
+            rows = self.conn.execute(
+                f"SELECT id, data FROM {table} WHERE id IN ({', '.join('?' for _ in chunk)})", chunk
+            )
+            found.update((doc_id, json.loads(data)) for doc_id, data in rows)
+        return found
+
+    def set(self, collection, doc_id, data):
+        with self.transaction():
+            self._write(collection, doc_id, data)
+
+    def update(self, collection, doc_id, data):
+        with self.transaction():
+            current = self.get(collection, doc_id)
+            if current is None:
+                raise DocumentNotFound(doc_id)
+            current.update(data)
+            self._write(collection, doc_id, current)
+
+    def delete(self, collection, doc_id):
+        with self.transaction():
+            if self._watchers.get(collection):
+                current = self.get(collection, doc_id)
+                if current is not None:
+                    self._local.changes.append((collection, current, None))
+            self.conn.execute(f"DELETE FROM {self._table(collection)} WHERE id = ?", (doc_id,))
+
+    def watch(self, collection, filters, callback):
+        watcher = (list(filters), callback)
+        with self._watch_lock:
+            self._watchers.setdefault(collection, []).append(watcher)
+        callback([("added", doc) for doc in self.find(collection, filters)])
+
+        def unsubscribe():
+            with self._watch_lock:
+                if watcher in self._watchers.get(collection, []):
+                    self._watchers[collection].remove(watcher)
+
+        return unsubscribe
+
+    def _dispatch(self, changes):
+        """Translate committed (collection, before, after) writes into the
+        added/modified/removed view of each watcher's query"""
+        with self._watch_lock:
+            watchers = {collection: list(entries) for collection, entries in self._watchers.items()}
+        for collection, entries in watchers.items():
+            for filters, callback in entries:
+                relevant = []
+                for changed, before, after in changes:
+                    if changed != collection:
+                        continue
+                    was_in = before is not None and matches(before, filters)
+                    is_in = after is not None and matches(after, filters)
+                    if is_in:
+                        relevant.append(("modified" if was_in else "added", after))
+                    elif was_in:
+                        relevant.append(("removed", before))
+                if relevant:
+                    callback(relevant)
+
+    def add(self, collection, data):
+        doc_id = uuid.uuid4().hex
+        self.set(collection, doc_id, data)
+        return doc_id
+
+    def write_batch(self, writes):
+        with self.transaction():
+            self._apply(writes)
+
+    def guarded_write(self, guard_collection, guard_ids, decide):
+        # BEGIN IMMEDIATE already serialises writers; the version bump lets
+        # callers tell whether their cached view of the guarded data is current
+        with self.transaction():
+            guards = {guard_id: self.get(guard_collection, guard_id) or {} for guard_id in guard_ids}
+            versions = {guard_id: guard.get("version", 0) for guard_id, guard in guards.items()}
+            writes, result = decide(guards, lambda collection, filters: self.find(collection, filters))
+            for guard_id in guard_ids:
+                self._write(guard_collection, guard_id, dict(guards[guard_id], version=versions[guard_id] + 1))
+            self._apply(writes)
+        return result, versions
+
+    def _apply(self, writes):
+        for op, collection, doc_id, data in writes:
+            if op == "add":
+                self._write(collection, uuid.uuid4().hex, data)
+            elif op == "set":
+                self._write(collection, doc_id, data)
+            elif op == "update":
+                current = self.get(collection, doc_id)
+                if current is None:
+                    raise DocumentNotFound(doc_id)
+                current.update(data)
+                self._write(collection, doc_id, current)
+            else:
+                raise ValueError(f"Unsupported write: {op}")
+
+    def find(self, collection, filters=(), order_by=(), limit=None, start_after=None, fields=None):
+        if fields is None:
+            sql, params = self._select(collection, filters, order_by, limit, start_after)
+            return [dict(json.loads(data), id=doc_id) for doc_id, data in self.conn.execute(sql, params)]
+        fields = list(dict.fromkeys(["id", *fields]))
+        sql, params = self._select(collection, filters, order_by, limit, start_after, fields)
+        projected = []
+        for doc_id, values in self.conn.execute(sql, params):
+            document = {field: value for field, value in zip(fields, json.loads(values)) if value is not None}
+            document["id"] = doc_id
+            projected.append(document)
+        return projected
+
+    def _select(self, collection, filters: Iterable[Filter], order_by: Sequence[Ordering], limit, start_after=None, fields=None):
+        table = self._table(collection)
+        clauses, params = [], []
+        if fields is None:
+            selected = "data"
+        else:
+            # json_extract with several paths returns a JSON array of the values
+            # with their JSON types intact; a single path would return a bare
+            # SQL value instead, so repeat it
+            paths = [f"$.{field}" for field in fields]
+            if len(paths) == 1:
+                paths.append(paths[0])
+            selected = f"json_extract(data, {', '.join('?' for _ in paths)})"
+            params += paths
+        selected = "id, " + selected
+        for field, op, value in filters:
+            column, column_params = self._column(collection, field)
+            if op == "in":
+                clauses.append(f"{column} IN ({', '.join('?' for _ in value)})")
+                params += column_params + list(value)
+            elif op in SQLITE_OPERATORS:
+                clauses.append(f"{column} {SQLITE_OPERATORS[op]} ?")
+                params += column_params + [value]
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+        if start_after is not None:
+            # (a, b) after (x, y) == a > x OR (a = x AND b > y), per direction
+            branches = []
+            for i, (field, direction) in enumerate(order_by):
+                terms = []
+                for j, (prior_field, _) in enumerate(order_by[:i]):
+                    column, column_params = self._column(collection, prior_field)
+                    terms.append(f"{column} = ?")
+                    params += column_params + [start_after[j]]
+                column, column_params = self._column(collection, field)
+                terms.append(f"{column} {'<' if direction == 'desc' else '>'} ?")
+                params += column_params + [start_after[i]]
+                branches.append("(" + " AND ".join(terms) + ")")
+            clauses.append("(" + " OR ".join(branches) + ")")
+        sql = f"SELECT {selected} FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        if order_by:
+            terms = []
+            for field, direction in order_by:
+                column, column_params = self._column(collection, field)
+                terms.append(f"{column} {'DESC' if direction == 'desc' else 'ASC'}")
+                params += column_params
+            sql += " ORDER BY " + ", ".join(terms)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return sql, params
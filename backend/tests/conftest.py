@@ -0,0 +1,57 @@
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "bench"))
+
+# server reads its configuration at import
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = ":memory:"
+os.environ["OT_IDS"] = "1,2,3"
+os.environ.pop("INVALIDATION_URL", None)
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+
+AUTH = {"Authorization": "Bearer test"}
+
+
+@pytest.fixture(scope="session")
+def client():
+    # One app lifespan for the whole run: the audit log queue and booking
+    # locks belong to the event loop that first used them
+    with TestClient(server.app, headers=AUTH) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def firestore_client(client):
+    """The API on FirestoreRepository over the in-memory fake client"""
+    from fake_firestore import FakeFirestore
+    from storage import FirestoreRepository
+
+    sqlite_repo = server.repo
+    server.repo = FirestoreRepository(FakeFirestore())
+    server.reset_caches()
+    yield client
+    server.repo = sqlite_repo
+    server.reset_caches()
+
+
+def surgery(**fields) -> dict:
+    data = {
+        "patient_id": "patient-1",
+        "doctor_id": "doctor-1",
+        "ot_id": "1",
+        "surgery_date": "2030-01-08",
+        "surgery_time": "09:00",
+        "surgery_type": "Appendectomy",
+        "anesthesiologist": "anesthesiologist-1",
+        "anesthesia_type": "general",
+        "duration_minutes": 60,
+    }
+    data.update(fields)
+    return data
@@ -0,0 +1,92 @@
+from datetime import date, timedelta
+
+import server
+from booking_index import stamp_epoch_fields
+from conftest import surgery
+from recurrence import WEEKDAYS
+
+
+def block(**fields) -> dict:
+    data = {
+        "doctor_id": "block-surgeon",
+        "ot_id": "3",
+        "weekdays": ["MO"],
+        "start_time": "08:00",
+        "end_time": "12:00",
+        "starts_on": "2030-01-07",
+    }
+    data.update(fields)
+    return data
+
+
+def test_running_block_ignores_clashes_on_past_days(client):
+    past = date.today() - timedelta(days=7)
+    booked = stamp_epoch_fields(surgery(id="past-clash", ot_id="3", doctor_id="other-surgeon", surgery_date=past.isoformat()))
+    server.repo.set("surgeries", "past-clash", booked)
+    weekday = WEEKDAYS[past.weekday()]
+    others = [day for day in WEEKDAYS if day != weekday]
+    starts_on = (past - timedelta(days=14)).isoformat()
+
+    response = client.post("/api/blocks", json=block(weekdays=[weekday], starts_on=starts_on))
+    assert response.status_code == 200, response.text
+    client.delete(f"/api/blocks/{response.json()['id']}")
+
+    response = client.post("/api/blocks", json=block(weekdays=others[:1], starts_on=starts_on))
+    assert response.status_code == 200, response.text
+    block_id = response.json()["id"]
+    response = client.put(f"/api/blocks/{block_id}", json=block(weekdays=[others[0], weekday], starts_on=starts_on))
+    assert response.status_code == 200, response.text
+    client.delete(f"/api/blocks/{block_id}")
+
+
+def test_block_saved_by_another_worker_is_seen_by_a_later_booking(client):
+    day = date.today() + timedelta(days=10)
+    response = client.post("/api/blocks", json=block(ot_id="2", weekdays=[WEEKDAYS[day.weekday()]], starts_on=day.isoformat()))
+    assert response.status_code == 200, response.text
+    block_id = response.json()["id"]
+    # Every day the block covers is marked, booked or not
+    marked = server.repo.get(server.SCHEDULE_GUARDS, day.isoformat())
+    assert marked["block_version"]
+
+    # As if another worker saved the block and its announcement is still on the way
+    server.block_calendar.remove(block_id)
+    marked["block_version"] = "not-announced-yet"
+    server.repo.set(server.SCHEDULE_GUARDS, day.isoformat(), marked)
+    response = client.post("/api/surgeries", json=surgery(ot_id="2", doctor_id="other-surgeon", surgery_date=day.isoformat()))
+    assert response.status_code == 409, response.text
+    assert server.block_calendar.get(block_id) is not None
+    client.delete(f"/api/blocks/{block_id}")
+
+
+def test_emergency_plan_keeps_displaced_electives_out_of_other_blocks(client):
+    day = "2032-02-03"
+    held = client.post("/api/blocks", json=block(ot_id="2", weekdays=["TU"], start_time="08:00", end_time="20:00", starts_on=day))
+    assert held.status_code == 200, held.text
+    booked = [
+        surgery(ot_id="1", surgery_date=day, surgery_time="12:00", duration_minutes=60, doctor_id="elective-surgeon", anesthesiologist="an-1", patient_id="p-1"),
+        surgery(ot_id="1", surgery_date=day, surgery_time="13:00", duration_minutes=420, doctor_id="running-1", anesthesiologist="an-2", patient_id="p-2", status="in_progress"),
+        surgery(ot_id="3", surgery_date=day, surgery_time="08:00", duration_minutes=720, doctor_id="running-2", anesthesiologist="an-3", patient_id="p-3", status="in_progress"),
+    ]
+    ids = []
+    for data in booked:
+        response = client.post("/api/surgeries", json=data)
+        assert response.status_code == 200, response.text
+        ids.append(response.json()["id"])
+    emergency = surgery(ot_id="1", surgery_date=day, surgery_time="12:00", duration_minutes=60, doctor_id="on-call", anesthesiologist="an-4", patient_id="p-4")
+
+    plan = client.post("/api/surgeries/emergency/plan", json=emergency).json()
+    # OT 2 is free at 12:00 but held by the block's surgeon all day
+    assert (plan["feasible"], plan["ot_id"], plan["surgery_time"]) == (True, "1", "12:00")
+    assert [(move["surgery_id"], move["ot_id"], move["surgery_time"]) for move in plan["moves"]] == [(ids[0], "1", "11:00")]
+
+    into_block = {
+        "surgery": emergency, "ot_id": "1", "surgery_time": "12:00",
+        "moves": [{"surgery_id": ids[0], "previous_ot_id": "1", "previous_time": "12:00", "ot_id": "2", "surgery_time": "12:00"}],
+    }
+    response = client.post("/api/surgeries/emergency/apply", json=into_block)
+    assert response.status_code == 409
+    assert response.json()["detail"]["conflicts"][0]["block_id"] == held.json()["id"]
+
+    response = client.post("/api/surgeries/emergency/apply", json=dict(plan, surgery=emergency))
+    assert response.status_code == 200, response.text
+    client.delete(f"/api/blocks/{held.json()['id']}")
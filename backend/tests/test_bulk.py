@@ -0,0 +1,57 @@
+from datetime import date, timedelta
+
+import server
+from conftest import surgery
+from storage import FIRESTORE_BATCH_LIMIT
+
+
+def distinct_rows(count: int, first_day: str, days: int) -> list:
+    """count non-overlapping bookings spread over days, each with its own staff"""
+    first = date.fromisoformat(first_day)
+    return [
+        surgery(
+            surgery_date=(first + timedelta(days=index % days)).isoformat(),
+            surgery_time=f"{index // days % 24:02d}:00",
+            ot_id=str(index // days // 24 + 1),
+            doctor_id=f"doctor-{index}",
+            anesthesiologist=f"anesthesiologist-{index}",
+            patient_id=f"patient-{index}",
+            duration_minutes=30,
+        )
+        for index in range(count)
+    ]
+
+
+def test_bulk_at_the_limit_commits_on_firestore(firestore_client):
+    # Rows plus one guard document per day far exceed one Firestore commit
+    rows = distinct_rows(server.MAX_BULK_SURGERIES, "2031-03-01", 20)
+    assert len(rows) + 20 > FIRESTORE_BATCH_LIMIT
+
+    response = firestore_client.post("/api/surgeries/bulk", json=rows)
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["accepted"] == server.MAX_BULK_SURGERIES
+    assert [result["index"] for result in body["results"]] == list(range(len(rows)))
+    stored = server.repo.find("surgeries", [("surgery_date", ">=", "2031-03-01")])
+    assert len(stored) == server.MAX_BULK_SURGERIES
+
+
+def test_bulk_over_the_limit_is_refused(client):
+    rows = distinct_rows(server.MAX_BULK_SURGERIES + 1, "2031-04-01", 20)
+    assert client.post("/api/surgeries/bulk", json=rows).status_code == 413
+
+
+def test_bulk_chunks_still_reject_clashes_within_the_batch(firestore_client, monkeypatch):
+    # Small chunks, so the clashing rows land in different commits
+    monkeypatch.setattr(server, "FIRESTORE_BATCH_LIMIT", 4)
+    rows = [surgery(surgery_date="2031-05-06", surgery_time=f"{8 + hour}:00", patient_id=f"patient-{hour}") for hour in range(5)]
+    rows.append(surgery(surgery_date="2031-05-06", surgery_time="08:30", doctor_id="doctor-2", anesthesiologist="anesthesiologist-2"))
+
+    body = firestore_client.post("/api/surgeries/bulk", json=rows).json()
+
+    assert body["accepted"] == 5
+    rejected = body["results"][5]
+    assert rejected["status"] == "rejected"
+    assert rejected["reason"] == "Surgery time conflicts with other rows in this batch"
+    assert rejected["conflicts"][0]["row"] == 0
@@ -0,0 +1,25 @@
+from http_cache import VersionTable
+
+
+def test_workers_agree_on_etags_once_they_share_a_period(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("http_cache.time.time", lambda: now[0])
+    first, second = VersionTable(ttl_seconds=30), VersionTable(ttl_seconds=30)
+    keys = ["surgeries", "surgeries:2024-05-01"]
+    # Fresh processes cannot know what was written before they started
+    assert first.etag(keys, "/api/surgeries") != second.etag(keys, "/api/surgeries")
+
+    now[0] = 1020.0
+    a = first.bump(keys)
+    b = second.bump(["doctors"])
+    # Each worker applies the other's announced write
+    second.bump(keys, a)
+    first.bump(["doctors"], b)
+    assert first.etag(keys, "/api/surgeries") == second.etag(keys, "/api/surgeries")
+    tag = first.etag(keys, "/api/surgeries")
+
+    first.bump(["surgeries:2024-05-01"])
+    assert first.etag(keys, "/api/surgeries") != tag
+    # A worker that reconnected hands out tags of its own until the boundary
+    second.reset()
+    assert second.etag(keys, "/api/surgeries") != tag
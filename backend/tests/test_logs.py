@@ -0,0 +1,18 @@
+import server
+
+
+def test_firestore_log_listing_includes_logs_without_a_stored_id(firestore_client):
+    # Only this user's entries: other tests' audit entries may land here too
+    logs = server.repo.client.collection("logs")
+    # Written before log entries stored their id
+    logs.document("legacy-1").set({"action": "surgery_created", "user_id": "legacy-user", "timestamp": "2024-01-01T10:00:00"})
+    logs.document("legacy-2").set({"action": "surgery_created", "user_id": "legacy-user", "timestamp": "2024-01-01T10:00:00"})
+    logs.document("current").set({"id": "current", "action": "surgery_updated", "user_id": "legacy-user", "timestamp": "2024-01-02T10:00:00"})
+
+    listed = firestore_client.get("/api/logs", params={"user_id": "legacy-user"}).json()
+    assert [entry["id"] for entry in listed] == ["current", "legacy-2", "legacy-1"]
+
+    first = firestore_client.get("/api/logs", params={"user_id": "legacy-user", "limit": 2, "paginate": "true"}).json()
+    second = firestore_client.get("/api/logs", params={"user_id": "legacy-user", "limit": 2, "cursor": first["next_cursor"]}).json()
+    assert [entry["id"] for entry in first["items"] + second["items"]] == ["current", "legacy-2", "legacy-1"]
+    assert second["next_cursor"] is None